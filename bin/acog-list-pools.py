@@ -1,16 +1,30 @@
 #!/usr/bin/env python3
 
-# acog-list-pools.py -- list-user-pools from AWS Cognito
+# acog-list-pools.py -- list-user-pools from AWS Cognito (every page, NextToken followed)
+#   ./acog-list-pools.py                        # us-east-1
+#   ./acog-list-pools.py us-east-1 us-west-2    # several regions, concurrently, tagged with the region
+
+import concurrent.futures
+import sys
 
 import boto3
 
-sesh = boto3.Session(region_name="us-east-1")  # profile_name='default')  # ~/.aws/credentials
-cog_client = sesh.client('cognito-idp')
 
-response = cog_client.list_user_pools(MaxResults=60)
+def listPools(region):  # every pool in the region
+    sesh = boto3.Session(region_name=region)  # profile_name='default')  # ~/.aws/credentials
+    cog_client = sesh.client('cognito-idp')
+    pools = []
+    for page in cog_client.get_paginator('list_user_pools').paginate(MaxResults=60):
+        pools += page['UserPools']
+    return pools
+
 
-print('list_user_pools: (ID, Name)')
+regions = sys.argv[1:] if len(sys.argv) > 1 else ["us-east-1"]
+with concurrent.futures.ThreadPoolExecutor(max_workers=len(regions)) as pool:
+    results = dict(zip(regions, pool.map(listPools, regions)))
 
-for x in response['UserPools']:
-    print(f'    "{x["Id"]}", "{x["Name"]}"')
+print('list_user_pools: (ID, Name%s)' % (", region" if len(regions) > 1 else ''))
 
+for region in regions:
+    for x in results[region]:
+        print(f'    "{x["Id"]}", "{x["Name"]}"' + (f', "{region}"' if len(regions) > 1 else ''))
@@ -5,70 +5,121 @@
 # run from Jenkins or local command-line
 # requirements: AWS credentials in environment vars or ~/.aws
 #    some operations require: VPN network access for metadata API host
+# this is the command-line wrapper; the work is done by acoglib.AcogClient (importable, lazily initialised)
 
-import boto3, botocore
 import argparse
-import csv
-import datetime
-import json
+import concurrent.futures
+import itertools
 import logging, os
-import requests
+import sqlite3
 import sys
 import time
 
+if __name__ == "__main__" and os.environ.get("ACOG_SOCKET"):  # warm daemon (acog.py serve) up? forward to it,
+    import acogc                                               # skipping the boto3/requests imports below
+    forwarded = acogc.forward(sys.argv[1:])
+    if forwarded is not None:
+        sys.exit(forwarded)
+
+from acoglib import AcogClient, AcogError
+from acoglib.aio import doAddUserRowsAsync
+from acoglib.attribs import RESULT_FIELDS, addAttribRows, readAttribRows
+from acoglib.batch import doAddUserRows, latencySummary, mergeStats, readUserRows
+from acoglib.bookingcache import BookingCache
+from acoglib.clone import cloneRecords, cloneSource, cloneUsers
+from acoglib.daemon import WarmClients, captureOutput, serve, socketPath
+from acoglib.defaults import (AWS_DEFAULT_REGION, FATAL_ERROR_CODE, MATCH_FROM_POOL, NON_FATAL_WARNING,
+                              defAction, defBook, defDate, defEmail, defNames, def_pool_name,
+                              defaultPaxArray, futureDate)
+from acoglib.fanout import fanOutUsers, poolClient, poolClients, regionClients
+from acoglib.importjob import importUsers
+from acoglib.journal import RowJournal, completedKeys, skipCompleted
+from acoglib.metadata import prefetchBookings
+from acoglib.metrics import Metrics, ProgressReporter
+from acoglib.mint import mintTokens, poolUsernames, readUsernames
+from acoglib.purge import fileCandidates, filterCandidates, parseDate, purgeUsers, readKeys
+from acoglib.records import DEFAULT_COLUMNS, FORMATS, USER_FIELDS, RecordWriter, flattenUser
+from acoglib.shard import checkShardable, maxShards, mergeReports, readArgs, runShards, writeReport
+from acoglib.snapshot import PoolSnapshot, snapshotPath
+from acoglib.sync import loadPoolState, planSync, printPlan, runSync
+from acoglib.throttle import MIN_RATE
+from acoglib.triggers import (TerminatedError, TriggerSuspension, markerOwnerAlive, readMarker,
+                             restoreTriggers)
+
+logger = logging.getLogger(os.path.basename(__file__)+" ")
+
+def positiveScale(value):  # --quotaScale: a fraction > 0 (each bucket still gets >= 1 request/sec)
+    scale = float(value)
+    if not scale > 0:
+        raise argparse.ArgumentTypeError("must be > 0, e.g. 0.5 for half the default quotas")
+    return scale
 
-defAction = "list-pools"
-defBook = "5399020"
-defDate = "try-API"  # flag to look up actual depart/embark date(s) in Metadata booking
-defNames = "approve,always"
-def_pool_name = "(1stAvailable)"
-emailVal = defEmail = "%s@test.com"  # defaults to being a template/suffix after bookingNo
-futureDate = (datetime.datetime.now() + datetime.timedelta(days=90)).strftime("%Y-%m-%d")
-nonConsumerUserTypes = ("CSA","AIR","TA")  # TA=TravelAgent
-paxArray = [{"BookingStatus":0,"Currency":"YEN","TourName":0,"TourStatus":0,"EmbarkDate":"2020-10-22",
-             "GuestDepartureDate":"2020-10-22","Office":"JP"},
-            {"pax_1":None},{"pax_2":None}]
-pax1note = pax2note = "(no pax yet)"
-user_count = 0
-
-AWS_DEFAULT_REGION = "us-east-1"  # override env var or profile_name='default')  # ~/.aws/credentials
-FATAL_ERROR_CODE = "FATAL_ERROR_CODE"
-NON_FATAL_WARNING = "NON_FATAL_WARNING"
-USER_GUID_ERROR = "USER_GUID_ERROR"
-MATCH_FROM_POOL = "matchFromInternalList"
-clientID = MATCH_FROM_POOL
-clientIDs = {  # NOTE: from ~/git/COG-client/stack/envs/*
-  "us-east-1_W0vAsS6HQ":{"id":"2131qREDACTED174crs","pool":"COG-dev"},
-  "us-east-1_k9PQUnVgU":{"id":"6p4neREDACTEDqej1nf","pool":"COG-qa"},
-  "us-east-1_BQlmg4kuQ":{"id":"5u11dREDACTED6aq4iu","pool":"COG-stage"}
-   }  # id=ClientID passed to Lambda triggers for some Cognito operations --not an attribute of the entries.
-local_client_ids_by_pool_name = {clientIDs[Id]["pool"]:Id for Id in clientIDs}
-localPools = [{"Id":Id,"Name":clientIDs[Id]["pool"]} for Id in clientIDs]  # shape/style of aws cognito-idp list-user-pools
-
-defPass = "noSmok!ng0316"
-# depending on network routing, may not work from the cloud like it does from the office/VPN
-Metadata = {"dev":{ "ip":"10.191.9.71","host":"apiqaa01.dev.nosmokingrc.com"},
-             "qa":{ "ip":"10.191.9.71","host":"apiqaa01.dev.nosmokingrc.com"},
-            "stg":{ "ip":"10.191.9.73","host":"apistg01.nosmokingrc.com"} }
 
 parser = argparse.ArgumentParser(
              description=" AWS Cognito helper script, creates COG logins from Metadata booking")
 parser.add_argument("action", default=defAction, nargs='?',
-                    help="list-pools (default), list-users (by email), add-user (by bookingId), get-user (by GUID)")
+                    help="list-pools (default), list-users (by email), add-user (by bookingId), get-user (by GUID), "
+                         "snapshot (index the pool locally, see --use-snapshot), "
+                         "sync (--file: create/update only what differs from the pool), "
+                         "restore-triggers (after a --suspend-triggers run died), "
+                         "mint-tokens (IdTokens for --file usernames or --filter matches), "
+                         "purge (delete every --file email/bookingId, or --filter match; see --created-before), "
+                         "import (--file as Cognito user import jobs: no per-user API calls; users are RESET_REQUIRED), "
+                         "clone (acog.py clone COG-qa COG-stage: copy users the target lacks; --filter, --bulk-import), "
+                         "serve (warm daemon on --socket: export ACOG_SOCKET and acog.py/acogc.py runs forward to it)")
 parser.add_argument("arg2", default=defBook, nargs='?',
                     help="booking = {defBook} (can also specify full email address)".format(defBook=defBook))
 parser.add_argument("arg3", default=def_pool_name, nargs='?',
                     help="poolID = {def_pool_name} (can specify user-friendly name, or ID)".format(def_pool_name=def_pool_name))
-parser.add_argument("--clientID", default=clientID,
-                    help="clientID = {clientID} (from AWS GUI console)".format(clientID=clientID))
-parser.add_argument("--email", default=emailVal, help="defaults to <bookingId>@test.com")
+parser.add_argument("--clientID", default=MATCH_FROM_POOL,
+                    help="clientID = {clientID} (from AWS GUI console)".format(clientID=MATCH_FROM_POOL))
+parser.add_argument("--email", default=defEmail, help="defaults to <bookingId>@test.com")
 parser.add_argument("--names", default=defNames, help="lastname,firstname")
 parser.add_argument("--date", default=defDate, help="embark date format example: 2020-11-13")
-parser.add_argument("--file", help="CSV/TSV data file: booking,lastname,firstname")
+parser.add_argument("--file", help="CSV/TSV data file: booking,lastname,firstname ('-' = stdin, .gz ok)")
+parser.add_argument("--quiet", "-q", action="store_true", default=False,
+                    help="with --file: don't echo each parsed row to stderr")
+parser.add_argument("--workers", type=int, default=1,
+                    help="concurrent add-user rows for --file (default 1 = serial; mint-tokens: 8)")
+parser.add_argument("--async", dest="asyncUsers", type=int, default=0, metavar="N",
+                    help="add-user --file: up to N users in flight on one asyncio thread instead of --workers threads "
+                         "(needs aiobotocore and aiohttp)")
+parser.add_argument("--shards", type=int, default=1,
+                    help="add-user --file: split the file across N acog.py processes, each at 1/N of --quotaScale; "
+                         "rows go to <file>.shard<i>.log, journals and metrics are merged")
+parser.add_argument("--shard-by", choices=("bytes", "hash"), default=None,
+                    help="with --shards: byte ranges of the file (default), or bookingId hash (default for .gz; "
+                         "keeps each booking's rows in one process)")
+parser.add_argument("--shard-args", default=None, help=argparse.SUPPRESS)  # a --shards worker: see acoglib.shard
+parser.add_argument("--shard", default=None, help=argparse.SUPPRESS)
+parser.add_argument("--shard-report", default=None, help=argparse.SUPPRESS)
+parser.add_argument("--shard-pool", default=None, help=argparse.SUPPRESS)
+parser.add_argument("--userTimeout", type=float, default=120.0,
+                    help="with --async: seconds one user's whole flow may take before it counts as an error")
+parser.add_argument("--dry-run", action="store_true", default=False,
+                    help="sync: print the plan (counts; each row with -v) and stop; purge: count (and list) only")
+parser.add_argument("--journal", default=None,
+                    help="with --file: append each row's outcome (GUID, status, timing) to this NDJSON file")
+parser.add_argument("--resume", action="store_true", default=False,
+                    help="with --file: skip rows the --journal (default <file>.journal) records as done")
+parser.add_argument("--suspend-triggers", action="store_true", default=False,
+                    help="with --file: pool Lambda triggers off for the run, restored on exit/error/Ctrl-C/SIGTERM")
+parser.add_argument("--triggerProbe", type=int, default=3,
+                    help="with --suspend-triggers: first N rows run with triggers on, for the latency comparison")
+parser.add_argument("--fast", action="store_true", default=False,
+                    help="add-user/sync: 2 calls per user (create with all attributes + set permanent password) "
+                         "instead of 5; --file runs verify once at the end")
+parser.add_argument("--noVerify", action="store_true", default=False,
+                    help="with --fast: skip the verification (per user, or batched at the end of --file)")
+parser.add_argument("--noTokenCache", action="store_true", default=False,
+                    help="auth: always do a full SRP login (default: cached IdToken, refreshed near expiry)")
 parser.add_argument("--profile", default="default", help="default AWS env or ~/.aws/credentials")
 parser.add_argument("--region", default=AWS_DEFAULT_REGION, help="default: " + AWS_DEFAULT_REGION)
 parser.add_argument("--attrib_name", default="custom:booking", help="for attrib-add action")
 parser.add_argument("--attrib_val", default="[]", help="for magic add-attribs action")  # .attribs
+parser.add_argument("--results", default=None,
+                    help="add-attribs --file: per-row results (--format, default ndjson) to this file "
+                         "(default <file>.results)")
 parser.add_argument("--userType", default="Consumer", help="alt: CSA,Air,TA; default: Consumer")
 parser.add_argument("--verbose",'-v', action="count", default=0, help="logging.INFO level (-vv for DEBUG)")
 parser.add_argument("--allowUpperCaseEmail", action="store_true", default=False,
@@ -76,511 +127,264 @@ parser.add_argument("--allowUpperCaseEmail", action="store_true", default=False,
 parser.add_argument("--forceOldPass", default="auto",
                     help="default=auto (y for Consumer/test, n for agent/prompt)")
 parser.add_argument("--skipMetadata", action="store_true",default=False)  # allow bypass of Metadata API lookups
-args = parser.parse_args()
-
-logging.basicConfig(level=[logging.WARNING,logging.INFO,logging.DEBUG][args.verbose])
-logger = logging.getLogger(os.path.basename(__file__)+" ")
-
-emailVal = args.email  # initialized global, for later override/parse/templatize/validation
-
-if args.names != defNames:
-    if ',' in args.names:
-        firstName = fName = args.names.split(',')[-1]  # comma
-        lastName = lName = args.names.split(',')[0]    # lastname,firstname
-    else:     # initialize names --parse arg as delimited pair
-        firstName = fName = args.names.split('.')[0]  # dot
-        lastName = lName = args.names.split('.')[-1]  # firstname.lastname
-elif '.' in args.email.split('@')[0]:
-    firstName = fName = args.email.split('@')[0].split('.')[0]  # names from email
-    lastName = lName = args.email.split('@')[0].split('.')[1]  # firstname.lastname@dom.com
-else:
-    firstName = fName = args.names.split(',')[-1]  # comma
-    lastName = lName = args.names.split(',')[0]    # lastname,firstname
-
-# first API call: to AWS
-try:  # initial AWS/boto3 call to see if AWS can auth/connect using current profile
-    if args.profile == "default":
-        sesh = boto3.Session(region_name=args.region)  # auto-sense AWS credentials from env/files
-        logger.info("default profile --region %s" % args.region)  # DEBUG/VERBOSE
+parser.add_argument("--prefetchMetadata", action="store_true", default=False,
+                    help="with --file: fetch all (unique) bookings from Metadata concurrently, ahead of Cognito writes")
+parser.add_argument("--metadataWorkers", type=int, default=8, help="concurrent Metadata fetches (default 8)")
+parser.add_argument("--metadataUrl", default=None,
+                    help="Metadata API base URL override, e.g. http://127.0.0.1:8080 (see acog_standin.py)")
+parser.add_argument("--no-metadata-cache", action="store_true", default=False,
+                    help="always ask the Metadata API (default: bookings cached in $ACOG_CACHE_DIR/bookings)")
+parser.add_argument("--refresh", action="store_true", default=False,
+                    help="re-fetch every Metadata booking, rewriting the booking cache")
+parser.add_argument("--metadata-cache-ttl", type=int, default=86400,
+                    help="Metadata booking cache TTL in seconds (default 86400; invalid bookings: 1h at most)")
+parser.add_argument("--format", choices=FORMATS, default=None,
+                    help="list-users: stream one flattened user per line (all pages) instead of pretty-print")
+parser.add_argument("--fields", default=None,
+                    help="list-users --format: comma-separated columns/attributes (fetches only those attributes)")
+parser.add_argument("--filter", default=None,
+                    help="list-users: raw Cognito filter, e.g. 'email ^= \"qa.\"'; '' lists the whole pool")
+parser.add_argument("--pools", default=None,
+                    help="list-users: query every pool whose name contains one of these (comma-separated; '' = all) "
+                         "concurrently, results tagged with pool and region")
+parser.add_argument("--regions", default=None,
+                    help="list-pools/list-users: comma-separated regions to fan out over (default: --region only)")
+parser.add_argument("--created-before", default=None,
+                    help="purge --filter: only users created before this date/time (YYYY-MM-DD = UTC midnight)")
+parser.add_argument("--import-role", default=os.environ.get("ACOG_IMPORT_ROLE"),
+                    help="import: IAM role ARN Cognito writes the job's CloudWatch Logs with (default $ACOG_IMPORT_ROLE)")
+parser.add_argument("--import-batch", type=int, default=100000,
+                    help="import: users per import job (default 100000, the Cognito per-file maximum)")
+parser.add_argument("--bulk-import", action="store_true", default=False,
+                    help="clone: write through user import jobs (see import, --import-role) instead of concurrent calls")
+parser.add_argument("--refresh-cache", action="store_true", default=False,
+                    help="ignore (and rewrite) the cached pool list/configuration")
+parser.add_argument("--cache-ttl", type=int, default=86400, help="pool cache TTL in seconds (default 86400)")
+parser.add_argument("--use-snapshot", action="store_true", default=False,
+                    help="answer existence checks, GUID lookups and list-users from the local pool snapshot")
+parser.add_argument("--snapshot", default=None,
+                    help="snapshot file (default $ACOG_CACHE_DIR/snapshot-<UserPoolId>.sqlite); "
+                         "'snapshot --refresh-cache' rebuilds it fully")
+parser.add_argument("--quotaScale", type=positiveScale, default=0.9,
+                    help="fraction of Cognito default per-operation quotas to run at (default 0.9; "
+                         "at least 1 request/sec per quota category)")
+parser.add_argument("--maxRetries", type=int, default=6,
+                    help="retries per Cognito call on throttling/transient errors (default 6)")
+parser.add_argument("--metrics-out", default=None,
+                    help="at exit, write per-operation calls/errors/retries/latency (p50/p95/p99) as JSON to this file")
+parser.add_argument("--metrics-prom", default=None,
+                    help="at exit, write the same as a Prometheus textfile (node_exporter textfile collector)")
+parser.add_argument("--progress", type=int, default=30,
+                    help="--file/mint-tokens runs: a progress line (rows, calls, errors, p95) on stderr every N seconds; 0 = off")
+parser.add_argument("--socket", default=None,
+                    help="serve: Unix socket to listen on (default $ACOG_SOCKET, else $ACOG_CACHE_DIR/acog.sock)")
+parser.add_argument("--idle", type=int, default=1800,
+                    help="serve: exit after this many seconds without a run (default 1800; 0 = never)")
+
+PATH_ARGS = ("file", "journal", "results", "snapshot", "metrics_out", "metrics_prom")  # relative to the caller's cwd
+WARM = None  # WarmClients while serving: boto3/Metadata sessions kept from one forwarded run to the next
+
+
+def parseNames(args):  # returns firstName, lastName from --names (or from --email firstname.lastname@)
+    if args.names != defNames:
+        if ',' in args.names:
+            firstName = args.names.split(',')[-1]  # comma
+            lastName = args.names.split(',')[0]    # lastname,firstname
+        else:     # initialize names --parse arg as delimited pair
+            firstName = args.names.split('.')[0]  # dot
+            lastName = args.names.split('.')[-1]  # firstname.lastname
+    elif '.' in args.email.split('@')[0]:
+        firstName = args.email.split('@')[0].split('.')[0]  # names from email
+        lastName = args.email.split('@')[0].split('.')[1]  # firstname.lastname@dom.com
     else:
-        sesh = boto3.Session(region_name=args.region,profile_name=args.profile)
-        logger.info(" --profile %s --region %s" % (args.profile,args.region))  # DEBUG/VERBOSE
-except Exception as e:
-    sesh = boto3.Session(region_name=args.region)  # env AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
-    logger.error(" %s by %s" % (e,__file__))  # e.g. config profile (blah) could not be found
-    sys.exit(1)  # fatal error
-logger.debug("dir(sesh): %s" % dir(sesh))
-
-profile_name = sesh.profile_name if sesh.profile_name else "(%s)" % args.profile
-region_name = sesh.region_name if sesh.region_name else "(%s)" % args.region
-logger.debug(" using AWS/boto3 session --profile %s --region %s" % (
-                    profile_name, region_name))
-
-if sesh.get_credentials().method == "sso":  # and sesh.get_credentials().refresh_needed():
-    # logger.error("%s" % sesh.get_credentials())
-    try:
-        sso_cred = sesh.get_credentials().get_frozen_credentials()
-    except Exception as e:
-        logger.error("%s\n--Try 'aws sso login' to cure." % e)
-        sys.exit(1)
-
-if 'cognito-idp' in sesh.get_available_services():  # ~~~~~~~~ GLOBAL ~~~~~~~~
-    logger.debug("TRACE: pre-COG-client")  # DEBUG/VERBOSE --TRACE only shows with 2 or more -vv
-    cog_client = sesh.client('cognito-idp')  # cog_client = boto3.client('cognito-idp')
-else:
-    logger.error("AWS service 'cognito-idp' not available for profile %s" % sesh.profile_name)
-    sys.exit(1)
-
-try:
-  # cache list-pools/list-user-pools
-  logger.debug("TRACE: pre-COG-list_user_pools")  # DEBUG/VERBOSE
-  userPools = cog_client.list_user_pools(MaxResults=60)  # we only had ~13 as of August 2019
-  logger.debug("TRACE: post-COG")  # DEBUG
-except (botocore.exceptions.UnauthorizedSSOTokenError,
-        botocore.exceptions.SSOError,
-        botocore.exceptions.SSOTokenLoadError
-       ) as e:
-    logger.info("Try 'aws sso login' for %s exception:\n  %s" % (type(e),(e)))  # DEBUG/VERBOSE
-    sys.exit(1)  # fatal error
-except botocore.exceptions.ClientError as e:
-    print("ERROR: AWS botocore client exception:\n  %s" % (e))
-    logger.info("ERROR: AWS botocore exception.response:\n%s" % (e.response))
-    if e.response["Error"]["Code"] in ("UserLambdaValidationException",
-        "UnauthorizedSSOTokenError", "AccessDeniedException"):
-        print("WARN: AWS botocore client exception %s" % (e))
-        sys.exit(1)  # fatal error
-except Exception as e:
-    logger.error(" AWS  cognito-idp list-user-pools --profile %s"  % profile_name)
-    logger.error("  --region %s\n" % (region_name, e))
-    sys.exit(1)  # fatal error
-
-# the un-named args handling is not-great...
-if args.arg2.find('-') >= 0:  # dash implies action or pool
-    bookingId = args.arg3.split('@')[0] if "COG-" not in args.arg3 else None
-    emailVal = args.arg3 if '@' in args.arg3 and '%s' in args.email else args.email  # override
-    longAction = args.action if "COG-" not in args.action else defAction  # default to read-only
-    UserPoolName = args.arg2 if "COG-" in args.arg2 else def_pool_name
-    logger.debug("UserPoolName: %s" % (UserPoolName))
-else:  # ToDo: more parse validation of input parameters...
-    bookingId = args.arg2.split('@')[0] if "COG-" not in args.arg2 else None
-    emailVal = args.arg2 if '@' in args.arg2 and '%s' in args.email else args.email  # override
-    UserPoolName = args.arg3 if "COG-" in args.arg3 else def_pool_name
-
-UserPoolName = "COG-" if "list-p" in args.action else UserPoolName
-logger.debug("UserPoolName: %s" % (UserPoolName))
-
-argX = bookingId if bookingId else emailVal  # stash for later list-user filter in doListUsers
-bookingId = bookingId if str(bookingId).isnumeric() else None  # no bookingId implies AIR/CSA later
-if bookingId is None and emailVal[0:7].isnumeric():
-    bookingId = emailVal[0:7]
-
-if '%s' in emailVal and args.file is not None:  # templatize conditionally
-    if bookingId:
-        emailVal = emailVal % (bookingId)
-    elif ',' in args.names and args.names not in ("lastName,firstName",defNames):
-        emailVal = emailVal % (firstName + '.' + lastName)
-    elif args.names in ("lastName,firstName",defNames):
-        print("    emailVal %s (to be determined later from CSV)" % emailVal)
-    else:
-        emailVal = emailVal % (args.names)
-
-# determine pool ID from pool name
-local_client_ids_by_pool_name = {clientIDs[Id]["pool"]:Id for Id in clientIDs}
-avail_client_ids_by_pool_name = {userPool["Name"]:userPool["Id"] for userPool in userPools['UserPools']}
-avail_client_pool_names = sorted([*avail_client_ids_by_pool_name.keys()])
-
-oldUserPoolName = UserPoolName
-UserPoolName = avail_client_pool_names[0] if UserPoolName == def_pool_name else UserPoolName
-if UserPoolName in avail_client_ids_by_pool_name:  # exact match has priority
-    UserPoolId = avail_client_ids_by_pool_name[UserPoolName]
-else:
-    for avail_pool_name in avail_client_ids_by_pool_name:
-        if UserPoolName in avail_pool_name:  # partial match as fallback
-            UserPoolId = avail_client_ids_by_pool_name[avail_pool_name]
-            UserPoolName = avail_pool_name
-            break  # exit loop on finding first match
-        else:
-            UserPoolId = None
-
-logger.info(" UserPoolId: %s from %s" % (UserPoolId, avail_client_ids_by_pool_name))
-print("UserPoolName:     '%s' from %s ~ %s" % (
-    UserPoolName,oldUserPoolName,avail_client_pool_names),file=sys.stderr)
-
-if UserPoolId is None or "COG-" in UserPoolId:  # poolID not yet mapped from poolName
-    logger.warning("UserPoolId %s not found for UserPoolName %s !?!" % (UserPoolId,UserPoolName))
-    print("  (...at least not with --profile '%s')" % (profile_name),file=sys.stderr)
-    sys.exit(1)  # fatal exit
-
-logger.debug("DEBUG: clientID: %s" % (clientID))
-if clientID == MATCH_FROM_POOL and "list-p" not in args.action:
-    clientID = clientIDs[UserPoolId]["id"]
-else:
-    clientID = args.clientID
-logger.debug("DEBUG: clientID: %s" % (clientID))
-
-# map pool names to Metadata host per environment
-if "stage" in UserPoolName or "abe" in UserPoolName or "st" in UserPoolName:
-    MetadatahostIp = Metadata["stg"]["ip"]
-    MetadatahostName = Metadata["stg"]["host"]
-    if "abe" in UserPoolName:
-        clientID = clientIDs[UserPoolId].get("abe_client_id",clientID) if clientID == MATCH_FROM_POOL else clientID
-    else:  # stage
-        clientID = clientIDs[UserPoolId]["id"]
-else:
-    MetadatahostIp = Metadata["dev"]["ip"]  # ["host"]  # QA-4779  # Dev & QA share Metadatahost
-    MetadatahostName = Metadata["dev"]["host"]
-logger.info(" clientID: %s" % (clientID))
-
-if args.verbose:
-    print("         emailVal:%s (per args.email:%s)" % (emailVal,args.email),file=sys.stderr)
-
-try:
-    userPoolConfiguration = cog_client.describe_user_pool(UserPoolId=UserPoolId)
-except botocore.exceptions.ClientError as e:  # ResourceNotFoundException as e:
-    print("%s (...at least not with --profile '%s')" % (e.response["Error"]["Message"],
-          profile_name),file=sys.stderr)
-    sys.exit()  # fatal error
-
-# below removes redundant configuration that do not work when passed together
-try:
-    if (userPoolConfiguration['UserPool']['Policies']['PasswordPolicy']['TemporaryPasswordValidityDays']):
-        userPoolConfiguration['UserPool']['AdminCreateUserConfig'].pop('UnusedAccountValidityDays')
-except KeyError:
-    pass
-
-userPoolConfigAttribs_base = [ 'AdminCreateUserConfig', 'AutoVerifiedAttributes', 'DeviceConfiguration',
-      'EmailConfiguration', 'EmailVerificationMessage', 'EmailVerificationSubject',
-      'MfaConfiguration', 'Policies',
-      'SmsAuthenticationMessage', 'SmsConfiguration', 'SmsVerificationMessage',
-      'UserPoolAddOns', 'UserPoolTags', 'VerificationMessageTemplate'
-      ]
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~ function definitions ~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-def doDisableTriggers():  # warning: stateful/race-condition
-  attribs = userPoolConfigAttribs_base
-  conf  = {x:userPoolConfiguration['UserPool'][x] for x in attribs if x in userPoolConfiguration['UserPool']}
-  try:
-      cog_client.update_user_pool(UserPoolId=UserPoolId, LambdaConfig={}, **conf)
-  except Exception as e:
-      print("WARN: AWS/boto3 exception in triggers disable: %s" % (e))
-
-
-def doEnableTriggers():  # ToDo: find a way to _ALWAYS_ restore --add to any/all try/except exception handling...
-  attribs = userPoolConfigAttribs_base + ['LambdaConfig']  # restore Lambda Cognito trigger
-  conf  = {x:userPoolConfiguration['UserPool'][x] for x in attribs if x in userPoolConfiguration['UserPool']}
-  try:
-      cog_client.update_user_pool(UserPoolId=UserPoolId, **conf)
-  except Exception as e:
-      print("WARN: AWS/boto3 exception in triggers [re]enable : %s" % (e))
-
-
-def printHeadings(longAction, bookingId, UserPool,userGUID=None,embarkDate=futureDate,embarkNote="default"):
+        firstName = args.names.split(',')[-1]  # comma
+        lastName = args.names.split(',')[0]    # lastname,firstname
+    return firstName, lastName
+
+
+def newClient(args, UserPoolName):  # AcogClient configured from command-line args
+    acog = AcogClient(poolName=UserPoolName, profile=args.profile, region=args.region,
+                      clientID=args.clientID, userType=args.userType, forceOldPass=args.forceOldPass,
+                      allowUpperCaseEmail=args.allowUpperCaseEmail, verbose=args.verbose,
+                      metadataUrl=args.metadataUrl, metadataWorkers=args.metadataWorkers,
+                      quotaScale=args.quotaScale, maxRetries=args.maxRetries,
+                      cacheTtl=args.cache_ttl, refreshCache=args.refresh_cache,
+                      tokenCache=not args.noTokenCache, metrics=Metrics(),
+                      metadataCache=None if args.no_metadata_cache else
+                      BookingCache(ttl=args.metadata_cache_ttl, negativeTtl=min(3600, args.metadata_cache_ttl),
+                                   refresh=args.refresh))
+    return WARM.adopt(acog) if WARM else acog
+
+
+def printHeadings(acog, longAction, bookingId, emailVal, userGUID=None, embarkDate=futureDate, embarkNote="default"):
     print("action:            " + longAction)
     print("bookingId/email:   %s" % bookingId, end='')
     print(" / " + emailVal)
-    if "MER" in args.userType.upper(): # match 'CONSUMER'
+    if "MER" in acog.userType.upper(): # match 'CONSUMER'
         print("embarkDate:        " + str(embarkDate) + " (" + str(embarkNote) + ")")  # indicate if from-API or args
-    print("UserPool:          " + UserPool + " (" + UserPoolName + ")")
+    print("UserPool:          " + acog.UserPoolId + " (" + acog.UserPoolName + ")")
     if userGUID:
       print('userGUID:         "{userGUID}"'.format(userGUID=userGUID))
     return
 
 
-def doAdminCreateUser(un,upi=UserPoolId,firstName=firstName,lastName=lastName,dates={},paxnum=1,emailVal=None,tourName=None):
-    # func called by doAddUser
-    ''' aws cognito-idp admin-create-user --color=on --user-pool-id=us-east-1_o1BRMLLH8 --username 5399020@test.com \
-          --temporary-password ${defPass} '--user-attributes={"(JSON..)"}' \
-          | jq .User.Username -r
-
-    return GUID
-    '''
-
-    # should not overwrite global-as-template, in order to handle batch CSV file looping
-    # global emailVal  # template should have been done during args processing
-    if args.allowUpperCaseEmail==False:
-        un = un.lower()
-    emailVal = un if '@' in un else (emailVal if emailVal else defEmail)
-    if emailVal in (defEmail,"firstName.lastName@test.com"):
-        emailVal = "%s@%s" %(un,emailVal.split('@')[-1])
-
-    departureDate = dates.get('departureDate',futureDate).split('.')[0]  # strip off fractional second, if any
-    embarkDate =    dates.get('embarkDate',futureDate).split('.')[0]  # strip off fractional second, if any
-
-    if args.userType.upper() in nonConsumerUserTypes:  # TODO: pass in specific value (to handle CSV) --not global args
-        if "%s" in emailVal or emailVal[0:7].isnumeric():
-            emailVal = "%s.%s@%s" %(firstName,lastName,emailVal.split('@')[-1])
-        print("    DEBUG: (un:%s, %s , emailVal:%s, (userType %s no bookingId)\n" % (un,'_' * 19,emailVal,args.userType) if args.verbose else '',end='')
-        attribs = [ {"Name":"custom:userType", "Value": args.userType  # case as-is
-          },{"Name":"email", "Value":emailVal
-          },{"Name":"email_verified", "Value":"true"
-          },{"Name":"family_name","Value":lastName
-          },{"Name":"given_name","Value":firstName
-          } ]
-    elif "MER" in args.userType.upper(): # match 'CONSUMER'
-        print("    DEBUG: (un:%s, %s , emailVal:%s, bookingId:%s)\n" % (un,'_' * 19,emailVal,bookingId) if args.verbose else '',end='')
-        attribs = [ { "Name":"custom:userType", "Value": args.userType
-          },{"Name":"custom:booking", "Value":'[%s]' % json.dumps(
-                   {"bookingId":bookingId,"tourName":tourName,"departureDate":departureDate,
-                    "embarkDate":embarkDate,"passengerNumber":paxnum})
-          },{"Name":"email", "Value":emailVal
-          },{"Name":"family_name","Value":lastName
-          },{"Name":"given_name","Value":firstName
-          } ]
-    else:
-        attribs = [ { "Value": ["ERROR UNSUPPORTED custom:userType", args.userType]} ]
-
-    if args.verbose:
-        print("DEBUG: Username=emailVal='%s' attribs: '%s'" % (emailVal,attribs))
-
-    try:
-      r = cog_client.admin_create_user(
-                 UserPoolId=upi,
-                 Username=emailVal,
-                 TemporaryPassword=defPass,
-                 UserAttributes=list(attribs),
-                 MessageAction="SUPPRESS"  # don't send SMS or email
-      )
-    except botocore.exceptions.ClientError as e:
-      if e.response["Error"]["Code"] in ("UserLambdaValidationException",
-                                         "AccessDeniedException"):
-          logger.error("Exception.response: %s" % (json.dumps(e.response["Error"],indent=4,sort_keys=True)))
-          return("%s:%s" % (FATAL_ERROR_CODE, e.response["Error"]["Code"]))
-      if e.response["Error"]["Code"] in ["InvalidParameterException",
-                                         "UnexpectedLambdaException"
-                                        ]:
-          print("Exception.response: %s" % (json.dumps(e.response,indent=4)))
-          print("BLOCKED ON AWS UI-CONTROLLED SETTING: Need to toggle Pre sign-up trigger! --URL:")
-          print("  https://console.aws.amazon.com/cognito/users/?region={region}#/pool/{upi}/triggers".format(
-                           region=args.region, upi=upi))
-      elif e.response["Error"]["Code"] == "UsernameExistsException":
-          print('    CAUGHT: %s "%s" (%s)' % (e.response["Error"]["Code"],emailVal,
-                                              e.response["Error"]["Message"]))
-          retry = cog_client.list_users(UserPoolId=UserPoolId,Filter='email ^= "%s"' % (emailVal))
-          print('     "UserLastModifiedDate":"%s"' % retry["Users"][0]["UserLastModifiedDate"] if retry["Users"] else "wtf")
-          # return("%s:%s" % (NON_FATAL_WARNING, e.response["Error"]["Code"]))
-          response = cog_client.list_users(UserPoolId=UserPoolId,Filter='email ^= "%s"' % (un))
-
-          print("    PRIOR USER:", end=' ')
-          return(retry["Users"][0]["Username"] if retry["Users"] else None)  # pre-existing GUID from list-users --assume only 1 hit
-      else:
-          print("Exception.response: %s" % (json.dumps(e.response,indent=4)))
-          return(USER_GUID_ERROR)
-    else:  # non-exception
-      r['User'].pop('UserCreateDate',None)  # remove element(s) with non-JSON-ifiable value(s)
-      r['User'].pop('UserLastModifiedDate',None)
-      # print("Success response (JSON) : %s" % (json.dumps(r,indent=4)))
-      # print("Success response (interesting bits) : %s" % (json.dumps(
-      #   {"User":{"Username":r["User"]["Username"],"UserStatus":r["User"]["UserStatus"]
-      #   }},indent=4)))
-      return(r['User']['Username'])  # new GUID from admin-create-user response
-
-
-def doAddAttribs(UserPoolId=UserPoolId,Username='userGUID aka "sub"',UserAttributes=[]):
-    logger.info("\n   UserPoolId:{UserPoolId}\n     Username:{Username}\nUserAttributes ...\n    {UserAttributes}".format(
-        UserPoolId=UserPoolId,
-        Username=Username,
-        UserAttributes=UserAttributes)
-    )
-    r = cog_client.admin_update_user_attributes(
-        UserPoolId=UserPoolId,
-        Username=Username,
-        UserAttributes=UserAttributes)
-    return(r)
-
-
-def doAddUser(un,upi=UserPoolId,fName=firstName,lName=lastName,dates={},paxArray=paxArray):
-    # this higher-level function calls steps required to create an entry in Cognito, bump confirmation
-    global user_count
-
-    dates['departureDate'] = str(dates.get('departureDate',futureDate)).split('T')[0]  # strip off hours:minutes, if any
-    dates['embarkDate'] =    str(dates.get('embarkDate',futureDate)).split('T')[0]  # strip off hours:minutes, if any
-    print("  step 1. admin-create-user %s in %s" %(un,upi), end='\n')
-    userGUID = doAdminCreateUser(un=un,upi=UserPoolId,firstName=fName,lastName=lName,
-        dates=dates,emailVal=emailVal,tourName=paxArray[0]["TourName"])
-    print("      --userGUID: %s" % userGUID)  # ToDo: display aws cli-equivalent command...
-    if userGUID in (None, USER_GUID_ERROR) or FATAL_ERROR_CODE in userGUID:
-        return userGUID
-
-    print("  step 2. admin-update-user-attributes (via doAddAttribs())")
-    # optional for new-users, but useful to break this out for updating existing
-    # aws cognito-idp admin-update-user-attributes \ 
-    #   --user-pool-id=${poolID} --username ${userGUID} --user-attributes="Name=email_verified,Value=true"
-    UserAttributes=[{"Name":"email_verified","Value":"true"}
-                   ,{"Name":"custom:userType", "Value":args.userType}]  # AIR QA-4780
-
-    try:
-      r = doAddAttribs(UserPoolId=UserPoolId,Username=userGUID,UserAttributes=UserAttributes)
-    except cog_client.exceptions.LimitExceedException as e:
-        logger.warn("API call limit exceeded; backing off and retrying...\n  %s" % e)
-        time.sleep(0.5)
-        r = doAddAttribs(UserPoolId=UserPoolId,Username=userGUID,UserAttributes=UserAttributes)
-    except Exception as e:
-        logger.warn("WARN: AWS/boto3 exception: %s" % (e))
-
-    print("  step 3. admin-initiate-auth")
-    # aws cognito-idp admin-initiate-auth --user-pool-id=${poolID} --client-id="${clientID}" \ 
-    # --auth-flow ADMIN_NO_SRP_AUTH --auth-parameters "USERNAME=${userGUID},PASSWORD=${defPass}"
-    if args.verbose:
-      print("""    $ aws cognito-idp admin-initiate-auth --user-pool-id={UserPoolId} --client-id='{clientID}' \\
-        --auth-flow ADMIN_NO_SRP_AUTH --auth-parameters 'USERNAME={userGUID},PASSWORD=...'""".format(
-         UserPoolId=UserPoolId,clientID=clientID,userGUID=userGUID))
-    try:
-      r = cog_client.admin_initiate_auth( UserPoolId=UserPoolId, ClientId=clientID,
-              AuthFlow="ADMIN_NO_SRP_AUTH", AuthParameters={"USERNAME":userGUID,"PASSWORD":defPass}
-      )
-    except botocore.exceptions.ClientError as e:
-      if e.response["Error"]["Code"] in ("NotAuthorizedException"):
-        print("    CAUGHT: %s (%s)" % (e.response["Error"]["Code"],e.response["Error"]["Message"]))
-        print("      --trying adminSetUserPassword...")
-        r = cog_client.admin_set_user_password(UserPoolId=UserPoolId,Username=userGUID,
-                                                Password=defPass,Permanent=True)
-
-      elif e.response["Error"]["Code"] in ("UserLambdaValidationException"):
-        print("    CAUGHT WARNING: AWS/boto3 exception: %s" % (":\n      ".join(str(e).split(": "))))
-        if (args.forceOldPass in ("auto","n","N",'0')) and args.userType.upper() in nonConsumerUserTypes:  # CSA,AIR,TAP
-            print("    ADD userType:%s (skipping respond-to-auth ChallengeName %s)" % (args.userType,r.get("ChallengeName")),end='')
-            print("  --forceOldPass=y can update this (idempotent)" if (args.verbose) else '')
-        else:
-            print("      --trying adminSetUserPassword...")  # workaround for COR-316
-            r = cog_client.admin_set_user_password(UserPoolId=UserPoolId,Username=userGUID,
-                                               Password=defPass,Permanent=True)
-        # user_count += 1; return("%s:%s" % (NON_FATAL_WARNING, e.response["Error"]["Code"]))
-      else:
-        print("    WARN: sleep 0.5s then retrying once after AWS/boto3 exception: %s" % (e))
-        time.sleep(0.5)  # ToDo: intelligently retry?!? and/or parse result of previous API call?
-        r = cog_client.admin_initiate_auth( UserPoolId=UserPoolId, ClientId=clientID,
-              AuthFlow="ADMIN_NO_SRP_AUTH", AuthParameters={"USERNAME":userGUID,"PASSWORD":defPass}
-        )
-
-    print("  step 4. admin-respond-to-auth-challenge")
-    if r.get("ChallengeName") == None:
-        print("    (no challenge pending)")
-    elif (args.forceOldPass in ("auto","n","N",'0')) and args.userType.upper() in nonConsumerUserTypes:  # CSA,AIR,TAP
-        print("    ADD userType:%s (skipping respond-to-auth ChallengeName %s)" % (args.userType,r.get("ChallengeName")),end='')
-        print("  --forceOldPass=y can update this (idempotent)" if (args.verbose and r.get("ChallengeName")) else '')
-    elif r and args.forceOldPass in ("auto","y","Y",'1'):
-        if r.get("Session") is not None and r.get("ChallengeName") in ("FORCE_CHANGE_PASSWORD","NEW_PASSWORD_REQUIRED"):
-            seshVals=r["Session"] ; seshVals_REDACTED='REDACTED(long,boring & ephemeral)'
-            print('    $ aws cognito-idp admin-respond-to-auth-challenge --user-pool-id {} --client-id "{}"'.format(
-                               UserPoolId,clientID), end=' \\\n')
-            print('      --session {seshVals} --challenge-name {ChallengeName} '.format(
-                               seshVals=seshVals_REDACTED,ChallengeName=r["ChallengeName"]),end=' \\\n')
-            print('      --challenge-responses "NEW_PASSWORD=...,USERNAME={userGUID}"'.format(userGUID=userGUID))
-            r = cog_client.admin_respond_to_auth_challenge( UserPoolId=UserPoolId, ClientId=clientID, Session=seshVals,
-                      ChallengeName=r["ChallengeName"],ChallengeResponses={"USERNAME":userGUID,"NEW_PASSWORD":defPass}
-            )
-            print("    ADDED USER:", end=' ')
-        else:
-            print("    PRIOR USER:", end=' ')
-    else:
-        print("    MUNGED USER:", end=' ')    # rare
-
-    doListUsers(Filter=('email ^= "%s"' % (un)),UserPoolId=UserPoolId)
-
-    return userGUID
-
-
-def doListUsers(Filter,UserPoolId=UserPoolId,bookingId=bookingId,verbosityLevel=0):
-    # list-users called individually after create, or with filter to list matches
-    global user_count
-    Filter = 'email ^= "%s"' % Filter if '"' not in Filter else Filter
-    bookingId = ''.join(filter(str.isdigit, Filter)) if len(str(bookingId)) != 7 else bookingId
-    print("  $ aws cognito-idp list-users --filter '{Filter}'".format(Filter=Filter), end=' ')
-    print("--region '%s' --user-pool-id '%s' | jq '.Users[]'" % (args.region,UserPoolId))
-    if args.verbose:
-        print("        DEBUG: bookingId: %s, emailVal: %s, Filter: %s" % (bookingId, emailVal, Filter))
-
-    cog_response = cog_client.list_users(UserPoolId=UserPoolId,Filter=Filter,Limit=60)
-
-    if len(cog_response["Users"]) == 0 or args.verbose:
-        print("(%d users matched Cognito filter '%s')" % (len(cog_response["Users"]), Filter))
-
-    for user in cog_response["Users"]:
-        user_count += 1
-        attr_count = 1
-        attribs = user.pop("Attributes")  # attribs list esp. UserStatus in(CONFIRMED,FORCE_CHANGE_PASSWORD)
-        attribs.append(user)   # flatten structure for consistent output format including metadata
-        for attr in sorted(attribs,key=lambda d:d.get("Name",'a'),reverse=False):
-            attrAsStr = str(attr) if '"' in attr.get("Value","single-quoter") else json.dumps(
-                            attr,sort_keys=True,default=str)  # specify default=function to dump datetime object)
-            if attr_count == 1:
-                print('  %s.   %s' % (user_count,attrAsStr))  # outdent first line
-            else:
-                print('   .%s  %s' % (attr_count,attrAsStr))  # indent remaining lines
-            attr_count += 1
-
-    if len(str(bookingId)) == 7 and args.file is None:
-        callMetadata(bookingId,verbosityLevel=verbosityLevel)
-
-    return user_count
-
-
-def callMetadata(bookingId,verbosityLevel=0):  # returns a large-ish dict structure
-    global pax1note
+def openSnapshot(acog, args):  # PoolSnapshot for the resolved pool (AcogError if unusable)
+    path = args.snapshot if args.snapshot else snapshotPath(acog.UserPoolId)
     try:
-        url = "http://%s:8080/api/booking/getdetails/%s" % ( MetadatahostIp, bookingId)
-        logger.info(("Metadata url %s (%s)\n" % (url,MetadatahostName)) if (verbosityLevel > 0) else '')
-        r = requests.get(url, timeout=9)
-        assert r.json()[0]["BookingNo"], "Invalid booking # %s" % bookingId  # raise 
-    except Exception as e:
-        embarkDate=futureDate
-        departDate=embarkDate
-        embarkNote="default"
-        pax1note = pax2note = "ERROR"
-        print("Exception %s" % e)  # https://martinfowler.com/articles/microservices.html#SmartEndpointsAndDumbPipes
-        print("Could not get live embarkDate from Metadata %s --using arg/defaults..." % url)
-        return {"embarkNote":embarkNote,"pax1note":pax1note,"pax2note":pax2note,"paxArray":paxArray}
+        snapshot = PoolSnapshot(path, acog.UserPoolId)
+    except (ValueError, sqlite3.Error) as e:
+        raise AcogError("snapshot %s: %s" % (path, e))
+    if args.use_snapshot and not args.action.startswith("snap"):
+        if snapshot.age() is None:
+            raise AcogError("no snapshot of %s yet; run: acog.py snapshot %s" % (acog.UserPoolName, acog.UserPoolName))
+        print(snapshot.describe(), file=sys.stderr)
+    return snapshot
+
+
+def addUserRows(acog, args, rows, journal=None, defaultFirstName=None):
+    # doAddUserRows (or --async: doAddUserRowsAsync), with --suspend-triggers if asked
+    def run(rows):
+        if args.asyncUsers:
+            return doAddUserRowsAsync(acog, rows, concurrency=args.asyncUsers, timeout=args.userTimeout,
+                                      journal=journal, fast=args.fast, defaultFirstName=defaultFirstName,
+                                      metadata=args.prefetchMetadata and not args.skipMetadata)
+        return doAddUserRows(acog, rows, workers=args.workers, journal=journal, fast=args.fast)
+
+    if not args.suspend_triggers:
+        return run(rows)
+    rows = iter(rows)
+    probe = run(itertools.islice(rows, args.triggerProbe))
+    with TriggerSuspension(acog):
+        stats = run(rows)
+    print("  per-user latency, triggers on:        %s" % latencySummary(probe["rowSecs"]), file=sys.stderr)
+    print("  per-user latency, triggers suspended: %s" % latencySummary(stats["rowSecs"]), file=sys.stderr)
+    return mergeStats(probe, stats)
+
+
+def addUserShards(acog, args):  # add-user --file --shards N: merged stats of the shard processes (+"failed")
+    by = args.shard_by if args.shard_by else ("hash" if args.file.endswith(".gz") else "bytes")
+    checkShardable(args, by)
+    if args.resume and not args.journal:  # each shard appends to (and resumes from) the one journal
+        args.journal = args.file + ".journal"
+    if args.shards > maxShards(args.quotaScale):  # (else the small quota categories' MIN_RATE floors overrun them)
+        print("WARN: --shards %s capped at %s: more would give a quota category under %s call/sec per shard" % (
+              args.shards, maxShards(args.quotaScale), MIN_RATE), file=sys.stderr)
+        args.shards = maxShards(args.quotaScale)
+    print("add-user --file %s: %s shards by %s, --quotaScale %s each" % (
+          args.file, args.shards, by, args.quotaScale / args.shards), file=sys.stderr)
+    pool = {"userPools":acog.userPools, "pool":[acog.UserPoolName, acog.UserPoolId]}  # resolved once, here
+    t0 = time.time()
+    run = lambda: runShards(os.path.abspath(__file__), vars(args), args.shards, by, args.file + ".shard%s.log",
+                            pool=pool)
+    if args.suspend_triggers:  # once, around all the shards (the marker is per pool)
+        with TriggerSuspension(acog):
+            reports, codes = run()
     else:
-        if r.json()[0]["BookingNo"]:
-            for k in paxArray[0].keys():
-                paxArray[0][k] = r.json()[0].get(k)  # booking info that applies to all pax
-            departDate = r.json()[0]["GuestDepartureDate"].split('T')[0]
-            embarkDate = r.json()[0]["EmbarkDate"].split('T')[0]
-            embarkNote = "API elapsed %s (departDate:%s) " % (r.elapsed,departDate)
-            paxArray[0]["EmbarkDate"] = embarkDate
-            paxArray[0]["GuestDepartureDate"] = departDate
-
-            # print("\nDEBUG: paxArray: %s" % json.dumps(paxArray,sort_keys=True))
-            paxArray[0]["paxCount"] = len(r.json()[0]["Passengers"])
-            for paxObj in r.json()[0]["Passengers"]:
-                if args.verbose and verbosityLevel > 1:
-                    print("\nDEBUG: paxObj (paxArray[%s]): %s" % (paxObj['paxnum'],json.dumps(paxObj,sort_keys=True)))
-                paxArray[paxObj['paxnum']] = paxObj
-            fName = paxArray[1]["FirstName"]
-            lName = paxArray[1]["LastName"]  # override args.names with API results
+        reports, codes = run()
+    stats = mergeReports(acog, reports)
+    stats["elapsed"] = time.time() - t0
+    stats["failed"] = [i for i, report in enumerate(reports) if report is None or codes[i]]
+    return stats
+
+
+def listUsersFanOut(acog, args, Filter):  # list-users --pools/--regions: every matching pool, merged and tagged
+    regions = args.regions.split(',') if args.regions else None
+    patterns = args.pools if args.pools is not None else ('' if acog.poolName == def_pool_name else acog.poolName)
+    workers = args.workers if args.workers > 1 else 8
+    fields = args.fields.split(',') if args.fields else None
+    attributes = [f for f in fields if f not in USER_FIELDS + ["region", "pool"]] if fields else None
+    t0 = time.time()
+    clients = poolClients(acog, patterns, regions, workers=workers)
+    print("list-users: %s pools in %s: %s" % (len(clients), ','.join(regions or [acog.region]),
+          ' '.join("%s/%s" % (c.region, c.poolName) for c in clients)), file=sys.stderr)
+    writer = RecordWriter(sys.stdout, args.format, ["region", "pool"] + (fields or DEFAULT_COLUMNS)
+                          if args.format != "ndjson" else fields) if args.format else None
+    counts, errors = {}, {}
+    for client, user in fanOutUsers(clients, Filter=Filter, attributes=attributes, workers=workers, errors=errors):
+        record = dict(flattenUser(user), region=client.region, pool=client.poolName)
+        counts[(client.region, client.poolName)] = counts.get((client.region, client.poolName), 0) + 1
+        if writer:
+            writer.write(record)
         else:
-            embarkDate=futureDate
-            embarkNote="default --API error Details: %s" % (r.json()[0]["Details"])
-            if args.verbose or verbosityLevel > 0:
-                print("\nDEBUG: paxArray: %s" % json.dumps(paxArray,sort_keys=True))
-        # Cognito can be picky about matching names to Metadata exactly
-        # nice ToDo: list-comprehension dict-values-only
-        pax1note = [paxArray[1]["paxnum"],paxArray[1]["Title"],paxArray[1]["FirstName"],
-                    paxArray[1]["MiddleName"], paxArray[1]["LastName"],paxArray[1]["Suffix"]
-                    ]
-        pax2note = [paxArray[2]["paxnum"],paxArray[2]["Title"],paxArray[2]["FirstName"],
-                    paxArray[2]["MiddleName"], paxArray[2]["LastName"],paxArray[1]["Suffix"]
-                ] if paxArray[2].get("paxnum") else "(no pax2)"
-
-        if args.verbose and verbosityLevel > 0:
-            paxArray[0].pop("Pricing",None)
-            paxArray[0].pop("ExtensionDetails",None)  # toss metadata we don't care about
-            print("    %s" % (json.dumps(paxArray[0])))
-            print(" \t %s" % (pax1note))
-            print(" \t %s" % (pax2note))
-
-    return {"embarkNote":embarkNote,"pax1note":pax1note,"pax2note":pax2note,"paxArray":paxArray}
-
-
-def generateIdToken(username,pool=def_pool_name):
-    import warrant.aws_srp  # RCF-2945 Secure Remote Password
-    tokens = warrant.aws_srp.AWSSRP( username=username, password=defPass,
-                                    pool_id=UserPoolId,
-                                    client_id=clientID,
-                                    client=boto3.client('cognito-idp', region_name=AWS_DEFAULT_REGION)
-                                ).authenticate_user()
-    return tokens['AuthenticationResult']['IdToken']
+            print("  %-10s %-16s %-36s %s %s" % (record["region"], record["pool"], record.get("email"),
+                  record.get("sub", record.get("Username")), record.get("UserStatus")))
+    sys.stdout.flush()
+    print("list-users: %s users in %.1fs (%s): %s" % (sum(counts.values()), time.time() - t0, Filter or "whole pools",
+          ', '.join("%s/%s %s" % (region, pool, n) for (region, pool), n in sorted(counts.items())) or "no matches"),
+          file=sys.stderr)
+    for (region, pool), e in sorted(errors.items()):
+        print("ERROR: %s/%s: %s" % (region, pool, e), file=sys.stderr)
+    return 1 if errors else 0
+
+
+def printVerify(acog, args, guids):  # --fast: one batched check of the users just added
+    if not args.fast or args.noVerify or not guids:
+        return
+    t0 = time.time()
+    result = acog.verifyUsers(guids, workers=max(args.workers, 8))
+    statuses = {k:v for k, v in result.items() if k not in ("users", "missing", "emailVerified")}
+    print("  verify (--fast): %s users: %s, email_verified %s, missing %s (%.1fs)" % (
+          result["users"], statuses, result["emailVerified"], result["missing"], time.time() - t0),file=sys.stderr)
+
+
+def printBookingCache(acog, indent="  "):  # Metadata booking cache hits/misses, if this run looked any up
+    cache = acog.metadataCache
+    if cache and cache.stats["hits"] + cache.stats["invalid"] + cache.stats["misses"]:
+        print(indent + cache.report(), file=sys.stderr)
+
+
+def journalRows(args, rows):  # returns (rows minus --resume'd ones, RowJournal or None, resume stats)
+    path = args.journal if args.journal else (args.file + ".journal" if args.resume and args.file != '-' else None)
+    if args.resume and path is None:
+        raise AcogError("--resume from stdin needs --journal")
+    resumeStats = {}
+    if path is None:
+        return rows, None, resumeStats
+    if args.resume:
+        done = completedKeys(path)
+        print("resume: %s rows already done per journal %s" % (len(done), path), file=sys.stderr)
+        rows = skipCompleted(rows, done, resumeStats)
+    return rows, RowJournal(path), resumeStats
+
+
+def writeMetrics(acog, args):  # --metrics-out / --metrics-prom, at exit (also after errors and Ctrl-C)
+    try:
+        if args.metrics_out:
+            acog.metrics.writeJson(args.metrics_out)
+        if args.metrics_prom:
+            acog.metrics.writePrometheus(args.metrics_prom, labels={"action":args.action, "pool":acog.poolName})
+    except OSError as e:
+        print("WARN: could not write metrics: %s" % e, file=sys.stderr)
+
+
+def serveDaemon(args):  # acog.py serve: one warm process for many acog.py runs (see acogc.py)
+    global WARM
+    captureOutput()
+    logging.basicConfig(level=[logging.WARNING,logging.INFO,logging.DEBUG][min(args.verbose,2)])  # for every run
+    WARM = WarmClients()
+    path = socketPath(args.socket)
+    try:
+        serve(path, serveRun, idle=args.idle, ready=lambda: print(
+              "acog serve: pid %s on %s (idle exit: %s); export ACOG_SOCKET=%s" % (os.getpid(), path,
+              "%ss" % args.idle if args.idle else "never", path), file=sys.stderr, flush=True))
+    except OSError as e:
+        logger.error("%s" % e)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def serveRun(request):  # one forwarded command line, in a daemon thread whose stdout/stderr are the client's
+    args = parser.parse_args(request["argv"])
+    if args.action == "serve" or args.suspend_triggers or args.file == '-':
+        print("ERROR: serve, --suspend-triggers and --file - run in the calling process: unset ACOG_SOCKET",
+              file=sys.stderr)
+        return 2
+    for name in PATH_ARGS:
+        if getattr(args, name) and getattr(args, name) != '-':
+            setattr(args, name, os.path.join(request["cwd"], os.path.expanduser(getattr(args, name))))
+    return main(args=args)
 
 
 def Metadata_needed_flag(args,defNames):
@@ -590,36 +394,291 @@ def Metadata_needed_flag(args,defNames):
               and "CONSUMER" in args.userType.upper() )
 
 
-if __name__ == "__main__":  # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~ "main" ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def main(argv=None, args=None):  # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~ "main" ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    args = args if args else parser.parse_args(argv)  # (serveRun parses, then fixes up paths)
+    if args.shard_args:  # a --shards worker process: the parent's args, with this shard's part
+        args = argparse.Namespace(**readArgs(args.shard_args))
+    if args.action == "serve":
+        return serveDaemon(args)
+    logging.basicConfig(level=[logging.WARNING,logging.INFO,logging.DEBUG][min(args.verbose,2)])
+
+    emailVal = args.email  # initialized, for later override/parse/templatize/validation
+    firstName, lastName = parseNames(args)
+    fName, lName = firstName, lastName
+
+    # the un-named args handling is not-great...
+    longAction = args.action
+    if args.arg2.find('-') >= 0:  # dash implies action or pool
+        bookingId = args.arg3.split('@')[0] if "COG-" not in args.arg3 else None
+        emailVal = args.arg3 if '@' in args.arg3 and '%s' in args.email else args.email  # override
+        longAction = args.action if "COG-" not in args.action else defAction  # default to read-only
+        UserPoolName = args.arg2 if "COG-" in args.arg2 else def_pool_name
+        logger.debug("UserPoolName: %s" % (UserPoolName))
+    else:  # ToDo: more parse validation of input parameters...
+        bookingId = args.arg2.split('@')[0] if "COG-" not in args.arg2 else None
+        emailVal = args.arg2 if '@' in args.arg2 and '%s' in args.email else args.email  # override
+        UserPoolName = args.arg3 if "COG-" in args.arg3 else def_pool_name
+
+    UserPoolName = "COG-" if "list-p" in args.action else UserPoolName
+    logger.debug("UserPoolName: %s" % (UserPoolName))
+
+    argX = bookingId if bookingId else emailVal  # stash for later list-user filter in doListUsers
+    bookingId = bookingId if str(bookingId).isnumeric() else None  # no bookingId implies AIR/CSA later
+    if bookingId is None and emailVal[0:7].isnumeric():
+        bookingId = emailVal[0:7]
+
+    if '%s' in emailVal and args.file is not None:  # templatize conditionally
+        if bookingId:
+            emailVal = emailVal % (bookingId)
+        elif ',' in args.names and args.names not in ("lastName,firstName",defNames):
+            emailVal = emailVal % (firstName + '.' + lastName)
+        elif args.names in ("lastName,firstName",defNames):
+            print("    emailVal %s (to be determined later from CSV)" % emailVal)
+        else:
+            emailVal = emailVal % (args.names)
 
+    acog = newClient(args, UserPoolName)
+    if args.shard_pool:  # a --shards worker: the parent's pool list and pool (no UserPoolRead calls here)
+        acog.lazy.update(args.shard_pool)
+    try:
+        # resolve the pool now (list-pools doesn't need one; list-users --pools/--regions matches its own, per
+        # region, in poolClients: this region may not even have it)
+        onePool = "list-p" not in args.action and not (args.action.startswith('l') and
+                                                        (args.pools is not None or args.regions))
+        if onePool:
+            print("UserPoolName:     '%s' from %s ~ %s" % (
+                acog.UserPoolName,UserPoolName,acog.availPoolNames),file=sys.stderr)
+        if args.verbose:
+            print("         emailVal:%s (per args.email:%s)" % (emailVal,args.email),file=sys.stderr)
+        marker = readMarker(acog.UserPoolId) if onePool else None
+        if marker and not args.action.startswith("restore") and not args.shard:
+            print("WARN: pool %s has Lambda triggers suspended (pid %s on %s since %s); "
+                  "if that run died: acog.py restore-triggers %s" % (acog.UserPoolName, marker["pid"],
+                  marker["host"], time.ctime(marker["since"]), acog.UserPoolName), file=sys.stderr)
+        if args.use_snapshot or args.action.startswith("snap"):
+            acog.snapshot = openSnapshot(acog, args)
+        batch = args.file or args.action.startswith(("mint", "purge", "clone"))
+        with ProgressReporter(acog.metrics, every=args.progress if batch else 0):
+            return runAction(acog, args, longAction, bookingId, emailVal, argX, fName, lName)
+    except AcogError as e:
+        logger.error("%s" % e)
+        return 1  # fatal exit
+    except (KeyboardInterrupt, TerminatedError) as e:
+        print("INTERRUPTED: %s" % (e or "Ctrl-C"), file=sys.stderr)
+        return 130
+    finally:
+        if (args.verbose or acog.throttle.throttles) and not args.file:  # --file prints it in its summary
+            print(acog.throttle.report(),file=sys.stderr)
+        if args.verbose and not args.file:
+            printBookingCache(acog, indent='')
+        writeMetrics(acog, args)
+
+
+def runAction(acog, args, longAction, bookingId, emailVal, argX, fName, lName):  # returns exit code
     if 'auth' in args.action:
-        idToken = generateIdToken(emailVal,UserPoolId)  # handy for curl
+        idToken = acog.generateIdToken(emailVal)  # handy for curl
         if args.verbose:
-          print("DEBUG: UserPoolId:%s, clientID:%s" % (UserPoolId,clientIDs[UserPoolId]), file=sys.stderr)
+          print("DEBUG: UserPoolId:%s, clientID:%s" % (acog.UserPoolId,acog.clientID), file=sys.stderr)
           print("--header Authorization:{idToken}  # for %s in AWS Cognito pool %s (%s bytes)" % (
-            emailVal, clientIDs[UserPoolId]["pool"], len(idToken))
+            emailVal, acog.UserPoolName, len(idToken))
             ,file=sys.stderr)
         print(idToken)  # handy for curl
-        sys.exit(0)
+        return 0
+
+    if args.action.startswith("snap"):  # snapshot: (re)index the pool into the local SQLite snapshot
+        print("snapshot: %s %s" % ("rebuilding" if args.refresh_cache else "refreshing", acog.snapshot.describe()),
+              file=sys.stderr)
+        stats = acog.snapshot.refresh(acog, full=args.refresh_cache)
+        print("snapshot: listed %(listed)s users, %(changed)s new/changed, %(removed)s removed in %(elapsed).1fs" % stats,
+              file=sys.stderr)
+        return 0
+
+    if args.action.startswith("mint"):  # mint-tokens: username<TAB>IdToken<TAB>exp per user, concurrently
+        if args.file:
+            usernames = readUsernames(args.file)
+        else:
+            usernames = poolUsernames(acog, args.filter if args.filter is not None else 'email ^= "%s"' % argX)
+        workers = args.workers if args.workers > 1 else 8
+        stats = mintTokens(acog, usernames, workers=workers)
+        print("mint-tokens: %s tokens, %s errors in %.1fs = %.1f tokens/sec (--workers %s)" % (
+              stats["ok"], stats["errors"], stats["elapsed"],
+              stats["ok"] / stats["elapsed"] if stats["elapsed"] else 0, workers), file=sys.stderr)
+        print("  latency: %s" % latencySummary(stats["secs"], percentiles=(50, 90, 99)), file=sys.stderr)
+        if acog.tokenCache:
+            print("  token cache: %(hits)s hits, %(refreshes)s refreshes, %(logins)s SRP logins" % acog.tokenCache.stats,
+                  file=sys.stderr)
+        print("  " + acog.throttle.report(), file=sys.stderr)
+        return 1 if stats["errors"] and not stats["ok"] else 0
+
+    if args.action.startswith("purge") or args.action.startswith("del") and args.file:  # bulk delete-user
+        createdBefore = parseDate(args.created_before) if args.created_before else None
+        workers = args.workers if args.workers > 1 else 8
+        missing = []
+        if args.file:
+            candidates = fileCandidates(acog, readKeys(args.file), workers=workers, missing=missing)
+        elif args.filter is None or args.filter == '' and createdBefore is None:
+            raise AcogError("purge needs --file, or --filter ('' = whole pool, only with --created-before)")
+        else:
+            candidates = filterCandidates(acog, args.filter, createdBefore)
+        print("purge %s: %s%s%s" % (acog.UserPoolId, ("--file %s" % args.file) if args.file else "--filter '%s'" % args.filter,
+              " created before %s" % createdBefore if createdBefore else '', " (dry run)" if args.dry_run else ''),
+              file=sys.stderr)
+        stats = purgeUsers(acog, candidates, workers=workers, dryRun=args.dry_run, quiet=args.quiet)
+        if args.dry_run:
+            print("DRY RUN purge: %s users would be deleted (%.1fs)" % (stats["matched"], stats["elapsed"]),
+                  file=sys.stderr)
+        else:
+            print("DONE acog.py purge %s: %s matched, %s deleted, %s already gone, %s errors in %.1fs = %.1f users/sec "
+                  "(--workers %s)" % (acog.UserPoolId, stats["matched"], stats["deleted"], stats["notFound"],
+                  stats["errors"], stats["elapsed"], stats["deleted"] / stats["elapsed"] if stats["elapsed"] else 0,
+                  workers), file=sys.stderr)
+        if missing:
+            print("  %s --file keys matched no user: %s%s" % (len(missing), ' '.join(missing[:20]),
+                  " ..." if len(missing) > 20 else ''), file=sys.stderr)
+        print("  " + acog.throttle.report(), file=sys.stderr)
+        return 1 if stats["errors"] else 0
+
+    if args.action.startswith("clone"):  # clone: users of this pool the arg3 pool lacks, copied into it
+        if args.arg3 == acog.UserPoolName or "COG-" not in args.arg3:
+            raise AcogError("clone needs a (different) target pool: acog.py clone <source pool> <target pool>")
+        target = poolClient(acog, args.arg3)
+        workers = args.workers if args.workers > 1 else 8
+        print("clone %s -> %s (%s)%s%s" % (acog.UserPoolName, target.UserPoolName, target.UserPoolId,
+              " --filter '%s'" % args.filter if args.filter else '', " (dry run)" if args.dry_run else ''),
+              file=sys.stderr)
+        source = {}
+        users = cloneSource(acog, target, Filter=args.filter, stats=source)
+        if args.dry_run:
+            missing = sum(1 for _ in users)
+            print("DRY RUN clone: %s users listed, %s already in %s, %s would be cloned" % (source["listed"],
+                  source["present"], target.UserPoolName, missing), file=sys.stderr)
+            return 0
+        if args.bulk_import:
+            stats = importUsers(target, None, roleArn=args.import_role, batch=args.import_batch,
+                                records=cloneRecords(users))
+            stats.update(cloned=stats["imported"], exists=0, errors=stats["failed"])  # failures: CloudWatch Logs
+        else:
+            stats = cloneUsers(target, users, workers=workers, quiet=args.quiet)
+        print("DONE acog.py clone %s -> %s: %s listed, %s already present, %s cloned, %s errors in %.1fs = "
+              "%.1f users/sec (%s)" % (acog.UserPoolName, target.UserPoolName, source["listed"],
+              source["present"] + stats["exists"], stats["cloned"], stats["errors"], stats["elapsed"],
+              stats["cloned"] / stats["elapsed"] if stats["elapsed"] else 0,
+              "%s import jobs" % len(stats["jobs"]) if args.bulk_import else "--workers %s" % workers),
+              file=sys.stderr)
+        print("  " + acog.throttle.report(), file=sys.stderr)
+        incomplete = [job for job in stats.get("jobs", []) if job["Status"] != "Succeeded"]
+        return 1 if stats["errors"] or incomplete else 0
+
+    if args.action.startswith("imp"):  # import: --file rows as Cognito user import jobs (see acoglib.importjob)
+        if not args.file:
+            raise AcogError("import needs --file")
+        rows = readUserRows(args.file, fName, lName, email=emailVal, userType=args.userType, verbose=args.verbose,
+                            echo=not args.quiet)
+        if not args.skipMetadata:  # no per-row lookups here: the whole file's bookings up front
+            rows = prefetchBookings(acog.metadata, rows, workers=args.metadataWorkers, defaultFirstName=fName)
+        csvDir = (os.path.dirname(os.path.abspath(args.file)) if args.file != '-' else os.getcwd()) if args.dry_run else None
+        print("import %s: --file %s, %s users per job%s" % (acog.UserPoolId, args.file, args.import_batch,
+              " (dry run: CSVs only)" if args.dry_run else ''), file=sys.stderr)
+        stats = importUsers(acog, rows, roleArn=args.import_role, batch=args.import_batch, dryRun=args.dry_run,
+                            csvDir=csvDir)
+        if args.dry_run:
+            print("DRY RUN import: %s users (%s duplicate rows) in %s CSVs (%.1fs)" % (stats["users"],
+                  stats["duplicates"], len(stats["csvs"]), stats["elapsed"]), file=sys.stderr)
+            return 0
+        incomplete = [job for job in stats["jobs"] if job["Status"] != "Succeeded"]
+        print("DONE acog.py import %s: %s users in %s jobs: %s imported, %s skipped, %s failed (%s duplicate rows) "
+              "in %.1fs = %.1f users/sec" % (acog.UserPoolId, stats["users"], len(stats["jobs"]), stats["imported"],
+              stats["skipped"], stats["failed"], stats["duplicates"], stats["elapsed"],
+              stats["imported"] / stats["elapsed"] if stats["elapsed"] else 0), file=sys.stderr)
+        for job in incomplete:
+            print("  %s %s: %s %s" % (job["JobName"], job["JobId"], job["Status"], job.get("CompletionMessage", '')),
+                  file=sys.stderr)
+        if stats["failed"]:
+            print("  per-user failures: CloudWatch Logs group /aws/cognito/%s" % acog.UserPoolId, file=sys.stderr)
+        print("  " + acog.throttle.report(), file=sys.stderr)
+        return 1 if incomplete or stats["failed"] else 0
+
+    if args.action.startswith("restore"):  # restore-triggers: re-enable triggers a dead --suspend-triggers run left off
+        marker = readMarker(acog.UserPoolId)
+        if marker is None:
+            print("no suspended-triggers marker for %s; nothing to restore" % acog.UserPoolName)
+            return 0
+        if markerOwnerAlive(marker) and marker["pid"] != os.getpid():
+            print("pid %s on %s may still be running with triggers suspended; stop it first (it restores on exit)" % (
+                  marker["pid"], marker["host"]))
+            return 1
+        return 0 if restoreTriggers(acog, marker) else 1
+
+    if args.action.startswith("sync"):  # sync: diff --file against the pool, then create/update only that
+        if not args.file:
+            raise AcogError("sync needs --file")
+        t0 = time.time()
+        state = loadPoolState(acog)
+        print("sync: pool state %s users loaded in %.1fs%s" % (len(state), time.time() - t0,
+              " (snapshot)" if acog.snapshot else ''), file=sys.stderr)
+        rows = readUserRows(args.file, fName, lName, email=emailVal, userType=args.userType, verbose=args.verbose,
+                            echo=not args.quiet)
+        if args.prefetchMetadata and not args.skipMetadata:
+            rows = prefetchBookings(acog.metadata, rows, workers=args.metadataWorkers, defaultFirstName=fName)
+        plan = planSync(acog, rows, state)
+        printPlan(plan, verbose=args.verbose)
+        if args.dry_run:
+            return 0
+        journal = RowJournal(args.journal) if args.journal else None  # sync re-plans on re-run; no --resume needed
+        try:
+            if args.suspend_triggers and any(step[0] == "create" for step in plan):
+                with TriggerSuspension(acog):
+                    stats = runSync(acog, plan, workers=args.workers, journal=journal, fast=args.fast)
+            else:
+                stats = runSync(acog, plan, workers=args.workers, journal=journal, fast=args.fast)
+        finally:
+            if journal:
+                journal.close()
+        print("DONE acog.py sync %s: %s created (%s errors, %s fatal), %s updated (%s errors) in %.1fs" % (
+              acog.UserPoolId, stats["create"]["ok"], stats["create"]["errors"], stats["create"]["fatal"],
+              stats["update"]["ok"], stats["update"]["errors"], stats["elapsed"]))
+        printVerify(acog, args, stats["create"]["guids"])
+        print("  " + acog.throttle.report(),file=sys.stderr)
+        return 1 if stats["create"]["fatal"] else 0
 
     if args.action.startswith('l') or args.arg2.startswith('l'):  # l=list
       if 'u' in args.action and 'p' not in args.action or 'u' in args.arg2 and 'p' not in args.arg2:
         longAction = "list-users"
         Filter = 'email ^= "%s"' % (argX if bookingId in ('','None',None) else bookingId)
+        Filter = args.filter if args.filter is not None else Filter
         if args.verbose:
             print("  DEBUG: argX: %s, bookingId: %s, emailVal: %s, Filter: %s" % (argX, bookingId, emailVal, Filter))
-        doListUsers(Filter=Filter,UserPoolId=UserPoolId,bookingId=bookingId,verbosityLevel=1)
+        if args.pools is not None or args.regions:
+            return listUsersFanOut(acog, args, Filter)
+        if args.format:
+            fields = args.fields.split(',') if args.fields else None
+            attributes = [f for f in fields if f not in USER_FIELDS] if fields else None
+            t0 = time.time()
+            count = RecordWriter(sys.stdout, args.format, fields).writeUsers(
+                        acog.queryUsers(Filter=Filter, attributes=attributes))
+            print("list-users: %s users in %.1fs (%s)" % (count, time.time() - t0, Filter or "whole pool"),
+                  file=sys.stderr)
+        else:
+            acog.doListUsers(Filter=Filter,bookingId=bookingId,verbosityLevel=1)
       elif 'p' in args.action or not 'u' in args.action:
         longAction = "list-pools"
         print("  aws cognito-idp list-user-pools --max-results=60",end=' ')
         print("--region '{region}'".format(region=args.region), end=' ')
         print("| jq '.UserPools[]|{Id,Name}' -c")
-        for up in userPools['UserPools']:  # print cached pools list
+        if args.regions:  # every region's pool list, fetched concurrently, tagged with the region
+            bases = regionClients(acog, args.regions.split(','))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(bases)) as pool:
+                userPools = dict(zip(bases, pool.map(lambda base: base.userPools, bases.values())))
+            for region in bases:
+                for up in userPools[region]['UserPools']:
+                    print('      "%s",       "%s",       "%s"' % (up["Id"], up["Name"], region))
+        else:
+          for up in acog.userPools['UserPools']:  # print cached pools list
             print('      "%s",       "%s"' % (up["Id"], up["Name"]))
     elif args.action.find('g') >= 0:  # get-user
         longAction = "get-user"
         print("ToDo: aws cognito-idp admin-get-user --username '%s' " % argX,end='')
-        print("--region '%s' --user-pool-id '%s'" % (args.region,UserPoolId))
+        print("--region '%s' --user-pool-id '%s'" % (args.region,acog.UserPoolId))
     elif args.action.find('add') >= 0:
         if args.action.find('att') >= 0:  # add-attribs or attrib-add
             longAction = "add-attribs"
@@ -629,9 +688,8 @@ if __name__ == "__main__":  # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~ "main" ~~~~~~~~~~~~~~
         longAction = "delete-user"
         print("action: %s" % (longAction))
         emailVal = emailVal % (argX.split('@')[0]) if "%s" in emailVal else emailVal
-        print("  $ aws cognito-idp admin-delete-user --user-pool-id %s --username %s  # bookingId:%s\n" % (UserPoolId,emailVal,bookingId))
-        r = cog_client.admin_delete_user(Username=emailVal,UserPoolId=UserPoolId)
-        if 200 == r['ResponseMetadata']['HTTPStatusCode']:
+        print("  $ aws cognito-idp admin-delete-user --user-pool-id %s --username %s  # bookingId:%s\n" % (acog.UserPoolId,emailVal,bookingId))
+        if acog.deleteUser(emailVal):
           print("SUCCESS: admin_delete_user %s  # bookingId:%s" % (emailVal,bookingId))
     else:
         print("                   ^ (unknown)")
@@ -639,87 +697,50 @@ if __name__ == "__main__":  # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~ "main" ~~~~~~~~~~~~~~
 
     # ~~~~~~~~ ~~~~~~~~ ~~~~~~~~ ~~~~~~~~
     if longAction == "add-user":
-      if args.file:  # do 1+ user(s) loop through lines from text file (CSV,TSV)  # TODO: move this large block into its own function...
-        print("Require at least 4 headers like this in CSV/TAB-delimited file:\n	INVOICE,LNAME,FNAME,DEPART (any order)",file=sys.stderr)
-        with open(args.file, newline='', encoding='utf-8-sig') as tsvfile:  # f = open(args.file, mode='r')
-          sample = tsvfile.read(1024)
-          try:
-            dialect = csv.Sniffer().sniff(sample,delimiters=', \t')  # auto-detect TSV,CSV
-            delimiter = dialect.delimiter
-            if ',' in sample:  # sometimes sniffer guesses wrong on cosmetic space-padding
-              delimiter = ','
-          except Exception as e:
-            print("WARN: Exception csv.Sniffer: %s" % (e))
-            if ',' in sample:
-              print("  OK: deduced comma delimiter")
-              delimiter = ','
-            elif '\t' in sample:
-              print("  OK: deduced TAB delimiter")
-              delimiter = '\t'
-            else:
-              print("WARN: could not deduce delimiter, so forcing to TAB!")
-              delimiter = '\t'
-
-          tsvfile.seek(0)  # rewind after peek
-          if args.verbose:
-              print("DEBUG: dialect.delimiter: '%s'" % (delimiter))
-
-          # pre-read to detect/fixup field headers
-          reader = csv.DictReader(tsvfile, delimiter=delimiter)  # dialect can be CSV or TSV (or space?)
-          fields = list()
-          for fieldname in reader.fieldnames:
-              field = fieldname.strip(" \ufeff")  # UTF-8 filter (maybe not needed after above encoding='utf-8-sig')
-              if len(field) > 1:  # skip empty field/headings
-                  fields.append(field.lower())  # normalize lowercase to ease matching below
-          if args.verbose:
-              print("DEBUG: fields: %s" % (fields))
-          tsvfile.seek(0)  # rewind after peek
-
-          # finally, get down to the real working looper... ##################
-          reader = csv.DictReader(tsvfile, fieldnames=fields, delimiter=delimiter)  # dialect can be CSV or TSV (or space)
-          next(reader)  # skip first line which is column headings line
-          for line in reader:
-            # Assign field values based on human-readable field names, depending
-            # if they came from Sales tables, or another table, or abbreviated.
-            # There's got to be a better way to match heading name variations (i.e. dict-data)
-            # field names via Sales or Pax tables --all this "r0bust" handling is getting silly...
-            bookingId = line.get("invoice", line.get("bookingid",
-                        line.get("invoiceno", line.get("bookingno",    # QA-4778 case matters
-                        line.get("invoicebooking", line.get("booking",
-                                 '%s')))))).strip()  # magically handle userType AIR emails
-            embarkDate = line.get("fromdate", line.get("fmdate", line.get("from",
-                         line.get("embkdate", line.get("embarkdate",line.get("embark",
-                                  '2020-05-04')))))).strip()  # NOTE: silly Star Wars day default
-            departureDate = line.get("depart",line.get("departuredate",line.get("end",line.get("to",
-                            line.get("todate",line.get("departdate",line.get("enddate",
-                                     embarkDate))))))).strip()  # NOTE: defaults to embarkDate
-            fName = line.get("fname", line.get("firstname",
-                    line.get("fname1",line.get("fname2", 
-                             firstName)))).strip()
-            lName = line.get("lname",  line.get("lastname",
-                    line.get("lname1", line.get("lname2",
-                             lastName)))).strip()
-            try:
-              print("%s. file fields: %s" % (user_count + 1,
-                [ bookingId, fName, lName, departureDate, embarkDate]),end='',file=sys.stderr)
-            except:
-              print("ERROR reading line %s:\n%s" % (user_count,line))
-
-            if str(bookingId).isnumeric() and int(bookingId) > 999999 or args.userType in nonConsumerUserTypes:
-              emailVal = defEmail % bookingId if "MER" in args.userType else emailVal
-              print(" (ok)",file=sys.stderr)
-              print(("\nDEBUG: emailVal: %s (pre call doAddUser)\n" % emailVal) if args.verbose else '',end='')
-
-              r = doAddUser(un=bookingId, upi=UserPoolId, fName=fName, lName=lName,
-                         dates={"departureDate":departureDate,"embarkDate":embarkDate})
-            else:
-              print(" WARN: (skipping comment/cosmetic/empty/header/malformed line)",file=sys.stderr)
-              r = 'skip-a-line'
-
-            if r == USER_GUID_ERROR:
-              print("ERROR: USER_GUID_ERROR")
-              # exit  # don't make this fatal--continue loop-processing
-        print("DONE acog.py add-user %s  # count: %s" % (UserPoolId, user_count))
+      if args.file and args.shards > 1:  # split across processes (see acoglib.shard)
+        stats = addUserShards(acog, args)
+        print("DONE acog.py add-user %s --shards %s" % (acog.UserPoolId, args.shards))
+        print("  rows: %s ok, %s errors, %s fatal in %.1fs = %.2f users/sec (--shards %s x %s)" % (
+              stats["ok"], stats["errors"], stats["fatal"], stats["elapsed"],
+              stats["rows"] / stats["elapsed"] if stats["elapsed"] else 0, args.shards,
+              "--async %s" % args.asyncUsers if args.asyncUsers else "--workers %s" % args.workers),file=sys.stderr)
+        print("  latency: %s" % latencySummary(stats["rowSecs"], percentiles=(50, 90, 99)), file=sys.stderr)
+        printVerify(acog, args, stats["guids"])
+        if args.journal:
+            print("  journal %s: %s rows recorded, %s skipped as done (--resume)" % (
+                  args.journal, stats["journaled"], stats["skipped"]),file=sys.stderr)
+        if stats["failed"]:
+            print("ERROR: shard(s) %s failed; see %s" % (', '.join(map(str, stats["failed"])),
+                  ', '.join(args.file + ".shard%s.log" % i for i in stats["failed"])), file=sys.stderr)
+        print("  " + acog.throttle.report(),file=sys.stderr)
+        printBookingCache(acog)
+        return 1 if stats["failed"] else 0
+
+      if args.file:  # do 1+ user(s) loop through lines from text file (CSV,TSV)
+        rows = readUserRows(args.file, fName, lName, email=emailVal, userType=args.userType, verbose=args.verbose,
+                            echo=not args.quiet, byteRange=args.shard[3] if args.shard else None,
+                            shard=args.shard[:2] if args.shard and args.shard[2] == "hash" else None)
+        rows, journal, resumeStats = journalRows(args, rows)
+        if args.prefetchMetadata and not args.skipMetadata and not args.asyncUsers:  # (--async: per user, aiohttp)
+            rows = prefetchBookings(acog.metadata, rows, workers=args.metadataWorkers, defaultFirstName=fName)
+        try:
+            stats = addUserRows(acog, args, rows, journal=journal, defaultFirstName=fName)
+        finally:
+            if journal:
+                journal.close()
+        if args.shard_report:
+            writeReport(args.shard_report, acog, stats, journal, resumeStats)
+        print("DONE acog.py add-user %s  # count: %s" % (acog.UserPoolId, acog.user_count))
+        print("  rows: %s ok, %s errors, %s fatal in %.1fs = %.2f users/sec (%s)" % (
+              stats["ok"], stats["errors"], stats["fatal"], stats["elapsed"],
+              stats["rows"] / stats["elapsed"] if stats["elapsed"] else 0,
+              "--async %s" % args.asyncUsers if args.asyncUsers else "--workers %s" % args.workers),file=sys.stderr)
+        printVerify(acog, args, stats["guids"])
+        if journal:
+            print("  journal %s: %s rows recorded, %s skipped as done (--resume)" % (
+                  journal.path, journal.count, resumeStats.get("skipped", 0)),file=sys.stderr)
+        print("  " + acog.throttle.report(),file=sys.stderr)
+        printBookingCache(acog)
 
       else:  # do 1 user from command-line args ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # detect default/placeholder args and replace with actual booking/invoice data lookup
@@ -727,8 +748,10 @@ if __name__ == "__main__":  # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~ "main" ~~~~~~~~~~~~~~
             print("DEBUG: args.date       /       defDate : %s / %s" % (args.date,defDate))
             print("DEBUG: args.names      /      defNames : %s / %s" % (args.names,defNames))
             print("DEBUG: args.skipMetadata / args.userType : %s / %s" % (args.skipMetadata,args.userType))
+        paxArray = defaultPaxArray()
+        pax1note = pax2note = "(no pax yet)"
         if Metadata_needed_flag(args,defNames):
-            APIresults = callMetadata(bookingId,verbosityLevel=1)   # Metadata API delay slowdown (throttles Cognito pool writes.)
+            APIresults = acog.callMetadata(bookingId,verbosityLevel=1)   # Metadata API delay slowdown (throttles Cognito pool writes.)
             embarkNote = APIresults["embarkNote"]
             pax1note = APIresults["pax1note"]
             pax2note = APIresults["pax2note"]
@@ -736,8 +759,8 @@ if __name__ == "__main__":  # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~ "main" ~~~~~~~~~~~~~~
             paxArray = APIresults["paxArray"]
             departureDate = paxArray[0]["GuestDepartureDate"]
             embarkDate = paxArray[0]["EmbarkDate"]
-            fName = paxArray[1]["FirstName"] if pax1note not in ("ERROR","(no pax yet)") else firstName
-            lName = paxArray[1]["LastName"] if pax1note not in ("ERROR", "(no pax yet)") else lastName
+            fName = paxArray[1]["FirstName"] if pax1note not in ("ERROR","(no pax yet)") else fName
+            lName = paxArray[1]["LastName"] if pax1note not in ("ERROR", "(no pax yet)") else lName
         else:
             embarkDate = departureDate = args.date
             embarkDate = "(--date='%s' failed/skipped)" % embarkDate if str(embarkDate[0]).isalpha() else embarkDate
@@ -751,37 +774,52 @@ if __name__ == "__main__":  # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~ "main" ~~~~~~~~~~~~~~
         if args.verbose:
             print("DEBUG userName: %s" % (userName))
         embarkNote = embarkNote + '\n      %s\n      %s\n    & %s' % (paxArray[0],pax1note,pax2note)
-        printHeadings(longAction, bookingId, UserPoolId, embarkDate=embarkDate,embarkNote=embarkNote)
-        r = doAddUser(un=userName, upi=UserPoolId, fName=fName, lName=lName,
-                   dates={"departureDate":departureDate,"embarkDate":embarkDate},paxArray=paxArray)
+        printHeadings(acog, longAction, bookingId, emailVal, embarkDate=embarkDate,embarkNote=embarkNote)
+        if args.fast:
+            r = acog.doAddUserFast(un=userName, fName=fName, lName=lName, email=emailVal,
+                       dates={"departureDate":departureDate,"embarkDate":embarkDate},paxArray=paxArray,
+                       verify=not args.noVerify)
+        else:
+            r = acog.doAddUser(un=userName, fName=fName, lName=lName, email=emailVal,
+                       dates={"departureDate":departureDate,"embarkDate":embarkDate},paxArray=paxArray)
         if NON_FATAL_WARNING in r:
-            user_count -= 1
+            acog.user_count -= 1
             print("    ADDING USER encountered warning %s\n      " % r,end='')
-            doListUsers(Filter=userName)
-        print("DONE add-user; count: %s" % (user_count))
+            acog.doListUsers(Filter=userName)
+        print("DONE add-user; count: %s" % (acog.user_count))
         if FATAL_ERROR_CODE in r:
             print("DEBUG: doAddUser returned %s" % (r))
-            sys.exit(1)  # fatal exit
+            return 1  # fatal exit
+
+    elif longAction == "add-attribs" and args.file:  # rows of: email or bookingId, attribute, value
+        path = args.results if args.results else (args.file + ".results" if args.file != '-' else None)
+        if path is None:
+            raise AcogError("add-attribs --file - needs --results")
+        workers = args.workers if args.workers > 1 else 8
+        rows = readAttribRows(args.file, name=args.attrib_name, value=args.attrib_val, verbose=args.verbose)
+        with open(path, "w", newline='') as out:
+            stats = addAttribRows(acog, rows, workers=workers, writer=RecordWriter(out, args.format or "ndjson",
+                                  RESULT_FIELDS))
+        print("DONE acog.py add-attribs %s: %s rows for %s users: %s ok, %s not found, %s errors, %s malformed "
+              "in %.1fs (GUIDs resolved in %.1fs) = %.1f rows/sec (--workers %s)" % (
+              acog.UserPoolId, stats["rows"], stats["users"], stats["ok"], stats["notFound"], stats["errors"],
+              stats["malformed"], stats["elapsed"], stats["resolveSecs"],
+              stats["rows"] / stats["elapsed"] if stats["elapsed"] else 0, workers), file=sys.stderr)
+        print("  results: %s" % path, file=sys.stderr)
+        print("  " + acog.throttle.report(), file=sys.stderr)
+        return 1 if stats["errors"] else 0
 
     elif longAction == "add-attribs":
-        cog_response = cog_client.list_users(UserPoolId=UserPoolId,Filter='email ^= "%s"' % bookingId,Limit=60)
-        try:
-            attribs = cog_response["Users"][0]["Attributes"]
-        except Exception as e:
-            logger.warning(" Caught exception: %s (Cognito response: %s)" % (e, cog_response))
-            sys.exit(0)  # final/global exit
-        logger.debug("Attributes: " + json.dumps(attribs,indent=2))
-        user_GUID = None
-        # sys.exit(0)  # final/global exit
-        UserAttributes=[{"Name":args.attrib_name,"Value":args.attrib_val}]
+        user_GUID = acog.findUserGUID(bookingId)
+        if user_GUID:
+            UserAttributes=[{"Name":args.attrib_name,"Value":args.attrib_val}]
+            r = acog.doAddAttribs(Username=user_GUID,UserAttributes=UserAttributes)
+        return 0  # final/global exit
 
-        for attr in sorted(attribs,key=lambda d:d.get("Name",'a'),reverse=False):  # sort by "Name"
-            logger.debug("attr: " + json.dumps(attr,indent=2))
-            user_GUID = attr["Value"] if attr["Name"] == "sub" else user_GUID  # 'userGUID aka "sub"'
-
-        r = doAddAttribs(UserPoolId=UserPoolId,Username=user_GUID,UserAttributes=UserAttributes)
-        sys.exit(0)  # final/global exit
+    print("")  # last action
+    return 0
 
 
-    print("")  # last action
-# EOF
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
+# EOF
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+# acog_bench.py -- end-to-end acog.py throughput with no AWS or VPN: users/sec, API calls per user and
+# peak memory for add-user, add-user --fast, list-users, add-attribs (per user and --file) and delete (per user and
+# purge --filter) at 1k/10k/100k rows
+#   ./acog_bench.py                                   # all scenarios x 1000,10000,100000 rows
+#   ./acog_bench.py --rows 1000 --latency 0.03 --throttle 0.02 --workers 16 --json today.json
+#   ./acog_bench.py --baseline today.json             # same table, with % change against a previous run
+# cognito-idp is acog_standin.FakeCognito (in-process; per-call latency, random throttling and/or
+# Cognito's own per-category quotas via --cogQuotaScale), Metadata is the acog_standin HTTP server;
+# each scenario x size runs in its own process so its peak RSS is its own
+
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = ("add-user", "add-user-fast", "list-users", "add-attribs", "add-attribs-bulk", "delete", "purge")
+
+
+def runScenario(scenario, rows, args):  # in the child process: returns the result dict
+    os.environ["ACOG_CACHE_DIR"] = tempfile.mkdtemp(prefix="acog-bench-")  # pool cache etc., never ~/.cache
+    import acog_standin
+    from acog_bench_csv import writeRows
+    from acoglib import AcogClient
+    from acoglib.attribs import addAttribRows
+    from acoglib.batch import doAddUserRows, readUserRows
+    from acoglib.metadata import prefetchBookings
+    from acoglib.metrics import Metrics
+    from acoglib.purge import filterCandidates, purgeUsers
+
+    fake = acog_standin.FakeCognito(pools={"COG-bench":"us-east-1_BENCH0001"}, seed=1)
+    path = os.path.join(os.environ["ACOG_CACHE_DIR"], "rows.csv")
+    writeRows(path, rows)
+    null = open(os.devnull, "w")  # acog's per-user output, as for acog.py -q > /dev/null
+    if scenario not in ("add-user", "add-user-fast"):  # these work on an existing pool: seed it, uncounted
+        with contextlib.redirect_stderr(null):
+            for row in readUserRows(path, "first", "last", echo=False):
+                fake.admin_create_user(UserPoolId="us-east-1_BENCH0001", Username=row["email"],
+                                       UserAttributes=[{"Name":"email", "Value":row["email"]}])
+    fake.latency, fake.quotaScale, fake.throttleRate = args.latency, args.cogQuotaScale, args.throttle
+
+    metadata = acog_standin.serve(port=0, latency=args.metadataLatency)
+    acog = AcogClient(poolName="COG-bench", clientID="bench-client", client=fake, tokenCache=False,
+                      quotaScale=args.quotaScale, maxRetries=args.maxRetries, metadataWorkers=args.workers,
+                      metadataUrl="http://127.0.0.1:%s" % metadata.server_address[1], metrics=Metrics())
+    acog.UserPoolId, acog.clientID  # resolve the pool before the clock starts
+    fake.calls.clear()
+
+    def each(func, items):  # func per item on --workers threads (bounded window); number that came back truthy
+        done = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as pool:
+            pending = set()
+            for item in items:
+                pending.add(pool.submit(func, item))
+                if len(pending) >= args.workers * 4:
+                    finished, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    done += sum(1 for future in finished if future.result())
+            done += sum(1 for future in pending if future.result())
+        return done
+
+    def bookingValue(row):
+        return json.dumps([acog.bookingEntry(row["un"], dates=row["dates"])])
+
+    def addAttribs(row):  # acog.py add-attribs, once per user: look the user up, then update
+        guid = acog.findUserGUID(row["un"])
+        return guid and acog.doAddAttribs(Username=guid, UserAttributes=[{"Name":"custom:booking",
+                                                                          "Value":bookingValue(row)}])
+
+    ok = 0
+    t0 = time.time()
+    with contextlib.redirect_stdout(null), contextlib.redirect_stderr(null):
+        userRows = readUserRows(path, "first", "last", echo=False)
+        if scenario in ("add-user", "add-user-fast"):  # the add-user --file --prefetchMetadata pipeline
+            fast = scenario == "add-user-fast"
+            stats = doAddUserRows(acog, prefetchBookings(acog.metadata, userRows, workers=args.workers,
+                                  defaultFirstName="first"), workers=args.workers, fast=fast)
+            ok = stats["ok"]
+            if fast:
+                ok = acog.verifyUsers(stats["guids"], workers=args.workers)["users"]
+        elif scenario == "list-users":
+            ok = sum(1 for _ in acog.queryUsers(Filter=''))
+        elif scenario == "add-attribs":
+            ok = each(addAttribs, userRows)
+        elif scenario == "add-attribs-bulk":  # acog.py add-attribs --file
+            ok = addAttribRows(acog, ({"rowNum":row["rowNum"], "key":row["un"], "attribute":"custom:booking",
+                               "value":bookingValue(row)} for row in userRows), workers=args.workers)["ok"]
+        elif scenario == "delete":
+            ok = each(lambda row: acog.deleteUser(row["email"]), userRows)
+        elif scenario == "purge":  # acog.py purge --filter '' --created-before <now>
+            ok = purgeUsers(acog, filterCandidates(acog, '', datetime.datetime.now(datetime.timezone.utc)),
+                            workers=args.workers, quiet=True)["deleted"]
+    elapsed = time.time() - t0
+    metadata.shutdown()
+
+    calls = sum(fake.calls.values())
+    return {"scenario":scenario, "rows":rows, "ok":ok, "elapsed":round(elapsed, 3),
+            "usersPerSec":round(rows / elapsed, 1) if elapsed else 0.0,
+            "callsPerUser":round(calls / rows, 2), "calls":dict(sorted(fake.calls.items())),
+            "metadataRequests":acog_standin.MetadataHandler.counts["requests"],
+            "throttled":acog.throttle.throttles, "retries":acog.throttle.retries,
+            "operations":acog.metrics.summary()["operations"],
+            "peakMB":round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)}
+
+
+def childArgs(args):  # the options a child process needs, as command-line flags
+    return ["--latency", str(args.latency), "--metadataLatency", str(args.metadataLatency),
+            "--throttle", str(args.throttle), "--workers", str(args.workers), "--quotaScale", str(args.quotaScale),
+            "--maxRetries", str(args.maxRetries)] + (
+           ["--cogQuotaScale", str(args.cogQuotaScale)] if args.cogQuotaScale else [])
+
+
+def change(new, old):
+    return "%+5.0f%%" % (100.0 * (new - old) / old) if old else "    -"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="offline acog.py throughput (fake cognito-idp + Metadata)")
+    parser.add_argument("--rows", default="1000,10000,100000", help="comma-separated row counts")
+    parser.add_argument("--scenarios", default=','.join(SCENARIOS), help="comma-separated, of: %s" % ', '.join(SCENARIOS))
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per cognito-idp call")
+    parser.add_argument("--metadataLatency", type=float, default=0.0, help="seconds per Metadata request")
+    parser.add_argument("--throttle", type=float, default=0.0, help="fraction of cognito-idp calls throttled at random")
+    parser.add_argument("--cogQuotaScale", type=float, default=None,
+                        help="fake enforces Cognito's per-category quotas x this (default: no quotas)")
+    parser.add_argument("--quotaScale", type=float, default=1000.0,
+                        help="acog's own limiter (as acog.py --quotaScale); default effectively off")
+    parser.add_argument("--maxRetries", type=int, default=6)
+    parser.add_argument("--json", help="write results to this file (for a later --baseline)")
+    parser.add_argument("--baseline", help="results file of a previous run to compare against")
+    parser.add_argument("--child", nargs=2, metavar=("SCENARIO", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(runScenario(args.child[0], int(args.child[1]), args)))
+        sys.exit(0)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {(r["scenario"], r["rows"]):r for r in json.load(f)["results"]}
+    print("%-16s %7s %10s %10s %8s %10s %7s" % ("scenario", "rows", "users/sec", "calls/user", "peak MB", "elapsed", "ok"))
+    results = []
+    for scenario in args.scenarios.split(','):
+        for rows in [int(n) for n in args.rows.split(',')]:
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", scenario, str(rows)] +
+                                   childArgs(args), stdout=subprocess.PIPE, universal_newlines=True, check=True)
+            r = json.loads(child.stdout.strip().splitlines()[-1])
+            results.append(r)
+            line = "%-16s %7s %10.0f %10.2f %8.1f %9.2fs %7s" % (scenario, rows, r["usersPerSec"], r["callsPerUser"],
+                                                              r["peakMB"], r["elapsed"], r["ok"])
+            old = baseline.get((scenario, rows))
+            if old:
+                line += "   vs baseline: users/sec %s  calls/user %s  peak %s" % (
+                        change(r["usersPerSec"], old["usersPerSec"]), change(r["callsPerUser"], old["callsPerUser"]),
+                        change(r["peakMB"], old["peakMB"]))
+            print(line, flush=True)
+
+    if args.json:
+        settings = {k:v for k, v in vars(args).items() if k not in ("json", "baseline", "child")}
+        with open(args.json, "w") as f:
+            json.dump({"when":time.strftime("%Y-%m-%dT%H:%M:%S"), "settings":settings, "results":results}, f, indent=1)
+        print("results: %s" % args.json)
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+
+# acog_standin.py -- local stand-ins for the services acog.py talks to, so it can be run and timed offline:
+#  - the Metadata booking API (HTTP; also runnable on its own):
+#      ./acog_standin.py --port 8080 --latency 0.2 &
+#      ./acog.py add-user COG-qa --file bookings.csv --prefetchMetadata --metadataUrl http://127.0.0.1:8080
+#    any 7-digit bookingId is "valid" (fake, but stable per bookingId); anything else gets the API's error shape
+#  - FakeCognito, an in-process cognito-idp client: AcogClient(..., client=FakeCognito()) (see acog_bench.py),
+#    including user import jobs (the pre-signed upload URL is a PUT to the HTTP stand-in, started on first use);
+#    AsyncFakeCognito is the same pool with coroutine methods, for acoglib.aio (--async)
+
+import argparse
+import asyncio
+import bisect
+import csv
+import datetime
+import http.server
+import json
+import random
+import re
+import sys
+import threading
+import time
+import types
+import uuid
+
+import botocore.exceptions
+import botocore.hooks
+
+from acoglib.throttle import COG_QUOTAS, COG_QUOTA_CATEGORIES
+
+
+def fakeBooking(bookingId):  # same shape as Metadata /api/booking/getdetails/<id> response
+    if not (bookingId.isnumeric() and len(bookingId) == 7):
+        return [{"BookingNo":None, "Details":"Invalid booking # %s" % bookingId}]
+    n = int(bookingId)
+    embark = datetime.date.today() + datetime.timedelta(days=30 + n % 300)
+    depart = embark - datetime.timedelta(days=1)
+    passengers = [{"paxnum":paxnum, "Title":"MS" if paxnum == 1 else "MR", "FirstName":"First%s" % paxnum,
+                   "MiddleName":"", "LastName":"Last%s" % bookingId, "Suffix":""}
+                  for paxnum in range(1, 2 + n % 2)]  # 1 or 2 pax
+    return [{"BookingNo":n, "BookingStatus":1, "Currency":"USD", "TourName":"Tour %s" % (n % 97),
+             "TourStatus":1, "EmbarkDate":embark.isoformat() + "T00:00:00",
+             "GuestDepartureDate":depart.isoformat() + "T00:00:00", "Office":"US",
+             "Passengers":passengers, "Pricing":{"Total":1000 + n % 5000}, "ExtensionDetails":{}}]
+
+
+class MetadataHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API behind its load balancer
+    disable_nagle_algorithm = True  # headers and body go out in separate writes: no 40ms delayed-ACK stall
+    latency = 0.0
+    counts = {"requests":0, "connections":0}
+    uploads = {}  # FakeCognito user import job Id: CSV bytes PUT to /import/<JobId>
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            self.counts["connections"] += 1
+
+    def do_GET(self):
+        prefix = "/api/booking/getdetails/"
+        with self.lock:
+            self.counts["requests"] += 1
+        if not self.path.startswith(prefix):
+            self.send_error(404)
+            return
+        time.sleep(self.latency)
+        body = json.dumps(fakeBooking(self.path[len(prefix):].strip('/'))).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):  # FakeCognito's pre-signed import URL
+        prefix = "/import/"
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.startswith(prefix):
+            self.send_error(404)
+            return
+        with self.lock:
+            self.uploads[self.path[len(prefix):]] = body
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):  # quiet unless -v
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(port=8080, latency=0.0, verbose=False):  # returns running server (call .shutdown() to stop)
+    MetadataHandler.latency = latency
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), MetadataHandler)
+    server.verbose = verbose
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class FakeCognito(object):
+    '''
+    in-process cognito-idp client with the admin/list calls acog uses, for benchmarks and offline runs
+      latency:       seconds slept per call (the network + service time)
+      quotaScale:    enforce Cognito's per-category request rates x quotaScale (None = unlimited);
+                     over-quota calls raise TooManyRequestsException like the real service
+      throttleRate:  extra random fraction of calls that raise TooManyRequestsException
+      importRate:    users/sec a started user import job creates (None = all at once)
+    calls: per-operation call counts (incl. throttled ones)
+    meta.events: emits botocore's before-parameter-build/after-call per call (metrics.Metrics.hookBotocore works)
+    '''
+    FILTER_RE = re.compile(r'^\s*([\w:]+)\s*(\^?=)\s*"([^"]*)"\s*$')
+
+    CSV_HEADER = ["name", "given_name", "family_name", "middle_name", "nickname", "preferred_username", "profile",
+                  "picture", "website", "email", "email_verified", "gender", "birthdate", "zoneinfo", "locale",
+                  "phone_number", "phone_number_verified", "address", "updated_at", "custom:booking",
+                  "custom:userType", "cognito:mfa_enabled", "cognito:username"]  # get_csv_header, as for our pools
+
+    def __init__(self, pools=None, latency=0.0, quotaScale=None, throttleRate=0.0, seed=None, importRate=None):
+        self.pools = pools if pools else {"COG-bench":"us-east-1_BENCH0001"}
+        self.latency = latency
+        self.quotaScale = quotaScale
+        self.throttleRate = throttleRate
+        self.importRate = importRate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.windows = {}  # quota category -> [window start, calls in window]
+        self.users = {}    # Username (GUID) -> list_users-shaped user
+        self.emails = []   # sorted (email, Username), for prefix/exact filters
+        self.lambdaConfig = {"PreSignUp":"arn:aws:lambda:us-east-1:000000000000:function:bench-presignup"}
+        self.meta = types.SimpleNamespace(events=botocore.hooks.HierarchicalEmitter())
+        self.local = threading.local()  # the call in progress on this thread: (event suffix, model, context)
+        self.jobs = {}     # user import JobId -> UserImportJob
+        self.importServer = None
+
+    def _call(self, op):
+        name = ''.join(word.title() for word in op.split('_'))  # AdminCreateUser, as botocore's model has it
+        self.local.call = ("cognito-idp.%s" % name, types.SimpleNamespace(name=name), {})
+        self.meta.events.emit("before-parameter-build." + self.local.call[0], model=self.local.call[1], params={},
+                              context=self.local.call[2])
+        with self.lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+            throttled = self.throttleRate and self.random.random() < self.throttleRate
+            if self.quotaScale:
+                category = COG_QUOTA_CATEGORIES.get(op, "Other")
+                now = time.monotonic()
+                window = self.windows.setdefault(category, [now, 0])
+                if now - window[0] >= 1.0:
+                    window[0], window[1] = now, 0
+                window[1] += 1
+                throttled = throttled or window[1] > COG_QUOTAS[category] * self.quotaScale
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            self._error(op, "TooManyRequestsException", "Too many requests")
+
+    def _afterCall(self, status, parsed):
+        event, model, context = self.local.call
+        self.meta.events.emit("after-call." + event, http_response=types.SimpleNamespace(status_code=status),
+                              parsed=parsed, model=model, context=context)
+
+    def _error(self, op, code, message):
+        parsed = {"Error":{"Code":code, "Message":message}, "ResponseMetadata":{"HTTPStatusCode":400}}
+        self._afterCall(400, parsed)
+        raise botocore.exceptions.ClientError(parsed, op)
+
+    def _ok(self, **response):
+        response["ResponseMetadata"] = {"HTTPStatusCode":200}
+        self._afterCall(200, response)
+        return response
+
+    def _copy(self, user):  # what a response holds: the caller may change it, but never our state
+        return dict(user, Attributes=[dict(a) for a in user["Attributes"]])
+
+    def _user(self, op, username):  # by GUID or email
+        user = self.users.get(username)
+        if user is None:
+            i = bisect.bisect_left(self.emails, (username.lower(), ''))
+            if i < len(self.emails) and self.emails[i][0] == username.lower():
+                user = self.users[self.emails[i][1]]
+        if user is None:
+            self._error(op, "UserNotFoundException", "User does not exist.")
+        return user
+
+    def _setAttributes(self, user, attributes):
+        merged = {a["Name"]:a["Value"] for a in user["Attributes"]}
+        merged.update({a["Name"]:a["Value"] for a in attributes})
+        user["Attributes"] = [{"Name":k, "Value":v} for k, v in merged.items()]
+        user["UserLastModifiedDate"] = datetime.datetime.now(datetime.timezone.utc)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~ pools ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def list_user_pools(self, MaxResults=60, NextToken=None):
+        self._call("list_user_pools")
+        pools = [{"Id":Id, "Name":name} for name, Id in sorted(self.pools.items())]
+        start = int(NextToken) if NextToken else 0
+        more = start + MaxResults < len(pools)
+        return self._ok(UserPools=pools[start:start + MaxResults], **({"NextToken":str(start + MaxResults)} if more else {}))
+
+    def describe_user_pool(self, UserPoolId):
+        self._call("describe_user_pool")
+        return self._ok(UserPool={"Id":UserPoolId, "LambdaConfig":dict(self.lambdaConfig),
+                                  "Policies":{"PasswordPolicy":{"MinimumLength":8}},
+                                  "AdminCreateUserConfig":{"AllowAdminCreateUserOnly":True},
+                                  "EstimatedNumberOfUsers":len(self.users)})
+
+    def update_user_pool(self, UserPoolId, LambdaConfig=None, **kwargs):
+        self._call("update_user_pool")
+        self.lambdaConfig = dict(LambdaConfig or {})
+        return self._ok()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~ users ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def admin_create_user(self, UserPoolId, Username, UserAttributes=(), TemporaryPassword=None,
+                          MessageAction=None, **kwargs):
+        self._call("admin_create_user")
+        email = Username.lower()
+        with self.lock:
+            i = bisect.bisect_left(self.emails, (email, ''))
+            if i < len(self.emails) and self.emails[i][0] == email:
+                self._error("admin_create_user", "UsernameExistsException",
+                            "An account with the given email already exists.")
+            user = self._insert(i, email, [a for a in UserAttributes if "Name" in a], "FORCE_CHANGE_PASSWORD")
+        return self._ok(User=self._copy(user))
+
+    def _insert(self, i, email, attributes, status):  # call with self.lock held; i: email's place in self.emails
+        guid = str(uuid.uuid4())
+        now = datetime.datetime.now(datetime.timezone.utc)
+        user = {"Username":guid, "Attributes":[{"Name":"sub", "Value":guid}], "UserCreateDate":now,
+                "UserLastModifiedDate":now, "Enabled":True, "UserStatus":status}
+        self._setAttributes(user, attributes)
+        self.users[guid] = user
+        self.emails.insert(i, (email, guid))
+        return user
+
+    def admin_get_user(self, UserPoolId, Username):
+        self._call("admin_get_user")
+        user = self._user("admin_get_user", Username)
+        return self._ok(Username=user["Username"], UserAttributes=[dict(a) for a in user["Attributes"]],
+                        **{k:user[k] for k in ("UserCreateDate", "UserLastModifiedDate", "Enabled", "UserStatus")})
+
+    def admin_update_user_attributes(self, UserPoolId, Username, UserAttributes):
+        self._call("admin_update_user_attributes")
+        with self.lock:
+            self._setAttributes(self._user("admin_update_user_attributes", Username), UserAttributes)
+        return self._ok()
+
+    def admin_initiate_auth(self, UserPoolId, ClientId, AuthFlow, AuthParameters):
+        self._call("admin_initiate_auth")
+        user = self._user("admin_initiate_auth", AuthParameters["USERNAME"])
+        if user["UserStatus"] == "FORCE_CHANGE_PASSWORD":
+            return self._ok(ChallengeName="NEW_PASSWORD_REQUIRED", Session="bench-session-" + user["Username"],
+                            ChallengeParameters={})
+        return self._ok(AuthenticationResult={"IdToken":"bench.token.%s" % user["Username"]})
+
+    def admin_respond_to_auth_challenge(self, UserPoolId, ClientId, ChallengeName, ChallengeResponses, Session=None):
+        self._call("admin_respond_to_auth_challenge")
+        with self.lock:
+            user = self._user("admin_respond_to_auth_challenge", ChallengeResponses["USERNAME"])
+            user["UserStatus"] = "CONFIRMED"
+        return self._ok(AuthenticationResult={"IdToken":"bench.token.%s" % user["Username"]})
+
+    def admin_set_user_password(self, UserPoolId, Username, Password, Permanent=False):
+        self._call("admin_set_user_password")
+        with self.lock:
+            user = self._user("admin_set_user_password", Username)
+            user["UserStatus"] = "CONFIRMED" if Permanent else "FORCE_CHANGE_PASSWORD"
+        return self._ok()
+
+    def admin_delete_user(self, UserPoolId, Username):
+        self._call("admin_delete_user")
+        with self.lock:
+            user = self._user("admin_delete_user", Username)
+            del self.users[user["Username"]]
+            email = next(a["Value"] for a in user["Attributes"] if a["Name"] == "email").lower()
+            self.emails.pop(bisect.bisect_left(self.emails, (email, user["Username"])))
+        return self._ok()
+
+    def list_users(self, UserPoolId, Filter=None, Limit=60, PaginationToken=None, AttributesToGet=None):
+        # email/username/sub = and ^= filters (email via the sorted index, others by scan); token = resume key
+        self._call("list_users")
+        match = self.FILTER_RE.match(Filter) if Filter else None
+        if Filter and not match:
+            self._error("list_users", "InvalidParameterException", "Error while parsing filter.")
+        with self.lock:
+            if match and match.group(1) == "email":
+                value = match.group(3).lower()
+                lo = bisect.bisect_left(self.emails, (value, ''))
+                hi = bisect.bisect_left(self.emails, (value + '\U0010ffff', '')) if match.group(2) == "^=" else \
+                     bisect.bisect_right(self.emails, (value, '\U0010ffff'))
+                if PaginationToken:
+                    lo = max(lo, bisect.bisect_right(self.emails, tuple(PaginationToken.split('\t', 1))))
+                keys = self.emails[lo:min(hi, lo + Limit + 1)]
+            else:
+                lo = bisect.bisect_right(self.emails, tuple(PaginationToken.split('\t', 1))) if PaginationToken else 0
+                keys = []
+                for key in self.emails[lo:]:
+                    user = self.users[key[1]]
+                    if match:
+                        name, op, value = match.groups()
+                        actual = user["Username"] if name == "username" else \
+                                 next((a["Value"] for a in user["Attributes"] if a["Name"] == name), '')
+                        if not (actual == value if op == "=" else actual.startswith(value)):
+                            continue
+                    keys.append(key)
+                    if len(keys) > Limit:
+                        break
+            page = [self._copy(self.users[guid]) for email, guid in keys[:Limit]]
+        if AttributesToGet:
+            for user in page:
+                user["Attributes"] = [a for a in user["Attributes"] if a["Name"] in AttributesToGet]
+        if len(keys) > Limit:
+            return self._ok(Users=page, PaginationToken="%s\t%s" % keys[Limit - 1])
+        return self._ok(Users=page)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~ user import jobs ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def get_csv_header(self, UserPoolId):
+        self._call("get_csv_header")
+        return self._ok(UserPoolId=UserPoolId, CSVHeader=list(self.CSV_HEADER))
+
+    def create_user_import_job(self, JobName, UserPoolId, CloudWatchLogsRoleArn):
+        self._call("create_user_import_job")
+        with self.lock:
+            if self.importServer is None:
+                self.importServer = serve(port=0)
+            jobId = "import-%s" % uuid.uuid4().hex[:10]
+            self.jobs[jobId] = {"JobName":JobName, "JobId":jobId, "UserPoolId":UserPoolId, "Status":"Created",
+                                "PreSignedUrl":"http://127.0.0.1:%s/import/%s" % (
+                                               self.importServer.server_address[1], jobId),
+                                "CreationDate":datetime.datetime.now(datetime.timezone.utc),
+                                "CloudWatchLogsRoleArn":CloudWatchLogsRoleArn,
+                                "ImportedUsers":0, "SkippedUsers":0, "FailedUsers":0}
+            return self._ok(UserImportJob=dict(self.jobs[jobId]))
+
+    def _job(self, op, JobId):
+        if JobId not in self.jobs:
+            self._error(op, "ResourceNotFoundException", "Import job %s not found." % JobId)
+        return self.jobs[JobId]
+
+    def start_user_import_job(self, UserPoolId, JobId):
+        self._call("start_user_import_job")
+        job = self._job("start_user_import_job", JobId)
+        if job["Status"] != "Created":
+            self._error("start_user_import_job", "PreconditionNotMetException", "Job is %s." % job["Status"])
+        job.update(Status="Pending", StartDate=datetime.datetime.now(datetime.timezone.utc))
+        threading.Thread(target=self._runImport, args=(job,), name="fake-import", daemon=True).start()
+        return self._ok(UserImportJob=dict(job))
+
+    def describe_user_import_job(self, UserPoolId, JobId):
+        self._call("describe_user_import_job")
+        return self._ok(UserImportJob=dict(self._job("describe_user_import_job", JobId)))
+
+    def stop_user_import_job(self, UserPoolId, JobId):
+        self._call("stop_user_import_job")
+        job = self._job("stop_user_import_job", JobId)
+        if job["Status"] in ("Pending", "InProgress"):
+            job["Status"] = "Stopping"
+        return self._ok(UserImportJob=dict(job))
+
+    def _runImport(self, job):  # the job's rows, as Cognito imports them: one user per row, RESET_REQUIRED
+        with MetadataHandler.lock:
+            body = MetadataHandler.uploads.pop(job["JobId"], None)
+        if body is None:
+            job.update(Status="Failed", CompletionMessage="The user import file was not uploaded.")
+            return
+        job["Status"] = "InProgress"
+        reader = csv.DictReader(body.decode("utf-8").splitlines())
+        if reader.fieldnames != self.CSV_HEADER:
+            job.update(Status="Failed", CompletionMessage="The CSV header does not match the user pool's.")
+            return
+        t0 = time.monotonic()
+        for n, row in enumerate(reader, start=1):
+            if job["Status"] == "Stopping":
+                job["Status"] = "Stopped"
+                return
+            email = (row["email"] or row["cognito:username"]).lower()
+            attributes = [{"Name":k, "Value":v} for k, v in row.items() if v and not k.startswith("cognito:")]
+            with self.lock:
+                i = bisect.bisect_left(self.emails, (email, ''))
+                if not row["cognito:username"] or row["cognito:mfa_enabled"] not in ("true", "false"):
+                    job["FailedUsers"] += 1
+                elif i < len(self.emails) and self.emails[i][0] == email:
+                    job["FailedUsers"] += 1  # "User already exists" in the job's CloudWatch log
+                else:
+                    self._insert(i, email, attributes, "RESET_REQUIRED")
+                    job["ImportedUsers"] += 1
+            if self.importRate:
+                time.sleep(max(0.0, n / self.importRate - (time.monotonic() - t0)))
+        job.update(Status="Succeeded", CompletionDate=datetime.datetime.now(datetime.timezone.utc),
+                   CompletionMessage="Import Job Completed Successfully.")
+
+
+class AsyncFakeCognito(object):
+    '''
+    FakeCognito for acoglib.aio: every API method is a coroutine, and the per-call latency is awaited
+    rather than slept, so thousands of in-flight calls share one thread as they would with aiobotocore.
+    .fake is the synchronous view of the same pool (for the AcogClient's own pool/app client lookups):
+
+        afake = AsyncFakeCognito(latency=0.05, pools={"COG-qa":[]})
+        acog = AcogClient(poolName="COG-qa", clientID="c", client=afake.fake, tokenCache=False)
+        stats = doAddUserRowsAsync(acog, rows, concurrency=2000, client=afake)
+    '''
+    def __init__(self, latency=0.0, **kwargs):  # kwargs: FakeCognito's (its own latency stays 0)
+        self.fake = FakeCognito(**kwargs)
+        self.latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self.fake, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        async def call(**kwargs):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return attr(**kwargs)
+        return call
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local stand-in for the Metadata booking API")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of delay per request")
+    parser.add_argument("--verbose", "-v", action="store_true")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.verbose)
+    print("Metadata stand-in on http://127.0.0.1:%s (latency %ss); Ctrl-C to stop" % (
+          server.server_address[1], args.latency), file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("served %(requests)s requests over %(connections)s connections" % MetadataHandler.counts,
+              file=sys.stderr)
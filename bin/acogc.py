@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# acogc.py -- thin client for "acog.py serve": forwards an acog.py command line to the warm daemon and streams
+# its output back; stdlib only (no boto3/requests import), so a command costs tens of milliseconds, not seconds
+#   ./acog.py serve --idle 1800 &                       # once per Jenkins job/agent
+#   export ACOG_SOCKET=~/.cache/acog/acog.sock          # acog.py now forwards by itself...
+#   ./acogc.py add-user 5399020 COG-qa --fast           # ...or call this directly
+# with no daemon listening (or for a run that needs this process: --file - reads our stdin, --suspend-triggers
+# handles our signals; or when our AWS_*/ACOG_*/proxy environment isn't the daemon's: its runs would use its
+# credentials, profile, region and cache dir, not ours) the command runs here, as plain acog.py
+
+import hashlib
+import json
+import os
+import socket
+import sys
+
+
+def socketPath():  # as acoglib.daemon.socketPath: $ACOG_SOCKET, else $ACOG_CACHE_DIR/acog.sock
+    return os.environ.get("ACOG_SOCKET") or os.path.join(
+           os.environ.get("ACOG_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "acog")), "acog.sock")
+
+
+ENV_NAMES = ("HTTP_PROXY", "HTTPS_PROXY", "NO_PROXY", "REQUESTS_CA_BUNDLE", "CURL_CA_BUNDLE")  # Metadata calls
+
+
+def forwardedEnv(environ):  # as acoglib.daemon.forwardedEnv: {name: digest} of what a run's result depends on
+    return {name:hashlib.sha256(value.encode("utf-8")).hexdigest()[:16] for name, value in environ.items()
+            if name.startswith(("AWS_", "ACOG_")) and name != "ACOG_SOCKET" or name.upper() in ENV_NAMES}
+
+
+def runsLocally(argv):  # True: argv can't be forwarded
+    for i, arg in enumerate(argv):
+        if arg.startswith("--suspend") or arg == "--file=-" or arg == "--file" and argv[i + 1:i + 2] == ['-']:
+            return True
+    return argv[:1] == ["serve"]
+
+
+def forward(argv, path=None):  # exit code of the daemon's run; None: no daemon there (or runsLocally)
+    if runsLocally(argv):
+        return None
+    conn = socket.socket(socket.AF_UNIX)
+    try:
+        conn.connect(path or socketPath())
+    except OSError:
+        conn.close()
+        return None
+    try:
+        with conn:
+            conn.sendall((json.dumps({"argv":argv, "cwd":os.getcwd(), "env":forwardedEnv(os.environ)}) +
+                          "\n").encode("utf-8"))
+            for line in conn.makefile("rb"):
+                message = json.loads(line)
+                if "env" in message:  # the daemon's environment differs: nothing ran there
+                    print("acog serve: not forwarded, the daemon's %s differ: running here" %
+                          "/".join(message["env"]), file=sys.stderr)
+                    return None
+                if "out" in message:
+                    sys.stdout.write(message["out"])
+                    sys.stdout.flush()
+                elif "err" in message:
+                    sys.stderr.write(message["err"])
+                    sys.stderr.flush()
+                elif "exit" in message:
+                    return message["exit"]
+    except KeyboardInterrupt:  # closing the connection stops the run (at its next line of output)
+        print("INTERRUPTED: Ctrl-C", file=sys.stderr)
+        return 130
+    print("ERROR: acog serve closed the connection mid-run", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    code = forward(sys.argv[1:])
+    if code is None:
+        os.environ.pop("ACOG_SOCKET", None)  # (asked already)
+        acog = os.path.join(os.path.dirname(os.path.abspath(__file__)), "acog.py")
+        os.execv(sys.executable, [sys.executable, acog] + sys.argv[1:])
+    sys.exit(code)
@@ -0,0 +1,16 @@
+# acoglib -- "Admin AWS Cognito" library behind bin/acog.py
+# import AcogClient to reuse warm boto3/Metadata clients across many operations in one process:
+#
+#   import sys; sys.path.insert(0, "/path/to/sandbox/bin")
+#   from acoglib import AcogClient
+#   acog = AcogClient(poolName="COG-qa")
+#   acog.doListUsers("5399020")
+
+from .bookingcache import BookingCache
+from .client import AcogClient, AcogError
+from .metadata import MetadataClient
+from .metrics import Metrics
+from .poolcache import PoolCache
+from .snapshot import PoolSnapshot
+from .throttle import CogThrottle, ThrottledClient
+from .tokencache import TokenCache
@@ -0,0 +1,294 @@
+# acoglib.aio -- add-user --file on asyncio (--async N): the doAddUser/doAddUserFast state machine as one
+# coroutine per user, so thousands of users can be in flight on one thread instead of one thread each
+# cognito-idp calls go through aiobotocore and Metadata lookups (--prefetchMetadata) through aiohttp, both
+# imported only when --async runs; every call still takes its token from the AcogClient's CogThrottle
+# (reserve: one sleep per call, however many users are queued) and follows its retry policy
+# each user gets --userTimeout seconds; rows are printed, journaled and tallied as they finish (any order)
+
+import asyncio
+import contextlib
+import logging
+import sys
+import time
+
+import botocore.config, botocore.exceptions
+
+from .client import AcogError
+from .defaults import FATAL_ERROR_CODE, USER_GUID_ERROR, defPass, defaultPaxArray, futureDate, nonConsumerUserTypes
+from .metadata import applyBooking, trimBooking
+from .throttle import cogConfig
+
+logger = logging.getLogger("acog")
+
+CHALLENGES = ("FORCE_CHANGE_PASSWORD", "NEW_PASSWORD_REQUIRED")  # answered with defPass, as doAddUser does
+
+
+def _aioModules():  # (aiobotocore.session, aiohttp), imported on first use
+    try:
+        import aiobotocore.session
+        import aiohttp
+    except ImportError as e:
+        raise AcogError("--async needs aiobotocore and aiohttp (%s): pip install aiobotocore aiohttp" % e)
+    return aiobotocore.session, aiohttp
+
+
+class AsyncCognito(object):
+    # async counterpart of ThrottledClient: await cog.call("admin_create_user", **kwargs), paced and
+    # retried by the (shared, thread-safe) CogThrottle; client: aiobotocore cognito-idp client or stand-in
+    def __init__(self, client, throttle):
+        self.client = client
+        self.throttle = throttle
+
+    async def call(self, op, **kwargs):
+        func = getattr(self.client, op)
+        for attempt in range(self.throttle.maxRetries + 1):
+            wait = self.throttle.reserve(op)
+            if wait:
+                try:
+                    await asyncio.sleep(wait)
+                except asyncio.CancelledError:  # (--userTimeout) the call never went out: nor does its token
+                    self.throttle.refund(op)
+                    raise
+            try:
+                r = await func(**kwargs)
+            except self.throttle.RETRY_ERRORS as e:
+                delay = self.throttle.retryDelay(op, attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            else:
+                self.throttle.adjust(op, throttled=False)
+                return r
+
+
+class AsyncMetadata(object):
+    # MetadataClient.fetchBooking over one aiohttp session; each bookingId is requested once per run
+    # (rows sharing a booking await the same task), through the MetadataClient's BookingCache if it has one
+    def __init__(self, metadata, session):
+        self.metadata = metadata  # MetadataClient: URLs, metrics and cache
+        self.session = session
+        self.bookings = {}  # bookingId: Task
+
+    def fetchBooking(self, bookingId):  # awaitable: trimmed booking dict, or None
+        if bookingId not in self.bookings:
+            self.bookings[bookingId] = asyncio.ensure_future(self._fetch(bookingId))
+        return asyncio.shield(self.bookings[bookingId])  # a timed-out row mustn't cancel it for the others
+
+    async def _fetch(self, bookingId):
+        cache = self.metadata.cache
+        if cache:
+            hit, booking = cache.get(self.metadata.host, bookingId)  # (small local file: not worth a thread)
+            if hit:
+                return booking
+        url = self.metadata.url(bookingId)
+        t = time.monotonic()
+        error = None
+        try:
+            async with self.session.get(url) as r:
+                error = "HTTP %s" % r.status if r.status >= 400 else None
+                r.raise_for_status()  # (never cache an outage)
+                booking = (await r.json(content_type=None))[0]
+        except Exception as e:
+            error = error or type(e).__name__
+            logger.warning("Metadata %s: %s" % (url, e))
+            return None
+        finally:
+            if self.metadata.metrics:
+                self.metadata.metrics.record("metadata", "getdetails", time.monotonic() - t, error)
+        booking = trimBooking(url, booking)
+        if cache:
+            cache.put(self.metadata.host, bookingId, booking)
+        return booking
+
+
+class AsyncUserFlow(object):
+    # one user's doAddUser (or, fast=True, doAddUserFast) as a coroutine: run(row) -> (result, note), result
+    # as doAddUser returns it (GUID, USER_GUID_ERROR, None, "FATAL_ERROR_CODE:...")
+    def __init__(self, acog, cog, meta=None, fast=False, defaultFirstName=None):
+        self.acog = acog
+        self.cog = cog
+        self.meta = meta
+        self.fast = fast
+        self.defaultFirstName = defaultFirstName
+        self.UserPoolId = acog.UserPoolId  # sync lookups (pool list, app client), once, before any user starts
+        self.clientID = None if fast else acog.clientID
+
+    def skipsPassword(self):  # CSA/AIR/TA users keep their challenge (doAddUser's --forceOldPass auto/n)
+        return self.acog.forceOldPass in ("auto", "n", "N", '0') and self.acog.userType.upper() in nonConsumerUserTypes
+
+    async def run(self, row):
+        if self.meta and str(row["un"]).isnumeric() and not row.get("paxArray"):
+            booking = await self.meta.fetchBooking(row["un"])
+            if booking:
+                applyBooking(row, booking, self.defaultFirstName)
+        dates = {k:str(v).split('T')[0] for k, v in (row["dates"] or {}).items()}
+        dates.setdefault("departureDate", futureDate)
+        dates.setdefault("embarkDate", futureDate)
+        paxArray = row.get("paxArray") or defaultPaxArray()
+        attributes = [{"Name":"email_verified", "Value":"true"}, {"Name":"custom:userType", "Value":self.acog.userType}]
+        userGUID, created = await self.createUser(row, dates, paxArray[0]["TourName"],
+                                                  attributes if self.fast else None)
+        if userGUID in (None, USER_GUID_ERROR) or FATAL_ERROR_CODE in userGUID:
+            return userGUID, "not created"
+        if not (self.fast and created):  # doAddUser step 2 (--fast: only for a prior user)
+            try:
+                await self.cog.call("admin_update_user_attributes", UserPoolId=self.UserPoolId, Username=userGUID,
+                                    UserAttributes=attributes)
+            except botocore.exceptions.ClientError as e:
+                logger.warning("WARN: AWS/boto3 exception: %s" % e)
+        if self.fast:
+            if not self.skipsPassword():
+                try:
+                    await self.setPassword(userGUID)
+                except botocore.exceptions.ClientError as e:
+                    logger.warning("WARN: AWS/boto3 exception: %s" % e)
+                    return USER_GUID_ERROR, "password not set"
+            return userGUID, "ADDED" if created else "PRIOR"
+        return await self.authenticate(userGUID, created)
+
+    async def createUser(self, row, dates, tourName, extraAttributes=None):
+        # AcogClient.adminCreateUser: (GUID or error code, created)
+        un = row["un"]
+        emailVal, attribs = self.acog.createAttributes(un, row["fName"], row["lName"], dates=dates, emailVal=row["email"],
+                                                       tourName=tourName, booking=un if str(un).isnumeric() else None,
+                                                       extraAttributes=extraAttributes)
+        snapshot = self.acog.snapshot
+        prior = snapshot.findUsername(emailVal) if snapshot else None
+        if prior:  # known user: skip the create (and its UsernameExists round-trips)
+            return prior, False
+        try:
+            r = await self.cog.call("admin_create_user", UserPoolId=self.UserPoolId, Username=emailVal,
+                                    TemporaryPassword=defPass, UserAttributes=list(attribs), MessageAction="SUPPRESS")
+        except botocore.exceptions.ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code in ("UserLambdaValidationException", "AccessDeniedException"):
+                logger.error("%s: %s %s" % (emailVal, code, e.response["Error"].get("Message")))
+                return "%s:%s" % (FATAL_ERROR_CODE, code), False
+            if code in ("InvalidParameterException", "UnexpectedLambdaException"):
+                logger.error("%s: %s (pool %s: toggle the Pre sign-up trigger?)" % (emailVal, e, self.UserPoolId))
+                return None, False
+            if code != "UsernameExistsException":
+                logger.warning("%s: %s" % (emailVal, e))
+                return USER_GUID_ERROR, False
+            retry = await self.cog.call("list_users", UserPoolId=self.UserPoolId, Filter='email ^= "%s"' % emailVal)
+            if snapshot and retry["Users"]:  # snapshot was stale
+                snapshot.put(retry["Users"][0])
+            return (retry["Users"][0]["Username"] if retry["Users"] else None), False
+        if snapshot:
+            snapshot.put(r["User"])
+        return r["User"]["Username"], True
+
+    async def setPassword(self, userGUID):
+        await self.cog.call("admin_set_user_password", UserPoolId=self.UserPoolId, Username=userGUID,
+                            Password=defPass, Permanent=True)
+        if self.acog.snapshot:
+            self.acog.snapshot.update(userGUID, status="CONFIRMED")
+
+    async def authenticate(self, userGUID, created):  # doAddUser steps 3 and 4: initiate-auth, respond-to-challenge
+        try:
+            r = await self.cog.call("admin_initiate_auth", UserPoolId=self.UserPoolId, ClientId=self.clientID,
+                                    AuthFlow="ADMIN_NO_SRP_AUTH",
+                                    AuthParameters={"USERNAME":userGUID, "PASSWORD":defPass})
+        except botocore.exceptions.ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code == "NotAuthorizedException" or code == "UserLambdaValidationException" and not self.skipsPassword():
+                await self.setPassword(userGUID)  # (the COR-316 workaround, for the Lambda case)
+                return userGUID, "PRIOR" if code == "NotAuthorizedException" else "ADDED (set password)"
+            if code == "UserLambdaValidationException":
+                return userGUID, "ADDED (userType %s, challenge kept)" % self.acog.userType
+            logger.warning("%s: %s" % (userGUID, e))
+            return USER_GUID_ERROR, "initiate-auth failed"
+        challenge = r.get("ChallengeName")
+        if challenge is None:
+            return userGUID, "ADDED" if created else "PRIOR"
+        if self.skipsPassword():
+            return userGUID, "ADDED (userType %s, challenge %s kept)" % (self.acog.userType, challenge)
+        if self.acog.forceOldPass in ("auto", "y", "Y", '1') and r.get("Session") and challenge in CHALLENGES:
+            await self.cog.call("admin_respond_to_auth_challenge", UserPoolId=self.UserPoolId, ClientId=self.clientID,
+                                Session=r["Session"], ChallengeName=challenge,
+                                ChallengeResponses={"USERNAME":userGUID, "NEW_PASSWORD":defPass})
+            if self.acog.snapshot:
+                self.acog.snapshot.update(userGUID, status="CONFIRMED")
+            return userGUID, "ADDED"
+        return userGUID, "PRIOR" if challenge in CHALLENGES else "MUNGED (challenge %s)" % challenge
+
+
+async def _addUserRows(flow, rows, concurrency, timeout, journal, stats, out):
+    pending = set()
+
+    async def addRow(row):
+        t = time.time()
+        r, note = USER_GUID_ERROR, "ERROR"
+        try:
+            r, note = await asyncio.wait_for(flow.run(row), timeout)
+        except asyncio.TimeoutError:
+            note = "TIMEOUT after %ss (--userTimeout)" % timeout
+        except Exception as e:  # one bad row should not take down the other users
+            note = "ERROR %s exception: %s" % (type(e).__name__, e)
+        secs = time.time() - t
+        stats["rowSecs"].append(secs)
+        if journal:
+            journal.record(row, r, secs)
+        stats["rows"] += 1
+        if flow.acog.metrics:
+            flow.acog.metrics.count("rows")
+        if r in (None, USER_GUID_ERROR):
+            stats["errors"] += 1
+        elif FATAL_ERROR_CODE in r:
+            stats["fatal"] += 1
+        else:
+            stats["ok"] += 1
+            if flow.fast:
+                stats["guids"].append(r)
+        print("  %s. %s: %s %s (%.2fs)" % (row.get("rowNum", '-'), row["un"], note, r, secs), file=out)
+
+    try:
+        for row in rows:
+            pending.add(asyncio.ensure_future(addRow(row)))
+            if len(pending) >= concurrency:  # bound users in flight (and rows read ahead)
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if pending:
+            await asyncio.wait(pending)
+    except BaseException:  # Ctrl-C/SIGTERM: abandon the in-flight users
+        for task in pending:
+            task.cancel()
+        raise
+
+
+async def _run(acog, rows, concurrency, timeout, journal, fast, metadata, defaultFirstName, client, http, stats, out):
+    if acog.metrics:
+        acog.metrics.activate()  # (this thread is the only one making calls)
+    async with contextlib.AsyncExitStack() as stack:
+        if client is None or metadata and http is None:
+            aioSession, aiohttp = _aioModules()
+        if client is None:
+            acog.session  # credentials/SSO problems surface as AcogError, as for every other action
+            session = aioSession.AioSession(profile=None if acog.profile == "default" else acog.profile)
+            config = cogConfig().merge(botocore.config.Config(max_pool_connections=min(concurrency, 200)))
+            client = await stack.enter_async_context(session.create_client("cognito-idp", region_name=acog.region,
+                                                                           config=config))
+            if acog.metrics:
+                acog.metrics.hookBotocore(client)
+        if metadata and http is None:
+            http = await stack.enter_async_context(aiohttp.ClientSession(
+                   timeout=aiohttp.ClientTimeout(total=9), connector=aiohttp.TCPConnector(limit=acog.metadataWorkers)))
+        meta = AsyncMetadata(acog.metadata, http) if metadata else None
+        flow = AsyncUserFlow(acog, AsyncCognito(client, acog.throttle), meta=meta, fast=fast,
+                             defaultFirstName=defaultFirstName)
+        await _addUserRows(flow, rows, concurrency, timeout, journal, stats, out)
+
+
+def doAddUserRowsAsync(acog, rows, concurrency=1000, timeout=120.0, journal=None, fast=False, metadata=False,
+                       defaultFirstName=None, client=None, http=None, out=None):
+    # batch.doAddUserRows on one asyncio loop, up to concurrency users in flight; same stats dict
+    # metadata: look each numeric row's booking up first (aiohttp; what --prefetchMetadata does for threads)
+    # client/http: async cognito-idp client and aiohttp-style session to use instead of creating them
+    out = out if out else sys.stdout
+    stats = {"rows":0, "ok":0, "errors":0, "fatal":0, "elapsed":0.0, "rowSecs":[], "guids":[]}
+    t0 = time.time()
+    try:
+        asyncio.run(_run(acog, rows, concurrency, timeout, journal, fast, metadata, defaultFirstName, client, http,
+                         stats, out))
+    finally:
+        stats["elapsed"] = time.time() - t0
+    return stats
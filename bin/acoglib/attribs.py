@@ -0,0 +1,130 @@
+# acoglib.attribs -- add-attribs --file: set attributes on many users in one run
+# rows are (email or bookingId, attribute name, value); every GUID is resolved up front in bulk (one projected
+# list_users pass when that is cheaper than a lookup per key, else concurrent lookups; the --use-snapshot
+# index answers either way with no calls), then each user's rows become one admin_update_user_attributes,
+# run concurrently under the shared CogThrottle; one result record per row goes to the results file
+
+import bisect
+import concurrent.futures
+import csv
+import io
+import itertools
+import sys
+import time
+
+from .batch import SNIFF_BYTES, openRows, runBounded, sniffDelimiter
+from .records import userAttribute
+
+OK, NOT_FOUND, ERROR, MALFORMED = "ok", "not-found", "error", "malformed"
+RESULT_FIELDS = ["rowNum", "key", "attribute", "value", "guid", "status", "error"]
+HEADER_NAMES = ("attribute", "attrib_name", "name")  # a 2nd column heading like these marks a header line
+
+
+def readAttribRows(path, name=None, value=None, verbose=0):
+    # generator of {"rowNum", "key", "attribute", "value"} from CSV/TSV ('-' = stdin, *.gz ok);
+    # rows with only a key column take name/value (--attrib_name/--attrib_val); bad lines get "error"
+    with openRows(path) as f:
+        sample = f.read(SNIFF_BYTES)
+        sample += f.readline()
+        delimiter = sniffDelimiter(sample, verbose)
+        reader = csv.reader(itertools.chain(io.StringIO(sample), f), delimiter=delimiter)
+        for rowNum, values in enumerate(reader, start=1):
+            values = [v.strip() for v in values]
+            if not values or not values[0] or values[0].startswith('#'):
+                continue
+            if rowNum == 1 and len(values) > 1 and values[1].lower() in HEADER_NAMES:
+                continue
+            row = {"rowNum":rowNum, "key":values[0], "attribute":name, "value":value}
+            if len(values) >= 3:
+                row["attribute"], row["value"] = values[1], delimiter.join(values[2:])  # unquoted JSON, say
+            if not row["attribute"] or row["value"] is None or not ('@' in row["key"] or row["key"].isnumeric()):
+                row["error"] = "want: email or bookingId, attribute, value"
+            yield row
+
+
+def _sub(user):
+    return userAttribute(user, "sub", user.get("Username"))
+
+
+def _exact(key):  # an email matches exactly; a bookingId (or "<bookingId>@") is an email prefix
+    return '@' in key and not key.endswith('@')
+
+
+def resolveGUIDs(acog, keys, workers=8, pageSize=60):
+    # {key: GUID or None}; an email key must match exactly (case-insensitively), a bookingId key
+    # matches the first email starting with it (as findUserGUID / single add-attribs does)
+    keys = set(keys)
+    if not keys:
+        return {}
+    estimate = None if acog.snapshot else acog.getUserPoolConfiguration()["UserPool"].get("EstimatedNumberOfUsers")
+    if estimate is not None and estimate / pageSize <= len(keys):  # one pass over the pool is fewer calls
+        users = acog.iterUsers(attributes=["email", "sub"], pageSize=pageSize)
+        emails = sorted((userAttribute(user, "email").lower(), _sub(user)) for user in users
+                        if userAttribute(user, "email"))
+        return {key:_match(emails, key) for key in keys}
+
+    def lookup(key):
+        Filter = ('email = "%s"' if _exact(key) else 'email ^= "%s"') % key
+        for user in acog.queryUsers(Filter=Filter, attributes=["email", "sub"]):
+            return _sub(user)
+        return None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(keys, pool.map(lookup, list(keys))))
+
+
+def _match(emails, key):  # emails: sorted (email, sub)
+    key = key.lower()
+    i = bisect.bisect_left(emails, (key, ''))
+    if i < len(emails) and (emails[i][0] == key or not _exact(key) and emails[i][0].startswith(key)):
+        return emails[i][1]
+    return None
+
+
+def addAttribRows(acog, rows, workers=8, writer=None):
+    # rows from readAttribRows; writer: records.RecordWriter (RESULT_FIELDS) for per-row results
+    # returns {"rows", "users", "ok", "notFound", "errors", "malformed", "elapsed", "resolveSecs"}
+    stats = {"rows":0, "users":0, "ok":0, "notFound":0, "errors":0, "malformed":0, "elapsed":0.0, "resolveSecs":0.0}
+    t0 = time.time()
+    rows = list(rows)
+    guids = resolveGUIDs(acog, [row["key"] for row in rows if "error" not in row], workers=workers)
+    stats["resolveSecs"] = time.time() - t0
+
+    def result(row, status, guid=None, error=None):
+        stats["rows"] += 1
+        stats[{OK:"ok", NOT_FOUND:"notFound", ERROR:"errors", MALFORMED:"malformed"}[status]] += 1
+        if acog.metrics:
+            acog.metrics.count("rows")
+        if writer:
+            writer.write(dict(row, guid=guid, status=status, error=error))
+
+    users = {}  # GUID -> its rows, in file order (one update call per user; a repeated attribute: last wins)
+    for row in rows:
+        guid = guids.get(row["key"])
+        if "error" in row:
+            result(row, MALFORMED, error=row.pop("error"))
+        elif guid is None:
+            result(row, NOT_FOUND, error="no user for %s" % row["key"])
+        else:
+            users.setdefault(guid, []).append(row)
+    stats["users"] = len(users)
+
+    def update(guid, userRows):
+        attributes = {row["attribute"]:row["value"] for row in userRows}
+        acog.doAddAttribs(Username=guid, UserAttributes=[{"Name":k, "Value":v} for k, v in attributes.items()])
+
+    def finish(guid, future):
+        try:
+            future.result()
+        except Exception as e:  # e.g. InvalidParameterException for an unknown attribute
+            print("ERROR: %s: %s: %s" % (guid, type(e).__name__, e), file=sys.stderr)
+            for row in users[guid]:
+                result(row, ERROR, guid, "%s: %s" % (type(e).__name__, e))
+        else:
+            for row in users[guid]:
+                result(row, OK, guid)
+        if writer:
+            writer.out.flush()
+
+    runBounded(update, ((guid, (guid, userRows)) for guid, userRows in users.items()), finish, workers=workers)
+    stats["elapsed"] = time.time() - t0
+    return stats
@@ -0,0 +1,295 @@
+# acoglib.batch -- add-user --file engine: CSV/TSV row reader and the concurrent (--workers) runner
+
+import collections
+import concurrent.futures
+import csv
+import gzip
+import io
+import itertools
+import sys
+import threading
+import time
+
+from .defaults import FATAL_ERROR_CODE, USER_GUID_ERROR, defEmail, nonConsumerUserTypes
+from .journal import rowKey
+from .shard import hashLines
+
+
+# header aliases per row field, in priority order (first one present in the header wins);
+# field names via Sales or Pax tables, or abbreviated --all matched case-insensitively
+FIELD_ALIASES = {
+    "bookingId":     ("invoice", "bookingid", "invoiceno", "bookingno", "invoicebooking", "booking"),  # QA-4778
+    "embarkDate":    ("fromdate", "fmdate", "from", "embkdate", "embarkdate", "embark"),
+    "departureDate": ("depart", "departuredate", "end", "to", "todate", "departdate", "enddate"),
+    "fName":         ("fname", "firstname", "fname1", "fname2"),
+    "lName":         ("lname", "lastname", "lname1", "lname2"),
+}
+SNIFF_BYTES = 65536  # delimiter detection sample (completed to a whole line)
+
+
+def openRows(path):  # text stream for a --file: '-' = stdin, *.gz = gzip (both streamed, never materialised)
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding='utf-8-sig', newline='')
+    return open(path, newline='', encoding='utf-8-sig')
+
+
+def sniffDelimiter(sample, verbose=0):
+    try:
+      dialect = csv.Sniffer().sniff(sample,delimiters=', \t')  # auto-detect TSV,CSV
+      delimiter = dialect.delimiter
+      if ',' in sample:  # sometimes sniffer guesses wrong on cosmetic space-padding
+        delimiter = ','
+    except Exception as e:
+      print("WARN: Exception csv.Sniffer: %s" % (e))
+      if ',' in sample:
+        print("  OK: deduced comma delimiter")
+        delimiter = ','
+      elif '\t' in sample:
+        print("  OK: deduced TAB delimiter")
+        delimiter = '\t'
+      else:
+        print("WARN: could not deduce delimiter, so forcing to TAB!")
+        delimiter = '\t'
+    if verbose:
+        print("DEBUG: dialect.delimiter: '%s'" % (delimiter))
+    return delimiter
+
+
+def compileHeader(header):
+    # {field: column index or None} from the heading line, resolved once for the whole file
+    columns = {}
+    for i, fieldname in enumerate(header):
+        field = fieldname.strip(" \ufeff").lower()  # normalize lowercase to ease matching
+        if len(field) > 1:  # skip empty field/headings
+            columns.setdefault(field, i)
+    return {name:next((columns[alias] for alias in aliases if alias in columns), None)
+            for name, aliases in FIELD_ALIASES.items()}
+
+
+def rangeLines(path, start, end):  # lines of an uncompressed file that start in byte range [start, end)
+    with open(path, "rb") as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            line = f.readline()
+            if not line:
+                return
+            pos += len(line)
+            yield line.decode("utf-8")
+
+
+def readUserRows(path, firstName, lastName, email=defEmail, userType="Consumer", verbose=0, echo=True,
+                 byteRange=None, shard=None):
+    # generator of add-user rows from CSV/TSV file ('-' = stdin, *.gz ok), one dict per valid line
+    # (malformed lines are skipped); firstName/lastName: defaults for rows without name columns;
+    # email: address/template for non-Consumer rows; echo=False skips the per-row "file fields" line
+    # byteRange: (start, end, rowNum) of the data lines to read and the first one's row number (acoglib.shard),
+    # the heading is still the file's first line; shard: (shard, shards), only the rows whose bookingId hashes
+    # to it (the others are dropped as raw lines, see acoglib.shard.hashLines)
+    print("Require at least 4 headers like this in CSV/TAB-delimited file:\n	INVOICE,LNAME,FNAME,DEPART (any order)",file=sys.stderr)
+    with openRows(path) as tsvfile:
+      sample = tsvfile.read(SNIFF_BYTES)
+      sample += tsvfile.readline()  # whole last line
+      delimiter = sniffDelimiter(sample, verbose)
+
+      lines = itertools.chain(io.StringIO(sample), tsvfile)
+      plan = compileHeader(next(csv.reader(lines, delimiter=delimiter), []))
+      if byteRange:
+          lines = rangeLines(path, byteRange[0], byteRange[1])
+      start = byteRange[2] if byteRange else 1
+      if shard:
+          reader = hashLines(lines, plan["bookingId"], delimiter, shard[0], shard[1], start=start)
+      else:
+          reader = enumerate(csv.reader(lines, delimiter=delimiter), start=start)
+      if verbose:
+          print("DEBUG: column plan: %s" % (plan))
+      consumer = "MER" in userType.upper()
+      nonConsumer = userType in nonConsumerUserTypes
+
+      def column(name, default):
+          i = plan[name]
+          if i is None:
+              return lambda values: default
+          return lambda values: values[i].strip() if i < len(values) else default
+      getBooking = column("bookingId", '%s')  # magically handle userType AIR emails
+      getEmbark = column("embarkDate", '2020-05-04')  # NOTE: silly Star Wars day default
+      getDepart = column("departureDate", None)  # NOTE: defaults to embarkDate
+      getFName = column("fName", firstName)
+      getLName = column("lName", lastName)
+
+      for rowNum, values in reader:
+        bookingId = getBooking(values)
+        embarkDate = getEmbark(values)
+        departureDate = getDepart(values)
+        departureDate = embarkDate if departureDate is None else departureDate
+        fName = getFName(values)
+        lName = getLName(values)
+        if echo:
+          print("%s. file fields: %s" % (rowNum,
+            [ bookingId, fName, lName, departureDate, embarkDate]),end='',file=sys.stderr)
+
+        if bookingId.isnumeric() and int(bookingId) > 999999 or nonConsumer:
+          rowEmail = defEmail % bookingId if consumer else email
+          if echo:
+            print(" (ok)",file=sys.stderr)
+          if verbose:
+            print("\nDEBUG: emailVal: %s (pre call doAddUser)\n" % rowEmail,end='')
+          row = {"rowNum":rowNum, "un":bookingId, "email":rowEmail, "fName":fName, "lName":lName,
+                 "dates":{"departureDate":departureDate,"embarkDate":embarkDate}}
+          row["key"] = rowKey(row)  # (journal identity, before Metadata fills in names)
+          yield row
+        elif echo:
+          print(" WARN: (skipping comment/cosmetic/empty/header/malformed line)",file=sys.stderr)
+
+
+class RowOutput(object):
+    # sys.stdout stand-in: each --workers thread prints into its own buffer,
+    # so concurrent rows can be emitted whole and in file order (see rowOutput)
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buf = getattr(self.local, "buf", None)
+        return (buf if buf is not None else self.stream).write(text)
+
+    def flush(self):
+        if getattr(self.local, "buf", None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):  # isatty, encoding, etc.
+        return getattr(self.stream, name)
+
+    def capture(self, func, **kwargs):  # returns (func result, printed text)
+        self.local.buf = io.StringIO()
+        try:
+            r = func(**kwargs)
+        except Exception as e:  # one bad row should not take down the other workers
+            print("ERROR: %s exception: %s" % (type(e).__name__, e))
+            r = USER_GUID_ERROR
+        finally:
+            text = self.local.buf.getvalue()
+            self.local.buf = None
+        return r, text
+
+
+_rowOutputLock = threading.Lock()
+
+
+def rowOutput():
+    # the process's RowOutput: installed over sys.stdout on first use and left there (outside capture it
+    # writes straight through), never swapped back, so concurrent runs (acog.py serve) can't remove each
+    # other's; buffers are per thread, and each run writes its rows to its own stream (acoglib.daemon)
+    with _rowOutputLock:
+        if not isinstance(sys.stdout, RowOutput):
+            sys.stdout = RowOutput(sys.stdout)
+        return sys.stdout
+
+
+def doAddUserRows(acog, rows, workers=1, journal=None, fast=False):
+    # AcogClient.doAddUser per row (from readUserRows); with workers > 1 the whole per-user pipeline
+    # (create, attributes, initiate-auth, respond-to-challenge, verify) runs in a bounded thread pool,
+    # but each row's output is still printed in file order
+    # journal: optional journal.RowJournal, written as each row finishes (before its output is flushed)
+    # fast: AcogClient.doAddUserFast per row (no per-row list-users; stats["guids"] for verifyUsers)
+    stats = {"rows":0, "ok":0, "errors":0, "fatal":0, "elapsed":0.0, "rowSecs":[], "guids":[]}
+    addUser = acog.doAddUserFast if fast else acog.doAddUser
+    t0 = time.time()
+
+    def rowArgs(row):
+        kwargs = {"un":row["un"], "fName":row["fName"], "lName":row["lName"], "dates":row["dates"],
+                  "email":row["email"], "paxArray":row.get("paxArray")}
+        if not fast:
+            kwargs["listMetadata"] = False
+        return kwargs
+
+    def addRow(row):
+        t = time.time()
+        r = USER_GUID_ERROR
+        try:
+            r = addUser(**rowArgs(row))
+            return r
+        finally:
+            stats["rowSecs"].append(time.time() - t)
+            if journal:
+                journal.record(row, r, stats["rowSecs"][-1])
+
+    def tally(row, r):
+        stats["rows"] += 1
+        if acog.metrics:
+            acog.metrics.count("rows")
+        if r == USER_GUID_ERROR:
+            print("ERROR: USER_GUID_ERROR")
+            stats["errors"] += 1  # don't make this fatal--continue loop-processing
+        elif r is None:
+            stats["errors"] += 1
+        elif FATAL_ERROR_CODE in r:
+            stats["fatal"] += 1
+        else:
+            stats["ok"] += 1
+            if fast:
+                stats["guids"].append(r)
+
+    def flush(row, future):  # print one finished row
+        r, text = future.result()
+        out.stream.write(text)
+        tally(row, r)
+
+    if workers <= 1:
+        for row in rows:
+            tally(row, addRow(row))
+    else:
+        out = rowOutput()
+        pending = collections.deque()  # (row, future) in file order
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            try:
+                for row in rows:
+                    pending.append((row, pool.submit(out.capture, addRow, row=row)))
+                    while len(pending) > workers * 4:  # bound rows in flight/buffered
+                        flush(*pending.popleft())
+                while pending:
+                    flush(*pending.popleft())
+            except BaseException:  # Ctrl-C/SIGTERM/fatal: cancel the queued rows before the pool's exit
+                for row, future in pending:  # waits, so only in-flight ones drain
+                    future.cancel()
+                raise
+
+    stats["elapsed"] = time.time() - t0
+    return stats
+
+
+def runBounded(func, items, finish, workers=8):
+    # func(*args) for each (key, args) of items on a pool of workers threads, at most workers * 4 submitted
+    # and unfinished (so huge inputs stream); finish(key, future) on this thread, in completion order
+    # Ctrl-C/SIGTERM (or an exception from items/finish): the queued calls are cancelled before the pool's
+    # exit waits, so only in-flight ones drain
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}  # future -> key
+        try:
+            for key, args in items:
+                pending[pool.submit(func, *args)] = key
+                if len(pending) >= workers * 4:
+                    done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        finish(pending.pop(future), future)
+            for future in concurrent.futures.as_completed(list(pending)):
+                finish(pending.pop(future), future)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+
+def mergeStats(a, b):  # doAddUserRows stats of two consecutive runs over one file
+    return {k:(a[k] + b[k]) for k in a}
+
+
+def latencySummary(secs, percentiles=(50, 95)):  # "mean/p50/p95" of per-row seconds (stats["rowSecs"])
+    if not secs:
+        return "n/a"
+    secs = sorted(secs)
+    pct = lambda p: secs[min(len(secs) - 1, int(p / 100.0 * len(secs)))]
+    return "mean %.2fs %s over %s users" % (sum(secs) / len(secs),
+           ' '.join("p%s %.2fs" % (p, pct(p)) for p in percentiles), len(secs))
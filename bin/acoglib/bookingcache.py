@@ -0,0 +1,67 @@
+# acoglib.bookingcache -- on-disk TTL cache of Metadata bookings (test invoices rarely change within a day)
+# one JSON file per (Metadata host, bookingId) under $ACOG_CACHE_DIR/bookings/<host>/, holding the trimmed
+# booking (metadata.BOOKING_KEYS), or null for an invalid booking: a negative entry, kept for negativeTtl;
+# API/network errors are never cached. Files are replaced atomically, so parallel runs (and --shards) share it
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from .poolcache import defaultCacheDir
+
+logger = logging.getLogger("acog")
+
+
+class BookingCache(object):
+    # refresh=True (--refresh): every lookup misses, and the live answer is written back
+    def __init__(self, cacheDir=None, ttl=86400, negativeTtl=3600, refresh=False):
+        self.dir = os.path.join(cacheDir or defaultCacheDir(), "bookings")
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        self.refresh = refresh
+        self.stats = {"hits":0, "invalid":0, "misses":0, "writes":0}  # invalid: hits on a negative entry
+        self.lock = threading.Lock()  # stats only; entries are whole-file replaces
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def path(self, host, bookingId):
+        return os.path.join(self.dir, re.sub(r"[^\w.-]", "_", host), "%s.json" % re.sub(r"[^\w.-]", "_", str(bookingId)))
+
+    def get(self, host, bookingId):  # (True, booking or None if invalid) for a fresh entry, else (False, None)
+        if not self.refresh:
+            try:
+                with open(self.path(host, bookingId)) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = None
+            if entry and time.time() - entry["cachedAt"] < (self.ttl if entry["booking"] else self.negativeTtl):
+                self._count("hits" if entry["booking"] else "invalid")
+                return True, entry["booking"]
+        self._count("misses")
+        return False, None
+
+    def put(self, host, bookingId, booking):  # booking: trimmed dict, or None for "invalid booking #"
+        path = self.path(host, bookingId)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = "%s.%s.%s.tmp" % (path, os.getpid(), threading.get_ident())
+            with open(tmp, "w") as f:
+                json.dump({"cachedAt":time.time(), "booking":booking}, f)
+            os.replace(tmp, path)
+            self._count("writes")
+        except OSError as e:
+            logger.warning("could not write Metadata cache %s: %s" % (path, e))
+
+    def add(self, stats):  # another process's stats (acoglib.shard)
+        with self.lock:
+            for name, n in stats.items():
+                self.stats[name] = self.stats.get(name, 0) + n
+
+    def report(self):
+        return "metadata cache: %(hits)s hits, %(invalid)s invalid-booking hits, %(misses)s misses, " \
+               "%(writes)s written" % self.stats + " (%s)" % self.dir
@@ -0,0 +1,678 @@
+# acoglib.client -- AcogClient, the importable engine behind acog.py ("Admin AWS Cognito")
+
+import concurrent.futures
+import json
+import logging
+import threading
+
+import boto3, botocore, botocore.exceptions
+
+from .defaults import (AWS_DEFAULT_REGION, FATAL_ERROR_CODE, MATCH_FROM_POOL, Metadata, USER_GUID_ERROR,
+                       clientIDs, defEmail, defPass, def_pool_name, defaultPaxArray, futureDate,
+                       nonConsumerUserTypes, userPoolConfigAttribs_base)
+from .bookingcache import BookingCache
+from .metadata import MetadataClient
+from .poolcache import PoolCache
+from .throttle import CogThrottle, ThrottledClient, cogConfig
+from .tokencache import TokenCache
+
+logger = logging.getLogger("acog")
+
+
+class AcogError(Exception):
+    # fatal setup error: credentials/SSO, pool not found, etc. (acog.py prints it and exits 1)
+    pass
+
+
+class AcogClient(object):
+    '''
+    Cognito admin helper for one user pool. Nothing talks to AWS until first use: the boto3 session,
+    cognito-idp client, pool list/Id, clientID and Metadata connection pool are created lazily, then
+    reused (thread-safe), so one warm client can serve thousands of operations in a process.
+
+        acog = AcogClient(poolName="COG-qa", profile="qa")
+        userGUID = acog.doAddUser("5399020", fName="approve", lName="always")
+        idToken = acog.generateIdToken("5399020@test.com")
+    '''
+
+    def __init__(self, poolName=def_pool_name, profile="default", region=AWS_DEFAULT_REGION,
+                 clientID=MATCH_FROM_POOL, userType="Consumer", forceOldPass="auto",
+                 allowUpperCaseEmail=False, verbose=0, metadataUrl=None, metadataWorkers=8,
+                 quotaScale=0.9, maxRetries=6, cacheTtl=86400, refreshCache=False, throttle=None,
+                 snapshot=None, tokenCache=True, client=None, metrics=None, metadataCache=True):
+        self.poolName = poolName
+        self.profile = profile
+        self.region = region
+        self.clientIDArg = clientID
+        self.userType = userType
+        self.forceOldPass = forceOldPass
+        self.allowUpperCaseEmail = allowUpperCaseEmail
+        self.verbose = verbose
+        self.metadataUrl = metadataUrl
+        self.metadataWorkers = metadataWorkers
+        self.throttle = throttle if throttle else CogThrottle(scale=quotaScale, maxRetries=maxRetries)
+        self.poolCache = PoolCache(profile, region, ttl=cacheTtl, refresh=refreshCache)
+        self.snapshot = snapshot  # optional snapshot.PoolSnapshot answering lookups locally (--use-snapshot)
+        self.tokenCache = TokenCache() if tokenCache is True else tokenCache  # None/False: SRP every time
+        self.metadataCache = BookingCache() if metadataCache is True else metadataCache  # None/False: always GET
+        self.metrics = metrics  # optional metrics.Metrics: every cognito-idp/Metadata call timed
+        self.throttle.metrics = metrics
+        self.user_count = 0
+        self.lock = threading.RLock()
+        self.lazy = {}
+        if client is not None:  # preconfigured cognito-idp client (e.g. acog_standin.FakeCognito): no AWS session
+            self.lazy["cog_client"] = self._throttledClient(client)
+
+    def _lazy(self, name, create):  # create-once (under lock), then lock-free reads
+        if name not in self.lazy:
+            with self.lock:
+                if name not in self.lazy:
+                    self.lazy[name] = create()
+        return self.lazy[name]
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~ lazily-initialised AWS/pool state ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    @property
+    def session(self):
+        return self._lazy("session", self._createSession)
+
+    def _createSession(self):
+        try:  # initial AWS/boto3 call to see if AWS can auth/connect using current profile
+            if self.profile == "default":
+                sesh = boto3.Session(region_name=self.region)  # auto-sense AWS credentials from env/files
+                logger.info("default profile --region %s" % self.region)  # DEBUG/VERBOSE
+            else:
+                sesh = boto3.Session(region_name=self.region,profile_name=self.profile)
+                logger.info(" --profile %s --region %s" % (self.profile,self.region))  # DEBUG/VERBOSE
+        except Exception as e:  # e.g. config profile (blah) could not be found
+            raise AcogError(" %s" % e)
+        logger.debug(" using AWS/boto3 session --profile %s --region %s" % (
+                            self.profile_name, self.region_name))
+
+        credentials = sesh.get_credentials()
+        if credentials is None:
+            raise AcogError("no AWS credentials found for --profile %s" % self.profile)
+        if credentials.method == "sso":  # and sesh.get_credentials().refresh_needed():
+            try:
+                credentials.get_frozen_credentials()
+            except Exception as e:
+                raise AcogError("%s\n--Try 'aws sso login' to cure." % e)
+
+        if 'cognito-idp' not in sesh.get_available_services():
+            raise AcogError("AWS service 'cognito-idp' not available for profile %s" % sesh.profile_name)
+        return sesh
+
+    @property
+    def profile_name(self):  # for messages
+        return "(%s)" % self.profile if "session" not in self.lazy else self.session.profile_name or "(%s)" % self.profile
+
+    @property
+    def region_name(self):
+        return "(%s)" % self.region if "session" not in self.lazy else self.session.region_name or "(%s)" % self.region
+
+    @property
+    def cog_client(self):  # every call goes through the shared CogThrottle
+        return self._lazy("cog_client", lambda: self._throttledClient(
+                          self.session.client('cognito-idp', config=cogConfig())))
+
+    def _throttledClient(self, client):
+        if self.metrics and hasattr(client, "meta"):
+            self.metrics.hookBotocore(client)
+        return ThrottledClient(client, self.throttle)
+
+    @property
+    def userPools(self):  # list_user_pools response (cached on disk, see PoolCache)
+        return self._lazy("userPools", self._listUserPools)
+
+    def _listUserPools(self):
+        userPools = self.poolCache.get("UserPools")
+        if userPools is not None:
+            return userPools
+        try:
+            logger.debug("TRACE: pre-COG-list_user_pools")  # DEBUG/VERBOSE
+            userPools = {"UserPools":[]}
+            kwargs = {"MaxResults":60}  # we only had ~13 as of August 2019; every page now
+            while True:
+                page = self.cog_client.list_user_pools(**kwargs)
+                userPools["UserPools"] += page["UserPools"]
+                if not page.get("NextToken"):
+                    break
+                kwargs["NextToken"] = page["NextToken"]
+            logger.debug("TRACE: post-COG")  # DEBUG
+        except (botocore.exceptions.UnauthorizedSSOTokenError,
+                botocore.exceptions.SSOError,
+                botocore.exceptions.SSOTokenLoadError
+               ) as e:
+            raise AcogError("Try 'aws sso login' for %s exception:\n  %s" % (type(e),(e)))
+        except botocore.exceptions.ClientError as e:
+            logger.info("ERROR: AWS botocore exception.response:\n%s" % (e.response))
+            raise AcogError("AWS botocore client exception:\n  %s" % (e))
+        except AcogError:
+            raise
+        except Exception as e:
+            raise AcogError(" AWS  cognito-idp list-user-pools --profile %s --region %s\n  %s" % (
+                            self.profile_name, self.region_name, e))
+        return self.poolCache.put("UserPools", userPools)
+
+    @property
+    def availPoolNames(self):
+        return sorted(userPool["Name"] for userPool in self.userPools['UserPools'])
+
+    @property
+    def UserPoolName(self):
+        return self._lazy("pool", self._resolvePool)[0]
+
+    @property
+    def UserPoolId(self):
+        return self._lazy("pool", self._resolvePool)[1]
+
+    def _resolvePool(self):  # determine pool ID from pool name --returns [UserPoolName, UserPoolId]
+        resolved = self.poolCache.get("resolved:%s" % self.poolName)
+        if resolved:
+            return resolved
+        avail_client_ids_by_pool_name = {userPool["Name"]:userPool["Id"] for userPool in self.userPools['UserPools']}
+        UserPoolName = self.availPoolNames[0] if self.poolName == def_pool_name else self.poolName
+        UserPoolId = None
+        if UserPoolName in avail_client_ids_by_pool_name:  # exact match has priority
+            UserPoolId = avail_client_ids_by_pool_name[UserPoolName]
+        else:
+            for avail_pool_name in avail_client_ids_by_pool_name:
+                if UserPoolName in avail_pool_name:  # partial match as fallback
+                    UserPoolId = avail_client_ids_by_pool_name[avail_pool_name]
+                    UserPoolName = avail_pool_name
+                    break  # exit loop on finding first match
+        logger.info(" UserPoolId: %s from %s" % (UserPoolId, avail_client_ids_by_pool_name))
+
+        if UserPoolId is None or "COG-" in UserPoolId:  # poolID not yet mapped from poolName
+            raise AcogError("UserPoolId %s not found for UserPoolName %s !?!\n  (...at least not with --profile '%s')" % (
+                            UserPoolId, UserPoolName, self.profile_name))
+        return self.poolCache.put("resolved:%s" % self.poolName, [UserPoolName, UserPoolId])
+
+    @property
+    def clientID(self):  # app client Id, for the auth flows
+        return self._lazy("clientID", self._resolveClientID)
+
+    def _resolveClientID(self):
+        clientID = self.clientIDArg
+        if clientID == MATCH_FROM_POOL:
+            if self.UserPoolId not in clientIDs:
+                raise AcogError("no clientID known for pool %s (%s); pass --clientID" % (
+                                self.UserPoolName, self.UserPoolId))
+            clientID = clientIDs[self.UserPoolId]["id"]
+        if "abe" in self.UserPoolName:
+            clientID = clientIDs[self.UserPoolId].get("abe_client_id",clientID) if self.clientIDArg == MATCH_FROM_POOL else clientID
+        logger.info(" clientID: %s" % (clientID))
+        return clientID
+
+    @property
+    def metadata(self):  # Metadata API client (keep-alive pool), host per environment
+        return self._lazy("metadata", self._createMetadata)
+
+    def _createMetadata(self):
+        # map pool names to Metadata host per environment
+        if "stage" in self.UserPoolName or "abe" in self.UserPoolName or "st" in self.UserPoolName:
+            host = Metadata["stg"]
+        else:
+            host = Metadata["dev"]  # ["host"]  # QA-4779  # Dev & QA share Metadatahost
+        baseUrl = self.metadataUrl if self.metadataUrl else "http://%s:8080" % host["ip"]
+        return MetadataClient(baseUrl, hostName=host["host"], poolSize=self.metadataWorkers, verbose=self.verbose,
+                              metrics=self.metrics, cache=self.metadataCache or None)
+
+    def getUserPoolConfiguration(self, live=False):
+        # describe_user_pool, cached per pool; only the trigger actions need it
+        # live=True re-reads (and re-caches) the pool, e.g. to snapshot LambdaConfig before disabling it
+        userPoolConfiguration = None if live else self.poolCache.get("config:%s" % self.UserPoolId)
+        if userPoolConfiguration is None:
+            try:
+                userPoolConfiguration = self.cog_client.describe_user_pool(UserPoolId=self.UserPoolId)
+            except botocore.exceptions.ClientError as e:  # ResourceNotFoundException as e:
+                raise AcogError("%s (...at least not with --profile '%s')" % (e.response["Error"]["Message"],
+                                self.profile_name))
+            userPoolConfiguration.pop("ResponseMetadata", None)
+
+            # below removes redundant configuration that do not work when passed together
+            try:
+                if (userPoolConfiguration['UserPool']['Policies']['PasswordPolicy']['TemporaryPasswordValidityDays']):
+                    userPoolConfiguration['UserPool']['AdminCreateUserConfig'].pop('UnusedAccountValidityDays')
+            except KeyError:
+                pass
+            userPoolConfiguration = self.poolCache.put("config:%s" % self.UserPoolId, userPoolConfiguration)
+        return userPoolConfiguration
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~ operations ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def triggerConfig(self):  # update_user_pool kwargs (incl. LambdaConfig) that put the pool back as it is now
+        userPoolConfiguration = self.getUserPoolConfiguration(live=True)
+        attribs = userPoolConfigAttribs_base + ['LambdaConfig']
+        return {x:userPoolConfiguration['UserPool'][x] for x in attribs if x in userPoolConfiguration['UserPool']}
+
+    def doDisableTriggers(self, conf=None):  # warning: stateful/race-condition (see triggers.TriggerSuspension)
+        # conf: triggerConfig() taken beforehand (default: snapshot now, cached for doEnableTriggers); True if done
+        conf = conf if conf else self.triggerConfig()
+        conf = {x:conf[x] for x in conf if x != 'LambdaConfig'}
+        try:
+            self.cog_client.update_user_pool(UserPoolId=self.UserPoolId, LambdaConfig={}, **conf)
+        except Exception as e:
+            print("WARN: AWS/boto3 exception in triggers disable: %s" % (e))
+            return False
+        return True
+
+    def doEnableTriggers(self, conf=None):  # conf: as passed to doDisableTriggers (default: cached pool config)
+        if not conf:
+            userPoolConfiguration = self.getUserPoolConfiguration()  # as snapshotted by doDisableTriggers
+            attribs = userPoolConfigAttribs_base + ['LambdaConfig']  # restore Lambda Cognito trigger
+            conf  = {x:userPoolConfiguration['UserPool'][x] for x in attribs if x in userPoolConfiguration['UserPool']}
+        try:
+            self.cog_client.update_user_pool(UserPoolId=self.UserPoolId, **conf)
+        except Exception as e:
+            print("WARN: AWS/boto3 exception in triggers [re]enable : %s" % (e))
+            return False
+        return True
+
+    def doAdminCreateUser(self, un, firstName, lastName, dates=None, paxnum=1, emailVal=None, tourName=None,
+                          booking=None, extraAttributes=None):
+        # func called by doAddUser; extraAttributes are added to (or override) the create-time attributes
+        return self.adminCreateUser(un, firstName, lastName, dates=dates, paxnum=paxnum, emailVal=emailVal,
+                                    tourName=tourName, booking=booking, extraAttributes=extraAttributes)[0]
+
+    def adminCreateUser(self, un, firstName, lastName, dates=None, paxnum=1, emailVal=None, tourName=None,
+                        booking=None, extraAttributes=None):
+        # doAdminCreateUser, returning (GUID, True if created now / False if it already existed or failed)
+        ''' aws cognito-idp admin-create-user --color=on --user-pool-id=us-east-1_o1BRMLLH8 --username 5399020@test.com \
+              --temporary-password ${defPass} '--user-attributes={"(JSON..)"}' \
+              | jq .User.Username -r
+
+        return GUID
+        '''
+        UserPoolId = self.UserPoolId
+        emailVal, attribs = self.createAttributes(un, firstName, lastName, dates=dates, paxnum=paxnum,
+                                                  emailVal=emailVal, tourName=tourName, booking=booking,
+                                                  extraAttributes=extraAttributes)
+
+        if self.snapshot:  # known user: skip the create (and its UsernameExists round-trips)
+            prior = self.snapshot.findUsername(emailVal)
+            if prior:
+                print('    SNAPSHOT: "%s" exists' % emailVal)
+                print("    PRIOR USER:", end=' ')
+                return prior, False
+
+        try:
+          r = self.cog_client.admin_create_user(
+                     UserPoolId=UserPoolId,
+                     Username=emailVal,
+                     TemporaryPassword=defPass,
+                     UserAttributes=list(attribs),
+                     MessageAction="SUPPRESS"  # don't send SMS or email
+          )
+        except botocore.exceptions.ClientError as e:
+          if e.response["Error"]["Code"] in ("UserLambdaValidationException",
+                                             "AccessDeniedException"):
+              logger.error("Exception.response: %s" % (json.dumps(e.response["Error"],indent=4,sort_keys=True)))
+              return("%s:%s" % (FATAL_ERROR_CODE, e.response["Error"]["Code"])), False
+          if e.response["Error"]["Code"] in ["InvalidParameterException",
+                                             "UnexpectedLambdaException"
+                                            ]:
+              print("Exception.response: %s" % (json.dumps(e.response,indent=4)))
+              print("BLOCKED ON AWS UI-CONTROLLED SETTING: Need to toggle Pre sign-up trigger! --URL:")
+              print("  https://console.aws.amazon.com/cognito/users/?region={region}#/pool/{upi}/triggers".format(
+                               region=self.region, upi=UserPoolId))
+          elif e.response["Error"]["Code"] == "UsernameExistsException":
+              print('    CAUGHT: %s "%s" (%s)' % (e.response["Error"]["Code"],emailVal,
+                                                  e.response["Error"]["Message"]))
+              retry = self.cog_client.list_users(UserPoolId=UserPoolId,Filter='email ^= "%s"' % (emailVal))
+              print('     "UserLastModifiedDate":"%s"' % retry["Users"][0]["UserLastModifiedDate"] if retry["Users"] else "wtf")
+              # return("%s:%s" % (NON_FATAL_WARNING, e.response["Error"]["Code"]))
+              if self.snapshot and retry["Users"]:  # snapshot was stale
+                  self.snapshot.put(retry["Users"][0])
+
+              print("    PRIOR USER:", end=' ')
+              return(retry["Users"][0]["Username"] if retry["Users"] else None), False  # pre-existing GUID from list-users --assume only 1 hit
+          else:
+              print("Exception.response: %s" % (json.dumps(e.response,indent=4)))
+              return(USER_GUID_ERROR), False
+        else:  # non-exception
+          if self.snapshot:
+              self.snapshot.put(r['User'])
+          r['User'].pop('UserCreateDate',None)  # remove element(s) with non-JSON-ifiable value(s)
+          r['User'].pop('UserLastModifiedDate',None)
+          return(r['User']['Username']), True  # new GUID from admin-create-user response
+        return None, False  # InvalidParameterException/UnexpectedLambdaException (pre sign-up trigger)
+
+    def createAttributes(self, un, firstName, lastName, dates=None, paxnum=1, emailVal=None, tourName=None,
+                         booking=None, extraAttributes=None):
+        # (Username, UserAttributes) of adminCreateUser: email/username, custom:userType, custom:booking JSON, names
+        if self.allowUpperCaseEmail==False:
+            un = un.lower()
+        emailVal = self.userEmail(un, firstName, lastName, emailVal)
+
+        if self.userType.upper() in nonConsumerUserTypes:
+            print("    DEBUG: (un:%s, %s , emailVal:%s, (userType %s no bookingId)\n" % (un,'_' * 19,emailVal,self.userType) if self.verbose else '',end='')
+            attribs = [ {"Name":"custom:userType", "Value": self.userType  # case as-is
+              },{"Name":"email", "Value":emailVal
+              },{"Name":"email_verified", "Value":"true"
+              },{"Name":"family_name","Value":lastName
+              },{"Name":"given_name","Value":firstName
+              } ]
+        elif "MER" in self.userType.upper(): # match 'CONSUMER'
+            print("    DEBUG: (un:%s, %s , emailVal:%s, bookingId:%s)\n" % (un,'_' * 19,emailVal,booking) if self.verbose else '',end='')
+            attribs = [ { "Name":"custom:userType", "Value": self.userType
+              },{"Name":"custom:booking", "Value":'[%s]' % json.dumps(
+                       self.bookingEntry(booking, tourName=tourName, dates=dates, paxnum=paxnum))
+              },{"Name":"email", "Value":emailVal
+              },{"Name":"family_name","Value":lastName
+              },{"Name":"given_name","Value":firstName
+              } ]
+        else:
+            attribs = [ { "Value": ["ERROR UNSUPPORTED custom:userType", self.userType]} ]
+        if extraAttributes:
+            extraNames = [attr["Name"] for attr in extraAttributes]
+            attribs = [attr for attr in attribs if attr.get("Name") not in extraNames] + list(extraAttributes)
+
+        if self.verbose:
+            print("DEBUG: Username=emailVal='%s' attribs: '%s'" % (emailVal,attribs))
+        return emailVal, attribs
+
+    def importAttributes(self, un, fName, lName, dates=None, paxArray=None, email=None):
+        # (Username, UserAttributes) doAddUserFast would create this user with (for a user import job)
+        dates = dict(dates) if dates else {}
+        paxArray = paxArray if paxArray else defaultPaxArray()
+        dates['departureDate'] = str(dates.get('departureDate',futureDate)).split('T')[0]
+        dates['embarkDate'] =    str(dates.get('embarkDate',futureDate)).split('T')[0]
+        return self.createAttributes(un, fName, lName, dates=dates, emailVal=email, tourName=paxArray[0]["TourName"],
+                                     booking=un if str(un).isnumeric() else None,
+                                     extraAttributes=[{"Name":"email_verified","Value":"true"},
+                                                      {"Name":"custom:userType", "Value":self.userType}])
+
+    def userEmail(self, un, firstName, lastName, emailVal=None):  # the email/Username doAdminCreateUser uses
+        if self.allowUpperCaseEmail==False:
+            un = un.lower()
+        emailVal = un if '@' in un else (emailVal if emailVal else defEmail)
+        if emailVal in (defEmail,"firstName.lastName@test.com"):
+            emailVal = "%s@%s" %(un,emailVal.split('@')[-1])
+        if self.userType.upper() in nonConsumerUserTypes:
+            if "%s" in emailVal or emailVal[0:7].isnumeric():
+                emailVal = "%s.%s@%s" %(firstName,lastName,emailVal.split('@')[-1])
+        return emailVal
+
+    def bookingEntry(self, booking, tourName=None, dates=None, paxnum=1):  # one custom:booking list element
+        dates = dates if dates else {}
+        departureDate = dates.get('departureDate',futureDate).split('.')[0]  # strip off fractional second, if any
+        embarkDate =    dates.get('embarkDate',futureDate).split('.')[0]  # strip off fractional second, if any
+        return {"bookingId":booking,"tourName":tourName,"departureDate":departureDate,
+                "embarkDate":embarkDate,"passengerNumber":paxnum}
+
+    def doAddAttribs(self, Username='userGUID aka "sub"', UserAttributes=[]):
+        logger.info("\n   UserPoolId:{UserPoolId}\n     Username:{Username}\nUserAttributes ...\n    {UserAttributes}".format(
+            UserPoolId=self.UserPoolId,
+            Username=Username,
+            UserAttributes=UserAttributes)
+        )
+        r = self.cog_client.admin_update_user_attributes(
+            UserPoolId=self.UserPoolId,
+            Username=Username,
+            UserAttributes=UserAttributes)
+        if self.snapshot:
+            self.snapshot.update(Username, attributes=UserAttributes)
+        return(r)
+
+    def doAddUser(self, un, fName, lName, dates=None, paxArray=None, email=None, listMetadata=True):
+        # this higher-level function calls steps required to create an entry in Cognito, bump confirmation
+        # email: explicit address (or template) for this user; default <un>@test.com
+        # listMetadata=False skips the Metadata lookup after the final list-users (batch rows)
+        UserPoolId = self.UserPoolId
+        clientID = self.clientID
+        dates = dict(dates) if dates else {}
+        paxArray = paxArray if paxArray else defaultPaxArray()
+
+        dates['departureDate'] = str(dates.get('departureDate',futureDate)).split('T')[0]  # strip off hours:minutes, if any
+        dates['embarkDate'] =    str(dates.get('embarkDate',futureDate)).split('T')[0]  # strip off hours:minutes, if any
+        print("  step 1. admin-create-user %s in %s" %(un,UserPoolId), end='\n')
+        userGUID = self.doAdminCreateUser(un=un,firstName=fName,lastName=lName,
+            dates=dates,emailVal=email,tourName=paxArray[0]["TourName"],
+            booking=un if str(un).isnumeric() else None)
+        print("      --userGUID: %s" % userGUID)  # ToDo: display aws cli-equivalent command...
+        if userGUID in (None, USER_GUID_ERROR) or FATAL_ERROR_CODE in userGUID:
+            return userGUID
+
+        print("  step 2. admin-update-user-attributes (via doAddAttribs())")
+        # optional for new-users, but useful to break this out for updating existing
+        # aws cognito-idp admin-update-user-attributes \
+        #   --user-pool-id=${poolID} --username ${userGUID} --user-attributes="Name=email_verified,Value=true"
+        UserAttributes=[{"Name":"email_verified","Value":"true"}
+                       ,{"Name":"custom:userType", "Value":self.userType}]  # AIR QA-4780
+
+        r = {}
+        try:  # throttling/backoff is handled by CogThrottle
+          r = self.doAddAttribs(Username=userGUID,UserAttributes=UserAttributes)
+        except Exception as e:
+            logger.warning("WARN: AWS/boto3 exception: %s" % (e))
+
+        print("  step 3. admin-initiate-auth")
+        # aws cognito-idp admin-initiate-auth --user-pool-id=${poolID} --client-id="${clientID}" \
+        # --auth-flow ADMIN_NO_SRP_AUTH --auth-parameters "USERNAME=${userGUID},PASSWORD=${defPass}"
+        if self.verbose:
+          print("""    $ aws cognito-idp admin-initiate-auth --user-pool-id={UserPoolId} --client-id='{clientID}' \\
+            --auth-flow ADMIN_NO_SRP_AUTH --auth-parameters 'USERNAME={userGUID},PASSWORD=...'""".format(
+             UserPoolId=UserPoolId,clientID=clientID,userGUID=userGUID))
+        try:
+          r = self.cog_client.admin_initiate_auth( UserPoolId=UserPoolId, ClientId=clientID,
+                  AuthFlow="ADMIN_NO_SRP_AUTH", AuthParameters={"USERNAME":userGUID,"PASSWORD":defPass}
+          )
+        except botocore.exceptions.ClientError as e:
+          if e.response["Error"]["Code"] in ("NotAuthorizedException"):
+            print("    CAUGHT: %s (%s)" % (e.response["Error"]["Code"],e.response["Error"]["Message"]))
+            print("      --trying adminSetUserPassword...")
+            r = self.cog_client.admin_set_user_password(UserPoolId=UserPoolId,Username=userGUID,
+                                                        Password=defPass,Permanent=True)
+            if self.snapshot:
+                self.snapshot.update(userGUID, status="CONFIRMED")
+
+          elif e.response["Error"]["Code"] in ("UserLambdaValidationException"):
+            print("    CAUGHT WARNING: AWS/boto3 exception: %s" % (":\n      ".join(str(e).split(": "))))
+            if (self.forceOldPass in ("auto","n","N",'0')) and self.userType.upper() in nonConsumerUserTypes:  # CSA,AIR,TAP
+                print("    ADD userType:%s (skipping respond-to-auth ChallengeName %s)" % (self.userType,r.get("ChallengeName")),end='')
+                print("  --forceOldPass=y can update this (idempotent)" if (self.verbose) else '')
+            else:
+                print("      --trying adminSetUserPassword...")  # workaround for COR-316
+                r = self.cog_client.admin_set_user_password(UserPoolId=UserPoolId,Username=userGUID,
+                                                            Password=defPass,Permanent=True)
+                if self.snapshot:
+                    self.snapshot.update(userGUID, status="CONFIRMED")
+          else:  # throttling/transient errors were already retried by CogThrottle
+            print("    WARN: AWS/boto3 exception: %s" % (e))
+            return(USER_GUID_ERROR)
+
+        print("  step 4. admin-respond-to-auth-challenge")
+        if r.get("ChallengeName") == None:
+            print("    (no challenge pending)")
+        elif (self.forceOldPass in ("auto","n","N",'0')) and self.userType.upper() in nonConsumerUserTypes:  # CSA,AIR,TAP
+            print("    ADD userType:%s (skipping respond-to-auth ChallengeName %s)" % (self.userType,r.get("ChallengeName")),end='')
+            print("  --forceOldPass=y can update this (idempotent)" if (self.verbose and r.get("ChallengeName")) else '')
+        elif r and self.forceOldPass in ("auto","y","Y",'1'):
+            if r.get("Session") is not None and r.get("ChallengeName") in ("FORCE_CHANGE_PASSWORD","NEW_PASSWORD_REQUIRED"):
+                seshVals=r["Session"] ; seshVals_REDACTED='REDACTED(long,boring & ephemeral)'
+                print('    $ aws cognito-idp admin-respond-to-auth-challenge --user-pool-id {} --client-id "{}"'.format(
+                                   UserPoolId,clientID), end=' \\\n')
+                print('      --session {seshVals} --challenge-name {ChallengeName} '.format(
+                                   seshVals=seshVals_REDACTED,ChallengeName=r["ChallengeName"]),end=' \\\n')
+                print('      --challenge-responses "NEW_PASSWORD=...,USERNAME={userGUID}"'.format(userGUID=userGUID))
+                r = self.cog_client.admin_respond_to_auth_challenge( UserPoolId=UserPoolId, ClientId=clientID, Session=seshVals,
+                          ChallengeName=r["ChallengeName"],ChallengeResponses={"USERNAME":userGUID,"NEW_PASSWORD":defPass}
+                )
+                if self.snapshot:
+                    self.snapshot.update(userGUID, status="CONFIRMED")
+                print("    ADDED USER:", end=' ')
+            else:
+                print("    PRIOR USER:", end=' ')
+        else:
+            print("    MUNGED USER:", end=' ')    # rare
+
+        self.doListUsers(Filter=('email ^= "%s"' % (un)),metadata=listMetadata)
+
+        return userGUID
+
+    def doAddUserFast(self, un, fName, lName, dates=None, paxArray=None, email=None, verify=False):
+        # --fast: same end state as doAddUser in 2 calls instead of 5 --all attributes in admin_create_user,
+        # then admin_set_user_password(Permanent) instead of initiate-auth + respond-to-challenge;
+        # verify=True adds doAddUser's final list-users (else see verifyUsers, once per batch)
+        UserPoolId = self.UserPoolId
+        dates = dict(dates) if dates else {}
+        paxArray = paxArray if paxArray else defaultPaxArray()
+        dates['departureDate'] = str(dates.get('departureDate',futureDate)).split('T')[0]
+        dates['embarkDate'] =    str(dates.get('embarkDate',futureDate)).split('T')[0]
+        UserAttributes=[{"Name":"email_verified","Value":"true"}
+                       ,{"Name":"custom:userType", "Value":self.userType}]  # doAddUser step 2, at create time
+        print("  step 1. admin-create-user %s in %s (--fast: with email_verified)" %(un,UserPoolId))
+        userGUID, created = self.adminCreateUser(un=un,firstName=fName,lastName=lName,
+            dates=dates,emailVal=email,tourName=paxArray[0]["TourName"],
+            booking=un if str(un).isnumeric() else None, extraAttributes=UserAttributes)
+        print("      --userGUID: %s" % userGUID)
+        if userGUID in (None, USER_GUID_ERROR) or FATAL_ERROR_CODE in userGUID:
+            return userGUID
+        if not created:  # existing user: bring attributes in line, as doAddUser step 2 does
+            print("  step 1b. admin-update-user-attributes (prior user)")
+            try:
+                self.doAddAttribs(Username=userGUID,UserAttributes=UserAttributes)
+            except Exception as e:
+                logger.warning("WARN: AWS/boto3 exception: %s" % (e))
+
+        if (self.forceOldPass in ("auto","n","N",'0')) and self.userType.upper() in nonConsumerUserTypes:  # CSA,AIR,TAP
+            print("  step 2. ADD userType:%s (skipping password, as doAddUser does)" % self.userType)
+        else:
+            print("  step 2. admin-set-user-password --permanent (--fast)")
+            try:
+                self.cog_client.admin_set_user_password(UserPoolId=UserPoolId,Username=userGUID,
+                                                        Password=defPass,Permanent=True)
+            except botocore.exceptions.ClientError as e:
+                print("    WARN: AWS/boto3 exception: %s" % (e))
+                return(USER_GUID_ERROR)
+            if self.snapshot:
+                self.snapshot.update(userGUID, status="CONFIRMED")
+        print("    %s USER: %s" % ("ADDED" if created else "PRIOR", userGUID))
+        if verify:
+            self.doListUsers(Filter=('email ^= "%s"' % (un)),metadata=False)
+        return userGUID
+
+    def verifyUsers(self, usernames, workers=8, pageSize=60):
+        # one batched check of users added with doAddUserFast: {"users", "missing", "emailVerified", UserStatus: n}
+        # lists the (projected) pool when that takes fewer calls than one admin_get_user per user
+        wanted = set(usernames)
+        estimate = self.getUserPoolConfiguration()["UserPool"].get("EstimatedNumberOfUsers")
+        if estimate is not None and estimate / pageSize <= len(wanted):
+            users = [u for u in self.iterUsers(attributes=["email_verified"], pageSize=pageSize) if u["Username"] in wanted]
+        else:
+            def getUser(username):
+                try:
+                    r = self.cog_client.admin_get_user(UserPoolId=self.UserPoolId, Username=username)
+                except botocore.exceptions.ClientError as e:
+                    if e.response["Error"]["Code"] == "UserNotFoundException":
+                        return None
+                    raise
+                return {"Username":r["Username"], "UserStatus":r["UserStatus"], "Attributes":r["UserAttributes"]}
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                users = [u for u in pool.map(getUser, sorted(wanted)) if u]
+        result = {"users":len(wanted), "missing":len(wanted) - len(users), "emailVerified":0}
+        for user in users:
+            result[user["UserStatus"]] = result.get(user["UserStatus"], 0) + 1
+            if {"Name":"email_verified", "Value":"true"} in user.get("Attributes", []):
+                result["emailVerified"] += 1
+        return result
+
+    def doListUsers(self, Filter, bookingId=None, verbosityLevel=0, metadata=True):
+        # list-users called individually after create, or with filter to list matches
+        # returns running count of users listed by this client
+        UserPoolId = self.UserPoolId
+        Filter = 'email ^= "%s"' % Filter if '"' not in Filter else Filter
+        bookingId = ''.join(filter(str.isdigit, Filter)) if len(str(bookingId)) != 7 else bookingId
+        print("  $ aws cognito-idp list-users --filter '{Filter}'".format(Filter=Filter), end=' ')
+        print("--region '%s' --user-pool-id '%s' | jq '.Users[]'" % (self.region,UserPoolId))
+        if self.verbose:
+            print("        DEBUG: bookingId: %s, Filter: %s" % (bookingId, Filter))
+
+        matched = 0
+        for user in self.queryUsers(Filter=Filter):  # all pages (was: first 60 only)
+            matched += 1
+            with self.lock:  # doListUsers may be called from batch worker threads
+                self.user_count += 1
+                user_num = self.user_count  # stable copy for printing while other workers count
+            attr_count = 1
+            attribs = user.pop("Attributes")  # attribs list esp. UserStatus in(CONFIRMED,FORCE_CHANGE_PASSWORD)
+            attribs.append(user)   # flatten structure for consistent output format including metadata
+            for attr in sorted(attribs,key=lambda d:d.get("Name",'a'),reverse=False):
+                attrAsStr = str(attr) if '"' in attr.get("Value","single-quoter") else json.dumps(
+                                attr,sort_keys=True,default=str)  # specify default=function to dump datetime object)
+                if attr_count == 1:
+                    print('  %s.   %s' % (user_num,attrAsStr))  # outdent first line
+                else:
+                    print('   .%s  %s' % (attr_count,attrAsStr))  # indent remaining lines
+                attr_count += 1
+
+        if matched == 0 or self.verbose:
+            print("(%d users matched Cognito filter '%s')" % (matched, Filter))
+
+        if len(str(bookingId)) == 7 and metadata:
+            self.callMetadata(bookingId,verbosityLevel=verbosityLevel)
+
+        return self.user_count
+
+    def iterUsers(self, Filter=None, attributes=None, pageSize=60):
+        # generator over every user matching Filter ('' or None = whole pool), one list_users page at a time
+        # attributes: optional list of attribute names to fetch (AttributesToGet projection)
+        kwargs = {"UserPoolId":self.UserPoolId, "Limit":pageSize}
+        if Filter:
+            kwargs["Filter"] = Filter
+        if attributes:
+            kwargs["AttributesToGet"] = list(attributes)
+        while True:
+            page = self.cog_client.list_users(**kwargs)
+            for user in page["Users"]:
+                yield user
+            if not page.get("PaginationToken"):
+                return
+            kwargs["PaginationToken"] = page["PaginationToken"]
+
+    def queryUsers(self, Filter=None, attributes=None):  # iterUsers, answered from the snapshot when it can
+        if self.snapshot and self.snapshot.canAnswer(Filter):
+            return self.snapshot.users(Filter=Filter, attributes=attributes)
+        return self.iterUsers(Filter=Filter, attributes=attributes)
+
+    def findUserGUID(self, prefix):  # "sub" of first user with email starting with prefix, or None
+        if self.snapshot:
+            user_GUID = self.snapshot.findSub(prefix)
+            if user_GUID:
+                return user_GUID
+        cog_response = self.cog_client.list_users(UserPoolId=self.UserPoolId,Filter='email ^= "%s"' % prefix,Limit=60)
+        try:
+            attribs = cog_response["Users"][0]["Attributes"]
+        except Exception as e:
+            logger.warning(" Caught exception: %s (Cognito response: %s)" % (e, cog_response))
+            return None
+        logger.debug("Attributes: " + json.dumps(attribs,indent=2))
+        user_GUID = None
+        for attr in sorted(attribs,key=lambda d:d.get("Name",'a'),reverse=False):  # sort by "Name"
+            logger.debug("attr: " + json.dumps(attr,indent=2))
+            user_GUID = attr["Value"] if attr["Name"] == "sub" else user_GUID  # 'userGUID aka "sub"'
+        return user_GUID
+
+    def deleteUser(self, username):  # True on success
+        r = self.cog_client.admin_delete_user(Username=username,UserPoolId=self.UserPoolId)
+        if self.snapshot:
+            self.snapshot.remove(self.snapshot.findUsername(username) or username)
+        return 200 == r['ResponseMetadata']['HTTPStatusCode']
+
+    def callMetadata(self, bookingId, verbosityLevel=0):  # see MetadataClient.callMetadata
+        return self.metadata.callMetadata(bookingId, verbosityLevel=verbosityLevel)
+
+    def generateIdToken(self, username):  # cached until near exp, then refreshed (see TokenCache)
+        if self.tokenCache:
+            return self.tokenCache.idToken(self.UserPoolId, self.clientID, username,
+                                           lambda: self.srpLogin(username), self.cog_client)
+        return self.srpLogin(username)['AuthenticationResult']['IdToken']
+
+    def srpLogin(self, username):  # full SRP auth response
+        import warrant.aws_srp  # RCF-2945 Secure Remote Password
+        return warrant.aws_srp.AWSSRP( username=username, password=defPass,
+                                      pool_id=self.UserPoolId,
+                                      client_id=self.clientID,
+                                      client=self.cog_client  # warm, throttled
+                                    ).authenticate_user()
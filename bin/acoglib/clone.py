@@ -0,0 +1,93 @@
+# acoglib.clone -- acog.py clone: copy a pool's users into another pool (seed COG-stage from COG-qa)
+# the source is streamed page by page (list_users, projected to CLONE_ATTRIBUTES) and every user the target
+# doesn't have yet (by email, from one pass over the target) is written either concurrently (bounded window of
+# admin_create_user + admin_set_user_password, as --fast does) or as user import jobs (--bulk-import, see
+# acoglib.importjob); both pools are in one region, so their calls share one CogThrottle
+
+import sys
+import time
+
+import botocore.exceptions
+
+from .defaults import defPass, nonConsumerUserTypes
+from .batch import runBounded
+from .importjob import FIXED_COLUMNS
+from .records import attributeValue
+from .sync import loadPoolState
+
+CLONE_ATTRIBUTES = ["email", "email_verified", "given_name", "family_name", "custom:booking", "custom:userType"]
+
+
+def cloneSource(source, target, Filter=None, stats=None):
+    # generator of (email, [UserAttributes]) for source users (matching Filter) not yet in target
+    present = loadPoolState(target)
+    stats = stats if stats is not None else {}
+    stats.update(listed=0, present=0)
+    seen = set()
+    for user in source.queryUsers(Filter=Filter, attributes=CLONE_ATTRIBUTES):
+        stats["listed"] += 1
+        attributes = [attr for attr in user.get("Attributes", []) if attr["Name"] in CLONE_ATTRIBUTES]
+        email = attributeValue(attributes, "email")
+        if not email:  # nothing to key the copy on
+            continue
+        if email.lower() in present or email.lower() in seen:
+            stats["present"] += 1
+            continue
+        seen.add(email.lower())
+        yield email, attributes
+
+
+def cloneUser(acog, email, attributes):
+    # create one copied user (2 calls, as doAddUserFast); returns (Username, created)
+    attributes = [attr for attr in attributes if attr["Name"] != "email_verified"] + \
+                 [{"Name":"email_verified", "Value":"true"}]
+    try:
+        r = acog.cog_client.admin_create_user(UserPoolId=acog.UserPoolId, Username=email, TemporaryPassword=defPass,
+                                              UserAttributes=attributes, MessageAction="SUPPRESS")
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] == "UsernameExistsException":  # created since the target was read
+            return None, False
+        raise
+    userGUID = r["User"]["Username"]
+    userType = attributeValue(attributes, "custom:userType", acog.userType)
+    if not (acog.forceOldPass in ("auto", "n", "N", '0') and userType.upper() in nonConsumerUserTypes):
+        acog.cog_client.admin_set_user_password(UserPoolId=acog.UserPoolId, Username=userGUID,
+                                                Password=defPass, Permanent=True)
+    return userGUID, True
+
+
+def cloneUsers(acog, users, workers=8, quiet=False, out=None):
+    # cloneUser for each (email, attributes) into acog's pool, concurrently; returns
+    # {"cloned", "exists", "errors", "elapsed"}
+    out = out if out else sys.stdout
+    stats = {"cloned":0, "exists":0, "errors":0, "elapsed":0.0}
+    t0 = time.time()
+
+    def finish(email, future):
+        try:
+            userGUID, created = future.result()
+        except Exception as e:  # one failed copy (after CogThrottle's retries) doesn't stop the clone
+            stats["errors"] += 1
+            print("ERROR: %s: %s" % (email, e), file=sys.stderr)
+            return
+        if not created:
+            stats["exists"] += 1
+            return
+        stats["cloned"] += 1
+        if acog.metrics:
+            acog.metrics.count("cloned")
+        if not quiet:
+            print("  cloned %s (%s)" % (email, userGUID), file=out)
+
+    runBounded(cloneUser, ((email, (acog, email, attributes)) for email, attributes in users), finish,
+               workers=workers)
+    stats["elapsed"] = time.time() - t0
+    return stats
+
+
+def cloneRecords(users):  # (email, attributes) -> user import CSV records (importjob.importUsers records=)
+    for email, attributes in users:
+        record = dict(FIXED_COLUMNS, email_verified="true")
+        record.update({attr["Name"]:attr["Value"] for attr in attributes if attr["Name"] != "email_verified"})
+        record["cognito:username"] = email
+        yield record
@@ -0,0 +1,252 @@
+# acoglib.daemon -- acog.py serve: a warm acog.py on a Unix socket (the thin client is bin/acogc.py)
+# a cold acog.py run pays interpreter start, importing boto3/botocore/requests, credential/SSO resolution,
+# loading the cognito-idp service model and new TLS connections before its first useful call; the daemon pays
+# that once and runs each forwarded command line in a thread of its own, with that run's stdout/stderr streamed
+# back over the connection. Between runs it keeps (WarmClients) the boto3 session and cognito-idp client per
+# profile+region and the Metadata keep-alive session per host
+# a run only ever sees the daemon's environment, so the client sends digests of its own AWS_*/ACOG_*/proxy
+# variables (forwardedEnv); when they aren't the daemon's (another AWS_PROFILE, fresh session credentials,
+# another ACOG_CACHE_DIR...) the daemon runs nothing and the client runs the command itself
+# protocol, one connection per run: the client sends one JSON line {"argv": [...], "cwd": "...", "env": {...}};
+# the server answers with JSON lines {"out": text} / {"err": text}, then {"exit": code}; or, environment
+# mismatch, only {"env": [names that differ]}
+
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from .poolcache import defaultCacheDir
+
+
+ENV_NAMES = ("HTTP_PROXY", "HTTPS_PROXY", "NO_PROXY", "REQUESTS_CA_BUNDLE", "CURL_CA_BUNDLE")  # Metadata calls
+
+
+def forwardedEnv(environ):  # as acogc.forwardedEnv: {name: digest} of what a run's result depends on
+    return {name:hashlib.sha256(value.encode("utf-8")).hexdigest()[:16] for name, value in environ.items()
+            if name.startswith(("AWS_", "ACOG_")) and name != "ACOG_SOCKET" or name.upper() in ENV_NAMES}
+
+
+def socketPath(path=None):  # --socket, else $ACOG_SOCKET, else $ACOG_CACHE_DIR/acog.sock
+    return path or os.environ.get("ACOG_SOCKET") or os.path.join(defaultCacheDir(), "acog.sock")
+
+
+class WarmClients(object):
+    '''
+    warm = WarmClients()              # acog.py serve: what one run's AcogClient set up, the next one reuses
+    acog = warm.adopt(AcogClient(...))     # before first use: warm boto3 session/client, Metadata session
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cognito = {}   # (profile, region): (boto3 session, raw cognito-idp client)
+        self.metadata = {}  # Metadata base URL: requests.Session (keep-alive connection pool)
+
+    def adopt(self, acog):
+        key = (acog.profile, acog.region)
+        with self.lock:
+            if key not in self.cognito:  # first run for this profile+region: create them now, keep them
+                client = acog.cog_client.client
+                self.cognito[key] = (acog.lazy.get("session"), client)  # (no session: a preconfigured client)
+            session, client = self.cognito[key]
+        if session is not None:
+            acog.lazy["session"] = session
+        acog.lazy["cog_client"] = acog._throttledClient(client)  # this run's CogThrottle and Metrics
+        acog.lazy["metadata"] = _LazyMetadata(self, acog)
+        return acog
+
+    def metadataSession(self, metadata):
+        with self.lock:
+            return self.metadata.setdefault(metadata.baseUrl, metadata.session)
+
+
+class _LazyMetadata(object):  # this run's MetadataClient (its own Metrics) over the kept session, on first use
+    def __init__(self, warm, acog):
+        self.warm = warm
+        self.acog = acog
+        self.client = None
+
+    def __getattr__(self, name):
+        if self.client is None:
+            with self.acog.lock:
+                if self.client is None:
+                    client = self.acog._createMetadata()
+                    client.session = self.warm.metadataSession(client)
+                    self.client = client
+        return getattr(self.client, name)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~ per-run stdout/stderr ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class _Stream(object):
+    # installed as sys.stdout/sys.stderr: writes go to the streams of the run the current thread works for
+    # (threads started by a run inherit them, see _start), else to the daemon's own
+    def __init__(self, name, default):
+        self.name = name
+        self.default = default
+
+    def target(self):
+        streams = getattr(threading.current_thread(), "acogStreams", None)
+        return streams[self.name] if streams else self.default
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def __getattr__(self, name):  # encoding, isatty, etc.
+        return getattr(self.target(), name)
+
+
+_threadStart = threading.Thread.start
+
+
+def _start(thread):  # Thread.start, handing the starting thread's run streams on (executor workers, progress)
+    if getattr(thread, "acogStreams", None) is None:
+        thread.acogStreams = getattr(threading.current_thread(), "acogStreams", None)
+    return _threadStart(thread)
+
+
+def captureOutput():  # before serve (and before logging.basicConfig, whose handler keeps sys.stderr)
+    if not isinstance(sys.stdout, _Stream):
+        sys.stdout, sys.stderr = _Stream("stdout", sys.stdout), _Stream("stderr", sys.stderr)
+        threading.Thread.start = _start
+
+
+class _Channel(object):  # one run's "out" or "err": text buffered into whole lines, sent as JSON lines
+    def __init__(self, conn, key):
+        self.conn = conn
+        self.key = key
+        self.buffer = []
+        self.lock = threading.Lock()  # a run's threads all write here
+
+    def write(self, text):
+        with self.lock:
+            self.buffer.append(text)
+            if '\n' in text:
+                self._send()
+        return len(text)
+
+    def flush(self):
+        with self.lock:
+            self._send()
+
+    def _send(self):  # call with self.lock held
+        if self.buffer:
+            text, self.buffer = ''.join(self.buffer), []
+            self.conn.send({self.key:text})
+
+    def isatty(self):
+        return False
+
+    encoding = "utf-8"
+
+
+class _Connection(object):
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.lock = threading.Lock()  # out and err interleave line by line
+
+    def send(self, message):
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        with self.lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~ server ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:  # a probe (see serve), not a run
+            return
+        request = json.loads(line.decode("utf-8"))
+        conn = _Connection(self.wfile)
+        env = request.get("env", {})
+        differ = sorted(name for name in set(env) | set(self.server.env) if env.get(name) != self.server.env.get(name))
+        if differ:
+            conn.send({"env":differ})
+            return
+        streams = {"stdout":_Channel(conn, "out"), "stderr":_Channel(conn, "err")}
+        threading.current_thread().acogStreams = streams
+        self.server.activity(+1)
+        code = 1
+        try:
+            code = self.server.run(request)
+        except SystemExit as e:  # argparse errors, --help
+            code = e.code if isinstance(e.code, int) else 0 if e.code is None else 1
+        except BrokenPipeError:  # client went away (Ctrl-C, Jenkins abort): the run stops at its next write
+            return
+        except Exception as e:
+            print("ERROR: acog serve: %s: %s" % (type(e).__name__, e), file=sys.stderr)
+        finally:
+            self.server.activity(-1)
+        try:
+            for stream in streams.values():
+                stream.flush()
+            conn.send({"exit":code})
+        except OSError:
+            pass
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, run):
+        self.run = run
+        self.env = forwardedEnv(os.environ)  # as the daemon started: what every run here uses
+        self.active = 0
+        self.last = time.monotonic()
+        self.counter = threading.Lock()
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+
+    def activity(self, n):
+        with self.counter:
+            self.active += n
+            self.last = time.monotonic()
+
+    def idle(self):
+        with self.counter:
+            return 0 if self.active else time.monotonic() - self.last
+
+
+def serve(path, run, idle=0, ready=None):
+    # serve forwarded runs on Unix socket path until Ctrl-C/SIGTERM (or idle seconds without a run; 0 = never);
+    # run(request) -> exit code, called in a thread whose sys.stdout/sys.stderr are the client's (captureOutput);
+    # ready() is called once the socket is listening
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)  # stale socket of a daemon that died
+        else:
+            raise OSError("%s: another acog serve is listening" % path)
+        finally:
+            probe.close()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    umask = os.umask(0o177)  # the socket runs commands with our AWS credentials: owner only
+    try:
+        server = _Server(path, run)
+    finally:
+        os.umask(umask)
+    if idle:
+        def watch():
+            while server.idle() < idle:
+                time.sleep(min(idle, 5))
+            server.shutdown()
+        threading.Thread(target=watch, name="acog-serve-idle", daemon=True).start()
+    if ready:
+        ready()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
@@ -0,0 +1,44 @@
+# acoglib.defaults -- shared constants for acog.py and the acoglib modules
+
+import datetime
+
+defAction = "list-pools"
+defBook = "5399020"
+defDate = "try-API"  # flag to look up actual depart/embark date(s) in Metadata booking
+defNames = "approve,always"
+def_pool_name = "(1stAvailable)"
+defEmail = "%s@test.com"  # defaults to being a template/suffix after bookingNo
+futureDate = (datetime.datetime.now() + datetime.timedelta(days=90)).strftime("%Y-%m-%d")
+nonConsumerUserTypes = ("CSA","AIR","TA")  # TA=TravelAgent
+
+AWS_DEFAULT_REGION = "us-east-1"  # override env var or profile_name='default')  # ~/.aws/credentials
+FATAL_ERROR_CODE = "FATAL_ERROR_CODE"
+NON_FATAL_WARNING = "NON_FATAL_WARNING"
+USER_GUID_ERROR = "USER_GUID_ERROR"
+MATCH_FROM_POOL = "matchFromInternalList"
+clientIDs = {  # NOTE: from ~/git/COG-client/stack/envs/*
+  "us-east-1_W0vAsS6HQ":{"id":"2131qREDACTED174crs","pool":"COG-dev"},
+  "us-east-1_k9PQUnVgU":{"id":"6p4neREDACTEDqej1nf","pool":"COG-qa"},
+  "us-east-1_BQlmg4kuQ":{"id":"5u11dREDACTED6aq4iu","pool":"COG-stage"}
+   }  # id=ClientID passed to Lambda triggers for some Cognito operations --not an attribute of the entries.
+local_client_ids_by_pool_name = {clientIDs[Id]["pool"]:Id for Id in clientIDs}
+localPools = [{"Id":Id,"Name":clientIDs[Id]["pool"]} for Id in clientIDs]  # shape/style of aws cognito-idp list-user-pools
+
+defPass = "noSmok!ng0316"
+# depending on network routing, may not work from the cloud like it does from the office/VPN
+Metadata = {"dev":{ "ip":"10.191.9.71","host":"apiqaa01.dev.nosmokingrc.com"},
+             "qa":{ "ip":"10.191.9.71","host":"apiqaa01.dev.nosmokingrc.com"},
+            "stg":{ "ip":"10.191.9.73","host":"apistg01.nosmokingrc.com"} }
+
+userPoolConfigAttribs_base = [ 'AdminCreateUserConfig', 'AutoVerifiedAttributes', 'DeviceConfiguration',
+      'EmailConfiguration', 'EmailVerificationMessage', 'EmailVerificationSubject',
+      'MfaConfiguration', 'Policies',
+      'SmsAuthenticationMessage', 'SmsConfiguration', 'SmsVerificationMessage',
+      'UserPoolAddOns', 'UserPoolTags', 'VerificationMessageTemplate'
+      ]
+
+
+def defaultPaxArray():  # fresh placeholder (callMetadata fills it in from the booking)
+    return [{"BookingStatus":0,"Currency":"YEN","TourName":0,"TourStatus":0,"EmbarkDate":"2020-10-22",
+             "GuestDepartureDate":"2020-10-22","Office":"JP"},
+            {"pax_1":None},{"pax_2":None}]
@@ -0,0 +1,102 @@
+# acoglib.fanout -- list-users/list-pools over many pools (and regions) at once: --pools, --regions
+# every matching pool of every region is queried concurrently with full pagination; users stream back as they
+# arrive, tagged with their pool and region. Cognito quotas are per account and region, so the clients of one
+# region share one boto3 client and one CogThrottle (another region gets its own)
+
+import concurrent.futures
+import queue
+import threading
+
+from .client import AcogClient
+from .defaults import def_pool_name
+from .throttle import CogThrottle
+
+
+def _like(acog, poolName, region, throttle=None, client=None):  # AcogClient with acog's settings
+    return AcogClient(poolName=poolName, profile=acog.profile, region=region, clientID=acog.clientIDArg,
+                      userType=acog.userType, forceOldPass=acog.forceOldPass,
+                      allowUpperCaseEmail=acog.allowUpperCaseEmail, verbose=acog.verbose,
+                      metadataUrl=acog.metadataUrl, metadataWorkers=acog.metadataWorkers,
+                      cacheTtl=acog.poolCache.ttl, refreshCache=acog.poolCache.refresh,
+                      throttle=throttle if throttle else CogThrottle(scale=acog.throttle.scale,
+                                                                     maxRetries=acog.throttle.maxRetries),
+                      tokenCache=acog.tokenCache, client=client, metrics=acog.metrics)
+
+
+def regionClients(acog, regions=None):  # {region: AcogClient for pool discovery}; acog itself for its region
+    clients = {}
+    for region in regions if regions else [acog.region]:
+        clients[region] = acog if region == acog.region else _like(acog, def_pool_name, region)
+    return clients
+
+
+def poolClient(acog, poolName):  # AcogClient for another pool in acog's region: same boto3 client and CogThrottle
+    client = _like(acog, poolName, acog.region, throttle=acog.throttle, client=acog.cog_client.client)
+    client.poolCache = acog.poolCache
+    client.lazy["userPools"] = acog.userPools
+    return client
+
+
+def matchingPools(base, patterns):  # names of base's region's pools containing any comma-separated pattern
+    patterns = [p for p in patterns.split(',') if p] if patterns else []
+    return [name for name in base.availPoolNames if not patterns or any(p in name for p in patterns)]
+
+
+def poolClients(acog, patterns, regions=None, workers=8):
+    # [AcogClient] for every pool matching patterns ('' = all) in every region (pool lists fetched concurrently)
+    bases = regionClients(acog, regions)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        names = dict(zip(bases, pool.map(lambda base: matchingPools(base, patterns), bases.values())))
+    clients = []
+    for region, base in bases.items():
+        raw = base.cog_client.client  # the region's boto3 client, under its ThrottledClient
+        for name in names[region]:
+            client = base if name == base.lazy.get("pool", [None])[0] else \
+                     _like(acog, name, region, throttle=base.throttle, client=raw)
+            client.poolCache = base.poolCache  # one cache file per region: one writer
+            client.lazy["userPools"] = base.userPools
+            clients.append(client)
+    return clients
+
+
+def fanOutUsers(clients, Filter=None, attributes=None, workers=8, errors=None):
+    # generator of (AcogClient, list_users entry) over every client's pool, queried concurrently,
+    # merged in arrival order; a pool that fails (e.g. AccessDenied) lands in errors {(region, pool): exception}
+    results = queue.Queue(maxsize=workers * 60)
+    stop = threading.Event()
+    DONE = object()
+
+    def offer(item):  # queue.put that gives up once the consumer has gone away; False then
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def drain(client):
+        try:
+            for user in client.queryUsers(Filter=Filter, attributes=attributes):
+                if not offer((client, user)):
+                    return
+        except Exception as e:
+            if errors is not None:
+                errors[(client.region, client.poolName)] = e
+        finally:
+            offer((client, DONE))
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        for client in clients:
+            pool.submit(drain, client)
+        running = len(clients)
+        while running:
+            client, user = results.get()
+            if user is DONE:
+                running -= 1
+            else:
+                yield client, user
+    finally:
+        stop.set()  # consumer stopped early (or failed): workers give up at their next put
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,142 @@
+# acoglib.importjob -- acog.py import: very large add-user --file runs as Cognito user import jobs
+# rows are read as add-user --file reads them (batch.readUserRows: same header aliases, --prefetchMetadata ok),
+# each becomes the attributes doAddUserFast would create it with (AcogClient.importAttributes: custom:booking
+# JSON, custom:userType, names, email_verified) in the pool's own import CSV layout (get_csv_header); every
+# --import-batch users is one job: create_user_import_job, PUT the CSV to its pre-signed URL, start it, then
+# describe_user_import_job with backoff until it ends. Cognito creates the users server-side, so a 100k-row run
+# is a handful of calls instead of 2-5 per user at the 50/s UserCreation quota
+# imported users have no password (UserStatus RESET_REQUIRED) and per-row failures go to CloudWatch Logs
+# (the --import-role), as Cognito documents for user import
+
+import csv
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+import botocore.exceptions
+import requests
+
+from .client import AcogError
+
+FIXED_COLUMNS = {"cognito:mfa_enabled":"false", "email_verified":"false", "phone_number_verified":"false"}  # required
+DONE_STATUSES = ("Succeeded", "Failed", "Stopped", "Expired")
+JOB_COUNTS = ("ImportedUsers", "SkippedUsers", "FailedUsers")
+
+
+def importRecords(acog, rows, stats=None):
+    # generator of {column: value} per row (first row wins for a repeated username; stats["duplicates"])
+    seen = set()
+    for row in rows:
+        username, attributes = acog.importAttributes(row["un"], row["fName"], row["lName"], dates=row["dates"],
+                                                     paxArray=row.get("paxArray"), email=row["email"])
+        if username in seen:
+            if stats is not None:
+                stats["duplicates"] += 1
+            continue
+        seen.add(username)
+        record = dict(FIXED_COLUMNS)
+        record.update({attr["Name"]:attr["Value"] for attr in attributes if "Name" in attr})
+        record["cognito:username"] = username
+        yield record
+
+
+def writeImportCsv(path, header, records, limit):
+    # up to limit records as a user-import CSV (header: get_csv_header); returns (records written, unknown columns)
+    written, unknown = 0, set()
+    with open(path, "w", newline='', encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=header, restval='', extrasaction="ignore")
+        writer.writeheader()
+        for record in records:
+            unknown.update(name for name in record if name not in writer.fieldnames)
+            writer.writerow(record)
+            written += 1
+            if written >= limit:
+                break
+    return written, unknown
+
+
+def uploadCsv(url, path):  # PUT to the job's pre-signed S3 URL (as Cognito's `curl -T` example does)
+    with open(path, "rb") as f:
+        r = requests.put(url, data=f, headers={"x-amz-server-side-encryption":"aws:kms"}, timeout=300)
+    if r.status_code >= 300:
+        raise AcogError("import CSV upload: HTTP %s %s" % (r.status_code, r.text[:200]))
+
+
+def runImportJob(acog, path, jobName, roleArn, poll=2.0, maxPoll=30.0, out=None):
+    # one user import job for the CSV at path: create, upload, start, poll until done; returns the final job
+    out = out if out else sys.stderr
+    job = acog.cog_client.create_user_import_job(JobName=jobName, UserPoolId=acog.UserPoolId,
+                                                 CloudWatchLogsRoleArn=roleArn)["UserImportJob"]
+    uploadCsv(job["PreSignedUrl"], path)
+    job = acog.cog_client.start_user_import_job(UserPoolId=acog.UserPoolId, JobId=job["JobId"])["UserImportJob"]
+    t0 = time.time()
+    delay = poll
+    try:
+        while job["Status"] not in DONE_STATUSES:
+            time.sleep(delay)
+            delay = min(maxPoll, delay * 1.5)  # jobs take minutes: back off to one describe per maxPoll seconds
+            job = acog.cog_client.describe_user_import_job(UserPoolId=acog.UserPoolId,
+                                                           JobId=job["JobId"])["UserImportJob"]
+            print("  %s %s: %s, %s imported, %s skipped, %s failed (%.0fs)" % (jobName, job["JobId"],
+                  job["Status"], *[job.get(k, 0) for k in JOB_COUNTS], time.time() - t0), file=out, flush=True)
+    except BaseException:  # Ctrl-C/SIGTERM: don't leave the job importing behind us
+        try:
+            acog.cog_client.stop_user_import_job(UserPoolId=acog.UserPoolId, JobId=job["JobId"])
+            print("  stopped %s %s" % (jobName, job["JobId"]), file=out)
+        except botocore.exceptions.ClientError as e:
+            print("WARN: stop_user_import_job %s: %s" % (job["JobId"], e), file=out)
+        raise
+    return job
+
+
+def importUsers(acog, rows, roleArn=None, batch=100000, dryRun=False, csvDir=None, out=None, records=None):
+    # rows from readUserRows -> one user import job per batch users, run one after another
+    # (or records: ready-made {column: value} dicts, e.g. clone.cloneRecords; rows is then unused)
+    # returns {"users", "duplicates", "jobs": [final job], "imported", "skipped", "failed", "elapsed", "csvs"}
+    # dryRun: write the CSVs (to csvDir, default: a temp dir that is kept) and stop
+    out = out if out else sys.stderr
+    if not dryRun and not roleArn:
+        raise AcogError("import needs --import-role: an IAM role ARN Cognito can write CloudWatch Logs with")
+    stats = {"users":0, "duplicates":0, "jobs":[], "imported":0, "skipped":0, "failed":0, "elapsed":0.0, "csvs":[]}
+    t0 = time.time()
+    header = acog.cog_client.get_csv_header(UserPoolId=acog.UserPoolId)["CSVHeader"]
+    records = records if records is not None else importRecords(acog, rows, stats)
+    tempDir = None if csvDir else tempfile.mkdtemp(prefix="acog-import-")
+    csvDir = csvDir if csvDir else tempDir
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    try:
+        for part in itertools.count(1):
+            path = os.path.join(csvDir, "acog-import-%s-%s.csv" % (stamp, part))
+            written, unknown = writeImportCsv(path, header, records, batch)
+            if not written:
+                os.unlink(path)
+                break
+            stats["users"] += written
+            if acog.metrics:
+                acog.metrics.count("rows", written)
+            if unknown:
+                print("WARN: pool %s has no %s attribute: dropped from the import" % (acog.UserPoolName,
+                      ', '.join(sorted(unknown))), file=out)
+            if dryRun:
+                stats["csvs"].append(path)
+                print("  wrote %s users to %s" % (written, path), file=out)
+                continue
+            jobName = "acog-%s-%s" % (stamp, part)
+            print("  %s: %s users, %s bytes" % (jobName, written, os.path.getsize(path)), file=out, flush=True)
+            try:
+                job = runImportJob(acog, path, jobName, roleArn, out=out)
+            finally:
+                os.unlink(path)
+            stats["jobs"].append(job)
+            stats["imported"] += job.get("ImportedUsers", 0)
+            stats["skipped"] += job.get("SkippedUsers", 0)
+            stats["failed"] += job.get("FailedUsers", 0)
+            if job["Status"] != "Succeeded":  # later batches would likely fail the same way
+                break
+    finally:
+        if tempDir and not dryRun:
+            os.rmdir(tempDir)
+    stats["elapsed"] = time.time() - t0
+    return stats
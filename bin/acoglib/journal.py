@@ -0,0 +1,102 @@
+# acoglib.journal -- append-only per-row outcome journal for add-user --file (--journal, --resume)
+# one NDJSON line per finished row: {"key", "rowNum", "status", "guid", "elapsed", "ts"}; the key is the row
+# as read from the file (rowKey)
+# lines are appended with a single O_APPEND write each (safe from many threads/processes);
+# fsync is batched (every fsyncEvery rows or fsyncSecs seconds) so the journal is never the bottleneck
+
+import json
+import logging
+import os
+import threading
+import time
+
+from .defaults import FATAL_ERROR_CODE, USER_GUID_ERROR
+
+logger = logging.getLogger("acog")
+
+OK, ERROR, FATAL = "ok", "error", "fatal"
+
+
+def rowKey(row):  # identity of an input row across runs (row numbers shift when files are edited)
+    # frozen as row["key"] when the row is read (batch.readUserRows): Metadata pax names filled in later
+    # (prefetchBookings, --async) must not change it, or --resume would never match the journal
+    if "key" in row:
+        return row["key"]
+    return "\t".join(str(row.get(k)) for k in ("un", "email", "fName", "lName"))
+
+
+def rowStatus(r):  # doAddUser result -> journal status
+    if r in (None, USER_GUID_ERROR):
+        return ERROR
+    if FATAL_ERROR_CODE in r:
+        return FATAL
+    return OK
+
+
+def readJournal(path):  # {key: last record} from a journal; missing file = empty, torn last line ignored
+    records = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("journal %s: skipping partial line %r" % (path, line[:80]))
+                    continue
+                records[record["key"]] = record
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def completedKeys(path):  # keys of rows that finished OK (what --resume skips)
+    return {key for key, record in readJournal(path).items() if record["status"] == OK}
+
+
+def skipCompleted(rows, done, stats=None):  # generator: rows whose key is not in done
+    for row in rows:
+        if rowKey(row) in done:
+            if stats is not None:
+                stats["skipped"] = stats.get("skipped", 0) + 1
+            continue
+        yield row
+
+
+class RowJournal(object):
+    def __init__(self, path, fsyncEvery=100, fsyncSecs=1.0):
+        self.path = path
+        self.fsyncEvery = fsyncEvery
+        self.fsyncSecs = fsyncSecs
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.unsynced = 0
+        self.lastSync = time.time()
+        self.count = 0
+
+    def record(self, row, r, elapsed):
+        line = json.dumps({"key":rowKey(row), "rowNum":row.get("rowNum"), "status":rowStatus(r),
+                           "guid":r, "elapsed":round(elapsed, 3), "ts":round(time.time(), 3)}) + '\n'
+        with self.lock:
+            os.write(self.fd, line.encode())
+            self.count += 1
+            self.unsynced += 1
+            if self.unsynced >= self.fsyncEvery or time.time() - self.lastSync >= self.fsyncSecs:
+                self._sync()
+
+    def _sync(self):  # caller holds lock
+        os.fsync(self.fd)
+        self.unsynced = 0
+        self.lastSync = time.time()
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                self._sync()
+                os.close(self.fd)
+                self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
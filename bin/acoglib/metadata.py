@@ -0,0 +1,196 @@
+# acoglib.metadata -- Metadata booking API client (pooled keep-alive session) and the --file prefetch stage
+
+import collections
+import concurrent.futures
+import datetime
+import json
+import logging
+import sys
+import time
+import urllib.parse
+
+import requests, requests.adapters
+
+from .defaults import defaultPaxArray, futureDate
+from .journal import rowKey
+
+logger = logging.getLogger("acog")
+
+BOOKING_KEYS = ("BookingNo", "BookingStatus", "Currency", "TourName", "TourStatus", "EmbarkDate",
+                "GuestDepartureDate", "Office", "Passengers")  # the parts of a Metadata booking acog uses
+
+
+class MetadataClient(object):
+    # one keep-alive connection pool shared by all Metadata calls (and threads) of an AcogClient
+    def __init__(self, baseUrl, hostName=None, poolSize=10, verbose=0, metrics=None, cache=None):
+        self.baseUrl = baseUrl.rstrip('/')
+        self.hostName = hostName
+        self.verbose = verbose
+        self.metrics = metrics  # optional metrics.Metrics ("metadata" service)
+        self.cache = cache  # optional bookingcache.BookingCache, keyed by self.host
+        self.host = urllib.parse.urlsplit(self.baseUrl).netloc or self.baseUrl
+        self.session = requests.Session()
+        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1,
+                           pool_maxsize=max(10, poolSize)))
+
+    def url(self, bookingId):
+        return "%s/api/booking/getdetails/%s" % (self.baseUrl, bookingId)
+
+    def get(self, url):  # session.get, timed into self.metrics (error: exception name or HTTP status)
+        t = time.monotonic()
+        error = None
+        try:
+            r = self.session.get(url, timeout=9)
+            error = "HTTP %s" % r.status_code if r.status_code >= 400 else None
+            return r
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if self.metrics:
+                self.metrics.record("metadata", "getdetails", time.monotonic() - t, error)
+
+    def booking(self, bookingId):
+        # (trimmed booking or None if invalid, seconds the API took or None from the cache); raises on API errors
+        if self.cache:
+            hit, booking = self.cache.get(self.host, bookingId)
+            if hit:
+                return booking, None
+        url = self.url(bookingId)
+        t = time.monotonic()
+        r = self.get(url)
+        r.raise_for_status()  # (never cache an outage)
+        booking = trimBooking(url, r.json()[0])
+        if self.cache:
+            self.cache.put(self.host, bookingId, booking)
+        return booking, time.monotonic() - t
+
+    def fetchBooking(self, bookingId):
+        # thread-safe lookup; returns trimmed booking dict, or None for invalid booking / API error
+        try:
+            return self.booking(bookingId)[0]
+        except Exception as e:
+            logger.warning("Metadata %s: %s" % (self.url(bookingId), e))
+            return None
+
+    def callMetadata(self, bookingId, verbosityLevel=0):  # returns a large-ish dict structure
+        paxArray = defaultPaxArray()
+        pax1note = pax2note = "(no pax yet)"
+        try:
+            url = self.url(bookingId)
+            logger.info(("Metadata url %s (%s)\n" % (url,self.hostName)) if (verbosityLevel > 0) else '')
+            booking, elapsed = self.booking(bookingId)
+            assert booking, "Invalid booking # %s" % bookingId  # raise
+        except Exception as e:
+            embarkDate=futureDate
+            departDate=embarkDate
+            embarkNote="default"
+            pax1note = pax2note = "ERROR"
+            print("Exception %s" % e)  # https://martinfowler.com/articles/microservices.html#SmartEndpointsAndDumbPipes
+            print("Could not get live embarkDate from Metadata %s --using arg/defaults..." % url)
+            return {"embarkNote":embarkNote,"pax1note":pax1note,"pax2note":pax2note,"paxArray":paxArray}
+        else:
+            for k in paxArray[0].keys():
+                paxArray[0][k] = booking.get(k)  # booking info that applies to all pax
+            departDate = booking["GuestDepartureDate"].split('T')[0]
+            embarkDate = booking["EmbarkDate"].split('T')[0]
+            embarkNote = ("Metadata cache (departDate:%s) " % departDate if elapsed is None else
+                          "API elapsed %s (departDate:%s) " % (datetime.timedelta(seconds=elapsed),departDate))
+            paxArray[0]["EmbarkDate"] = embarkDate
+            paxArray[0]["GuestDepartureDate"] = departDate
+
+            # print("\nDEBUG: paxArray: %s" % json.dumps(paxArray,sort_keys=True))
+            paxArray[0]["paxCount"] = len(booking["Passengers"])
+            for paxObj in booking["Passengers"]:
+                if self.verbose and verbosityLevel > 1:
+                    print("\nDEBUG: paxObj (paxArray[%s]): %s" % (paxObj['paxnum'],json.dumps(paxObj,sort_keys=True)))
+                paxArray[paxObj['paxnum']] = paxObj
+            # Cognito can be picky about matching names to Metadata exactly
+            # nice ToDo: list-comprehension dict-values-only
+            pax1note = [paxArray[1]["paxnum"],paxArray[1]["Title"],paxArray[1]["FirstName"],
+                        paxArray[1]["MiddleName"], paxArray[1]["LastName"],paxArray[1]["Suffix"]
+                        ]
+            pax2note = [paxArray[2]["paxnum"],paxArray[2]["Title"],paxArray[2]["FirstName"],
+                        paxArray[2]["MiddleName"], paxArray[2]["LastName"],paxArray[1]["Suffix"]
+                    ] if paxArray[2].get("paxnum") else "(no pax2)"
+
+            if self.verbose and verbosityLevel > 0:
+                paxArray[0].pop("Pricing",None)
+                paxArray[0].pop("ExtensionDetails",None)  # toss metadata we don't care about
+                print("    %s" % (json.dumps(paxArray[0])))
+                print(" \t %s" % (pax1note))
+                print(" \t %s" % (pax2note))
+
+        return {"embarkNote":embarkNote,"pax1note":pax1note,"pax2note":pax2note,"paxArray":paxArray}
+
+
+def trimBooking(url, booking):  # getdetails response element -> the BOOKING_KEYS acog uses, or None if invalid
+    if not booking.get("BookingNo"):
+        logger.info("Metadata %s: %s" % (url, booking.get("Details")))
+        return None
+    return {k:booking.get(k) for k in BOOKING_KEYS}
+
+
+def bookingPaxArray(booking):  # paxArray shape (as callMetadata builds it) from a fetchBooking result
+    pax = defaultPaxArray()
+    pax[0] = {k:booking.get(k) for k in pax[0].keys()}
+    pax[0]["EmbarkDate"] = str(booking["EmbarkDate"]).split('T')[0]
+    pax[0]["GuestDepartureDate"] = str(booking["GuestDepartureDate"]).split('T')[0]
+    pax[0]["paxCount"] = len(booking.get("Passengers") or [])
+    for paxObj in booking.get("Passengers") or []:
+        if paxObj.get("paxnum") in (1, 2):
+            pax[paxObj["paxnum"]] = paxObj
+    return pax
+
+
+def prefetchBookings(metadata, rows, workers=8, defaultFirstName=None, lookahead=None):
+    # pipeline stage between batch.readUserRows and batch.doAddUserRows: the bookings of the next lookahead
+    # rows (default workers * 4) are fetched concurrently, each bookingId once while any of its rows is in
+    # the window (several pax often share one booking); rows are handed on in file order as soon as their
+    # booking is in, so Metadata latency overlaps with the Cognito writes and stdin/.gz input still streams
+    lookahead = lookahead if lookahead else workers * 4
+    print("Metadata prefetch: --metadataWorkers %s, %s rows ahead" % (workers, lookahead), file=sys.stderr)
+    window = collections.deque()  # rows read, not yet handed on
+    fetching = {}  # bookingId: [future, rows of it in window]
+    stats = {"rows":0, "bookings":0}
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def handOn():
+        row = window.popleft()
+        entry = fetching.get(row["un"])
+        if entry:
+            booking = entry[0].result()
+            entry[1] -= 1
+            if not entry[1]:
+                del fetching[row["un"]]
+            if booking:
+                applyBooking(row, booking, defaultFirstName)
+        return row
+
+    try:
+        for row in rows:
+            stats["rows"] += 1
+            if str(row["un"]).isnumeric():
+                if row["un"] not in fetching:
+                    fetching[row["un"]] = [pool.submit(metadata.fetchBooking, row["un"]), 0]
+                    stats["bookings"] += 1
+                fetching[row["un"]][1] += 1
+            window.append(row)
+            if len(window) >= lookahead:
+                yield handOn()
+        while window:
+            yield handOn()
+        print("Metadata prefetch: %(bookings)s booking fetches for %(rows)s rows" % stats, file=sys.stderr)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def applyBooking(row, booking, defaultFirstName=None):  # a readUserRows row, filled in from its fetchBooking result
+    row.setdefault("key", rowKey(row))  # the row as read stays its journal identity (--resume)
+    row["paxArray"] = bookingPaxArray(booking)
+    row["dates"] = {"departureDate":row["paxArray"][0]["GuestDepartureDate"],
+                    "embarkDate":row["paxArray"][0]["EmbarkDate"]}
+    if row["fName"] == defaultFirstName and row["paxArray"][1].get("FirstName"):  # no names in file
+        row["fName"] = row["paxArray"][1]["FirstName"]
+        row["lName"] = row["paxArray"][1]["LastName"]
+    return row
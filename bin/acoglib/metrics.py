@@ -0,0 +1,248 @@
+# acoglib.metrics -- where an acog run's time goes: per-operation calls, error codes, retries, latency
+# cognito-idp is measured through botocore's event hooks (before-parameter-build to after-call/after-call-error: one sample
+# per attempt, so a CogThrottle retry is one more call plus a retry), Metadata by MetadataClient;
+# written at exit as --metrics-out JSON and/or a --metrics-prom Prometheus textfile, with --progress
+# lines on stderr while a batch runs
+
+import functools
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+import botocore
+
+BUCKET_BASE = 0.0001   # latency histogram: log buckets from 0.1ms, each 5% wider than the last
+BUCKET_GROWTH = 1.05   # (constant memory however many calls, percentiles within 5%)
+QUANTILES = (50, 95, 99)
+
+_calling = threading.local()  # the Metrics of the cognito-idp call in progress on this thread (see activate)
+
+
+def _bucket(secs):
+    return 0 if secs <= BUCKET_BASE else int(math.log(secs / BUCKET_BASE, BUCKET_GROWTH)) + 1
+
+
+def _quantile(buckets, count, q):  # upper bound of the bucket holding the q-th percentile
+    if not count:
+        return 0.0
+    rank = q / 100.0 * count
+    seen = 0
+    for i in sorted(buckets):
+        seen += buckets[i]
+        if seen >= rank:
+            return BUCKET_BASE * BUCKET_GROWTH ** i
+    return BUCKET_BASE * BUCKET_GROWTH ** max(buckets)
+
+
+class Metrics(object):
+    '''
+    metrics = Metrics()                        # shared by every thread of a run (AcogClient(metrics=...))
+    metrics.record("metadata", "getdetails", 0.05, error="ReadTimeout")
+    metrics.summary() / writeJson(path) / writePrometheus(path) / progressLine()
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.ops = {}       # (service, operation): {"count", "errors": {code: n}, "retries", "sum", "max", "buckets"}
+        self.counters = {}  # e.g. rows, tokens (see count)
+
+    def _op(self, service, operation):  # call with self.lock held
+        key = (service, operation)
+        if key not in self.ops:
+            self.ops[key] = {"count":0, "errors":{}, "retries":0, "sum":0.0, "max":0.0, "buckets":{}}
+        return self.ops[key]
+
+    def record(self, service, operation, secs, error=None):  # one call (attempt); error: code or exception name
+        i = _bucket(secs)
+        with self.lock:
+            op = self._op(service, operation)
+            op["count"] += 1
+            op["sum"] += secs
+            op["max"] = max(op["max"], secs)
+            op["buckets"][i] = op["buckets"].get(i, 0) + 1
+            if error:
+                op["errors"][error] = op["errors"].get(error, 0) + 1
+
+    def retry(self, service, operation):
+        with self.lock:
+            self._op(service, operation)["retries"] += 1
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def activate(self):  # this thread's next calls record here, whichever Metrics hooked the (shared) client
+        _calling.metrics = self
+
+    def state(self):  # raw JSON-able counts, for merge() in another process (acoglib.shard)
+        with self.lock:
+            return {"started":self.started, "counters":dict(self.counters),
+                    "ops":[[service, operation, dict(op, errors=dict(op["errors"]), buckets=sorted(op["buckets"].items()))]
+                           for (service, operation), op in self.ops.items()]}
+
+    def merge(self, state):  # add another Metrics' state(): histograms merge exactly, so percentiles stay right
+        with self.lock:
+            self.started = min(self.started, state["started"])
+            for name, n in state["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for service, operation, other in state["ops"]:
+                op = self._op(service, operation)
+                op["count"] += other["count"]
+                op["retries"] += other["retries"]
+                op["sum"] += other["sum"]
+                op["max"] = max(op["max"], other["max"])
+                for code, n in other["errors"].items():
+                    op["errors"][code] = op["errors"].get(code, 0) + n
+                for i, n in other["buckets"]:
+                    op["buckets"][i] = op["buckets"].get(i, 0) + n
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~ botocore hooks ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def hookBotocore(self, client, service="cognito-idp"):
+        # time every call of a boto3 client (or anything with botocore-style meta.events), as `service`
+        # (botocore's own event names say cognito-identity-provider; CogThrottle's retries say cognito-idp)
+        events = client.meta.events
+        events.register("before-parameter-build", self._start, unique_id="acog-metrics-start")
+        events.register("after-call", functools.partial(self._afterCall, service), unique_id="acog-metrics-after")
+        events.register("after-call-error", functools.partial(self._afterCallError, service),
+                        unique_id="acog-metrics-error")
+
+    def _start(self, context, **kwargs):  # the first per-call event (before-call may be answered by a Stubber)
+        context["acogStart"] = time.monotonic()
+        context["acogMetrics"] = getattr(_calling, "metrics", None) or self  # acog.py serve: one client, many runs
+
+    def _afterCall(self, service, http_response, parsed, model, context, **kwargs):
+        error = parsed.get("Error", {}).get("Code", "HTTP %s" % http_response.status_code) \
+                if http_response.status_code >= 300 else None
+        self._finish(service, model.name, context, error)
+
+    def _afterCallError(self, service, exception, context, event_name, **kwargs):  # no response: connection/timeout
+        self._finish(service, event_name.split('.')[-1], context, type(exception).__name__)
+
+    def _finish(self, service, operationName, context, error):
+        if "acogStart" in context:
+            context.pop("acogMetrics", self).record(service, botocore.xform_name(operationName),
+                                                    time.monotonic() - context.pop("acogStart"), error)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~ reports ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _stats(self, op):
+        stats = {"count":op["count"], "errors":dict(op["errors"]), "retries":op["retries"],
+                 "mean":round(op["sum"] / op["count"], 4) if op["count"] else 0.0, "max":round(op["max"], 4)}
+        for q in QUANTILES:
+            stats["p%s" % q] = round(min(op["max"], _quantile(op["buckets"], op["count"], q)), 4)
+        return stats
+
+    def summary(self):  # JSON-able {"started", "elapsed", "counters", "operations": {"service.operation": stats}}
+        with self.lock:
+            ops = {"%s.%s" % key:self._stats(op) for key, op in sorted(self.ops.items())}
+            counters = dict(self.counters)
+        return {"started":time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "elapsed":round(time.time() - self.started, 3), "counters":counters, "operations":ops}
+
+    def services(self):  # per-service totals: {service: {"count", "errors", "retries", "p95"}}
+        with self.lock:
+            merged = {}
+            for (service, operation), op in self.ops.items():
+                m = merged.setdefault(service, {"count":0, "errors":0, "retries":0, "buckets":{}})
+                m["count"] += op["count"]
+                m["errors"] += sum(op["errors"].values())
+                m["retries"] += op["retries"]
+                for i, n in op["buckets"].items():
+                    m["buckets"][i] = m["buckets"].get(i, 0) + n
+        for m in merged.values():
+            m["p95"] = _quantile(m.pop("buckets"), m["count"], 95)
+        return merged
+
+    def progressLine(self):
+        elapsed = time.time() - self.started
+        with self.lock:
+            counters = dict(self.counters)
+        parts = ["%s %s (%.1f/s)" % (name, n, n / elapsed if elapsed else 0) for name, n in sorted(counters.items())]
+        for service, m in sorted(self.services().items()):
+            parts.append("%s %s calls, %s errors, %s retries, p95 %.3fs" % (
+                         service, m["count"], m["errors"], m["retries"], m["p95"]))
+        return "progress %.0fs: %s" % (elapsed, " | ".join(parts) if parts else "no calls yet")
+
+    def writeJson(self, path):
+        _writeFile(path, json.dumps(self.summary(), indent=1) + "\n")
+
+    def writePrometheus(self, path, labels=None):
+        # node_exporter textfile-collector format; labels: extra {name: value} on every sample (pool, action)
+        extra = ''.join(',%s="%s"' % (k, _escape(v)) for k, v in sorted((labels or {}).items()))
+        with self.lock:
+            ops = sorted((key, self._stats(op), op["sum"]) for key, op in self.ops.items())
+            counters = sorted(self.counters.items())
+        lines = ["# HELP acog_requests_total API calls (attempts) by service and operation",
+                 "# TYPE acog_requests_total counter"]
+        lines += ['acog_requests_total{service="%s",operation="%s"%s} %s' % (s, o, extra, st["count"])
+                  for (s, o), st, total in ops]
+        lines += ["# HELP acog_request_errors_total failed API calls by error code",
+                  "# TYPE acog_request_errors_total counter"]
+        lines += ['acog_request_errors_total{service="%s",operation="%s",code="%s"%s} %s' % (s, o, _escape(code), extra, n)
+                  for (s, o), st, total in ops for code, n in sorted(st["errors"].items())]
+        lines += ["# HELP acog_request_retries_total calls retried after throttling/transient errors",
+                  "# TYPE acog_request_retries_total counter"]
+        lines += ['acog_request_retries_total{service="%s",operation="%s"%s} %s' % (s, o, extra, st["retries"])
+                  for (s, o), st, total in ops]
+        lines += ["# HELP acog_request_duration_seconds API call latency",
+                  "# TYPE acog_request_duration_seconds summary"]
+        for (s, o), st, total in ops:
+            for q in QUANTILES:
+                lines.append('acog_request_duration_seconds{service="%s",operation="%s",quantile="%s"%s} %s' % (
+                             s, o, q / 100.0, extra, st["p%s" % q]))
+            lines.append('acog_request_duration_seconds_sum{service="%s",operation="%s"%s} %.6f' % (s, o, extra, total))
+            lines.append('acog_request_duration_seconds_count{service="%s",operation="%s"%s} %s' % (
+                         s, o, extra, st["count"]))
+        for name, n in counters:
+            lines += ["# TYPE acog_%s_total counter" % name, "acog_%s_total{%s} %s" % (name, extra.lstrip(','), n)]
+        lines += ["# TYPE acog_run_duration_seconds gauge",
+                  "acog_run_duration_seconds{%s} %.3f" % (extra.lstrip(','), time.time() - self.started),
+                  "# TYPE acog_run_timestamp_seconds gauge",
+                  "acog_run_timestamp_seconds{%s} %.0f" % (extra.lstrip(','), time.time())]
+        _writeFile(path, "\n".join(lines) + "\n")
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _writeFile(path, text):  # atomic (the textfile collector may read it at any moment)
+    tmp = "%s.%s.tmp" % (path, os.getpid())
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class ProgressReporter(object):
+    '''
+    with ProgressReporter(metrics, every=30):   # a Metrics.progressLine on stderr every 30s until the block ends
+        doAddUserRows(acog, rows)               # (every=0: off)
+    '''
+
+    def __init__(self, metrics, every=30, out=None):
+        self.metrics = metrics
+        self.every = every
+        self.out = out
+        self.stop = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        if self.metrics and self.every > 0:
+            self.thread = threading.Thread(target=self._run, name="acog-progress", daemon=True)
+            self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop.wait(self.every):
+            print(self.metrics.progressLine(), file=self.out if self.out else sys.stderr, flush=True)
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        if self.thread:
+            self.thread.join()
+        return False
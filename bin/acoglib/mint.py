@@ -0,0 +1,55 @@
+# acoglib.mint -- acog.py mint-tokens: IdTokens for many users at once (API load tests)
+# SRP logins run concurrently on one AcogClient (shared throttled cognito-idp client and token cache);
+# "username<TAB>IdToken<TAB>exp" lines are streamed in completion order
+
+import sys
+import time
+
+from .batch import openRows, runBounded
+from .records import userAttribute
+from .tokencache import tokenExp
+
+
+def readUsernames(path):  # one username (email) per line, first CSV/TSV column; '#' comments and blanks skipped
+    with openRows(path) as f:
+        for line in f:
+            username = line.replace('\t', ',').split(',')[0].strip()
+            if username and not username.startswith('#') and '@' in username:
+                yield username
+
+
+def poolUsernames(acog, Filter):  # emails of the users matching a list-users filter ('' = whole pool)
+    for user in acog.queryUsers(Filter=Filter, attributes=["email"]):
+        email = userAttribute(user, "email")
+        if email:
+            yield email
+
+
+def mintTokens(acog, usernames, workers=8, out=None):
+    # returns {"ok", "errors", "elapsed", "secs": per-login seconds}; failures are reported on stderr
+    out = out if out else sys.stdout
+    stats = {"ok":0, "errors":0, "elapsed":0.0, "secs":[]}
+    t0 = time.time()
+
+    def mint(username):
+        t = time.time()
+        idToken = acog.generateIdToken(username)
+        return idToken, time.time() - t
+
+    def emit(username, future):
+        try:
+            idToken, secs = future.result()
+        except Exception as e:
+            stats["errors"] += 1
+            print("ERROR: %s: %s: %s" % (username, type(e).__name__, e), file=sys.stderr)
+            return
+        stats["ok"] += 1
+        stats["secs"].append(secs)
+        if acog.metrics:
+            acog.metrics.count("tokens")
+        out.write("%s\t%s\t%s\n" % (username, idToken, tokenExp(idToken)))
+        out.flush()
+
+    runBounded(mint, ((username, (username,)) for username in usernames), emit, workers=workers)
+    stats["elapsed"] = time.time() - t0
+    return stats
@@ -0,0 +1,54 @@
+# acoglib.poolcache -- on-disk TTL cache for Cognito pool discovery
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("acog")
+
+
+def defaultCacheDir():  # $ACOG_CACHE_DIR, default ~/.cache/acog (pool cache, snapshots)
+    return os.environ.get("ACOG_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "acog"))
+
+
+class PoolCache(object):
+    # on-disk TTL cache for pool discovery: list_user_pools, pool name->Id resolution, describe_user_pool
+    # one JSON file per AWS profile+region, under $ACOG_CACHE_DIR (default ~/.cache/acog)
+    def __init__(self, profile, region, ttl=86400, refresh=False, cacheDir=None):
+        cacheDir = cacheDir or defaultCacheDir()
+        self.path = os.path.join(cacheDir, "pools-%s-%s.json" % (profile, region))
+        self.ttl = ttl
+        self.refresh = refresh
+        self.written = set()  # keys fetched live during this run are good even with --refresh-cache
+        self.lock = threading.Lock()  # put (one instance may serve several AcogClients, see fanout)
+        try:
+            with open(self.path) as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+
+    def get(self, key):  # cached value, or None if missing/expired
+        entry = self.data.get(key)
+        if entry is None or (self.refresh and key not in self.written):
+            return None
+        if time.time() - entry["cachedAt"] > self.ttl:
+            return None
+        logger.debug("pool cache hit %s (%s)" % (key, self.path))
+        return entry["value"]
+
+    def put(self, key, value):  # stores JSON-ified copy (datetimes become strings), returns it
+        value = json.loads(json.dumps(value, default=str))
+        with self.lock:
+            self.data[key] = {"cachedAt":time.time(), "value":value}
+            self.written.add(key)
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp = "%s.%s.tmp" % (self.path, os.getpid())
+                with open(tmp, "w") as f:
+                    json.dump(self.data, f)
+                os.replace(tmp, self.path)  # atomic, for concurrent Jenkins jobs
+            except OSError as e:
+                logger.warning("could not write pool cache %s: %s" % (self.path, e))
+        return value
@@ -0,0 +1,95 @@
+# acoglib.purge -- acog.py purge: delete many users in one run (test-pool cleanup)
+# users come from a --file of emails/bookingIds (resolved in bulk, see attribs.resolveGUIDs) or from a
+# list-users --filter, optionally only those created before --created-before; the filter is streamed page by
+# page with admin_delete_user calls running concurrently (bounded window) under the shared CogThrottle
+
+import datetime
+import sys
+import time
+
+import botocore.exceptions
+
+from .attribs import resolveGUIDs
+from .batch import openRows, runBounded
+from .records import userAttribute
+
+
+def readKeys(path):  # emails/bookingIds, first CSV/TSV column; '#' comments, blanks and headings skipped
+    with openRows(path) as f:
+        for line in f:
+            key = line.replace('\t', ',').split(',')[0].strip()
+            if key and not key.startswith('#') and ('@' in key or key.isnumeric()):
+                yield key
+
+
+def parseDate(value):  # --created-before: YYYY-MM-DD (UTC midnight) or ISO timestamp -> aware datetime
+    when = datetime.datetime.fromisoformat(value)
+    return when if when.tzinfo else when.replace(tzinfo=datetime.timezone.utc)
+
+
+def _created(user):  # UserCreateDate as an aware datetime (a str when read back from the snapshot)
+    created = user.get("UserCreateDate")
+    if isinstance(created, str):
+        created = datetime.datetime.fromisoformat(created)
+    return created
+
+
+def filterCandidates(acog, Filter, createdBefore=None):
+    # generator of (email, Username) for users matching Filter, one list_users page at a time
+    for user in acog.queryUsers(Filter=Filter, attributes=["email"]):
+        if createdBefore is None or (_created(user) and _created(user) < createdBefore):
+            yield userAttribute(user, "email"), user["Username"]
+
+
+def fileCandidates(acog, keys, workers=8, missing=None):
+    # (email or bookingId key, GUID) per file key that matches a user; a bookingId only matches
+    # "<bookingId>@..." (never a longer bookingId); unmatched keys are appended to missing
+    keys = list(dict.fromkeys(keys))
+    guids = resolveGUIDs(acog, [key if '@' in key else key + '@' for key in keys], workers=workers)
+    seen = set()  # a bookingId and its email in one file are one user
+    for key in keys:
+        guid = guids.get(key if '@' in key else key + '@')
+        if guid:
+            if guid not in seen:
+                seen.add(guid)
+                yield key, guid
+        elif missing is not None:
+            missing.append(key)
+
+
+def purgeUsers(acog, candidates, workers=8, dryRun=False, quiet=False, out=None):
+    # admin_delete_user for each (label, Username) candidate; returns
+    # {"matched", "deleted", "notFound", "errors", "elapsed"}; dryRun: count (and list) only
+    out = out if out else sys.stdout
+    stats = {"matched":0, "deleted":0, "notFound":0, "errors":0, "elapsed":0.0}
+    t0 = time.time()
+
+    def finish(label, username, future):
+        try:
+            future.result()
+        except Exception as e:  # one failed delete (after CogThrottle's retries) doesn't stop the purge
+            if isinstance(e, botocore.exceptions.ClientError) and \
+               e.response["Error"]["Code"] == "UserNotFoundException":  # already gone (e.g. a re-run)
+                stats["notFound"] += 1
+                return
+            stats["errors"] += 1
+            print("ERROR: %s (%s): %s" % (label, username, e), file=sys.stderr)
+            return
+        stats["deleted"] += 1
+        if acog.metrics:
+            acog.metrics.count("deleted")
+        if not quiet:
+            print("  deleted %s (%s)" % (label, username), file=out)
+
+    def deletes():  # (key, args) for runBounded; dryRun: none
+        for label, username in candidates:
+            stats["matched"] += 1
+            if dryRun:
+                if not quiet:
+                    print("  would delete %s (%s)" % (label, username), file=out)
+                continue
+            yield (label, username), (username,)
+
+    runBounded(acog.deleteUser, deletes(), lambda key, future: finish(*key, future), workers=workers)
+    stats["elapsed"] = time.time() - t0
+    return stats
@@ -0,0 +1,63 @@
+# acoglib.records -- flattened user records and streaming NDJSON/CSV/TSV writers (list-users --format)
+
+import csv
+import datetime
+import json
+
+USER_FIELDS = ["Username", "UserStatus", "Enabled", "UserCreateDate", "UserLastModifiedDate"]  # non-attribute
+DEFAULT_COLUMNS = USER_FIELDS + ["sub", "email", "email_verified", "given_name", "family_name",
+                                 "custom:userType", "custom:booking"]  # csv/tsv columns unless --fields
+FORMATS = ("ndjson", "csv", "tsv")
+
+
+def flattenUser(user):  # list_users "Users" entry -> one flat dict (attributes by Name, dates as ISO strings)
+    record = {}
+    for k in USER_FIELDS:
+        if k in user:
+            v = user[k]
+            record[k] = v.isoformat() if isinstance(v, datetime.datetime) else v
+    for attr in user.get("Attributes", []):
+        record[attr["Name"]] = attr["Value"]
+    return record
+
+
+def attributeValue(attributes, name, default=None):  # Value of the named entry of a [{"Name", "Value"}] list
+    return next((attr["Value"] for attr in attributes if attr["Name"] == name), default)
+
+
+def userAttribute(user, name, default=None):  # one attribute of a list_users/admin_get_user/snapshot entry
+    return attributeValue(user.get("Attributes", []), name, default)
+
+
+class RecordWriter(object):
+    # writes one flattened user per line, flushing per page so output streams while listing
+    def __init__(self, out, fmt="ndjson", fields=None):
+        if fmt not in FORMATS:
+            raise ValueError("format %s not in %s" % (fmt, FORMATS))
+        self.out = out
+        self.fmt = fmt
+        self.count = 0
+        if fmt == "ndjson":
+            self.fields = fields  # None = everything
+        else:
+            self.fields = fields if fields else DEFAULT_COLUMNS
+            self.csv = csv.DictWriter(out, fieldnames=self.fields, extrasaction="ignore",
+                                      delimiter=',' if fmt == "csv" else '\t', lineterminator='\n')
+            self.csv.writeheader()
+
+    def write(self, record):
+        if self.fmt == "ndjson":
+            if self.fields:
+                record = {k:record[k] for k in self.fields if k in record}
+            self.out.write(json.dumps(record, default=str) + '\n')
+        else:
+            self.csv.writerow(record)
+        self.count += 1
+
+    def writeUsers(self, users, pageSize=60):  # users: iterable of list_users entries; returns count
+        for user in users:
+            self.write(flattenUser(user))
+            if self.count % pageSize == 0:
+                self.out.flush()
+        self.out.flush()
+        return self.count
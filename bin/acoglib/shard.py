@@ -0,0 +1,169 @@
+# acoglib.shard -- add-user --file --shards N: the file split across N acog.py processes (CSV parsing, JSON
+# building and printing then use N cores); a shard is either a byte range of the (uncompressed) file, cut at line
+# starts, or (--shard-by hash, also for .gz) the rows whose bookingId hashes to it, which keeps every row of a
+# booking in one shard so shards never race on one user (each shard still reads, and decompresses, the whole file,
+# but drops the other shards' lines unparsed)
+# each shard runs at 1/N of --quotaScale (together: the run's budget); the shards get the parent's pool list and
+# pool (no UserPoolRead calls of their own), and --shards is capped (maxShards) so every quota category the
+# rows use keeps at least throttle.MIN_RATE per shard; each shard appends to the one --journal (single
+# O_APPEND writes, see acoglib.journal), prints its rows to <file>.shard<i>.log and its stderr prefixed with
+# "shard i:", and at exit writes its stats, raw metrics, throttle and Metadata cache counts to a report the
+# parent merges (shards share the on-disk booking cache: a booking one shard fetched is a hit for the next run)
+
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import zlib
+
+from .client import AcogError
+from .throttle import COG_QUOTAS, MIN_RATE
+
+THROTTLE_COUNTS = ("calls", "throttles", "retries", "backoffSecs", "waitSecs")
+ROW_CATEGORIES = ("UserAuthentication", "UserCreation", "UserList", "UserRead", "UserUpdate")  # add-user rows
+
+
+def maxShards(quotaScale):  # most shards whose 1/N of quotaScale still gives each ROW_CATEGORIES >= MIN_RATE
+    return max(1, int(min(COG_QUOTAS[category] for category in ROW_CATEGORIES) * quotaScale / MIN_RATE))
+
+
+def byteRanges(path, shards):
+    # [(start, end, rowNum)] covering the data lines (after the heading), cut at line starts; rowNum: the file's
+    # row number of the range's first line, so a shard's rows (journal, output) keep their numbers in the file
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        cuts = [len(f.readline())]
+        for i in range(1, shards):
+            f.seek(max(cuts[-1], size * i // shards))
+            f.readline()  # on to the next line start
+            cuts.append(min(size, f.tell()))
+    cuts.append(size)
+    return list(zip(cuts, cuts[1:], lineCounts(path, cuts[:-1])))
+
+
+def lineCounts(path, offsets):  # lines (newlines) before each of the ascending byte offsets
+    counts, lines, pos = [], 0, 0
+    with open(path, "rb") as f:
+        for offset in offsets:
+            while pos < offset:
+                chunk = f.read(min(1 << 20, offset - pos))
+                if not chunk:
+                    break
+                lines += chunk.count(b"\n")
+                pos += len(chunk)
+            counts.append(lines)
+    return counts
+
+
+def shardOf(bookingId, shards):  # stable across processes and runs (unlike hash())
+    return zlib.crc32(str(bookingId).encode("utf-8")) % shards
+
+
+def hashLines(lines, column, delimiter, shard, shards, start=1):
+    # generator of (rowNum, CSV values) of the data lines whose bookingId (column index, None: no such column)
+    # hashes to shard; the bookingId is cut from the raw line, so only a 1/N share of the lines is parsed
+    for rowNum, line in enumerate(lines, start=start):
+        bookingId = '%s'  # (readUserRows' default: rows without one all go to one shard)
+        if column is not None:
+            values = line.split(delimiter, column + 1) if '"' not in line else next(
+                     csv.reader([line], delimiter=delimiter), [])
+            bookingId = values[column].strip() if column < len(values) else bookingId
+        if shardOf(bookingId, shards) == shard:
+            yield rowNum, next(csv.reader([line], delimiter=delimiter), [])
+
+
+def readArgs(path):  # the argparse namespace (as a dict) runShards wrote for one shard
+    with open(path) as f:
+        return json.load(f)
+
+
+def writeReport(path, acog, stats, journal=None, resumeStats=None):  # a shard's results, for mergeReports
+    report = {"stats":stats, "metrics":acog.metrics.state() if acog.metrics else None,
+              "throttle":{k:getattr(acog.throttle, k) for k in THROTTLE_COUNTS},
+              "journaled":journal.count if journal else 0, "skipped":(resumeStats or {}).get("skipped", 0),
+              "bookingCache":acog.metadataCache.stats if acog.metadataCache else None}
+    with open(path, "w") as f:
+        json.dump(report, f)
+
+
+def _relay(stream, prefix, out):  # a shard's stderr onto ours, line by line
+    for line in stream:
+        out.write(prefix + line)
+        out.flush()
+
+
+def runShards(script, args, shards, by, logPath, out=None, pool=None):
+    # one `python script --shard-args ...` process per shard of args.file (args: argparse dict); returns one
+    # report per shard (None for a shard that died before writing one) and each shard's exit code
+    # pool: AcogClient.lazy state the parent resolved ({"userPools":..., "pool":[name, Id]}), for every shard
+    out = out if out else sys.stderr
+    ranges = byteRanges(args["file"], shards) if by == "bytes" else [None] * shards
+    tmp = tempfile.mkdtemp(prefix="acog-shards-")
+    procs = []
+    try:
+        for i in range(shards):
+            shardArgs = dict(args, shards=1, shard=[i, shards, by, ranges[i]], quotaScale=args["quotaScale"] / shards,
+                             shard_report=os.path.join(tmp, "report%s.json" % i), shard_args=None, shard_pool=pool,
+                             quiet=True, suspend_triggers=False, noVerify=True, metrics_out=None, metrics_prom=None)
+            argsPath = os.path.join(tmp, "args%s.json" % i)
+            with open(argsPath, "w") as f:
+                json.dump(shardArgs, f)
+            with open(logPath % i, "w") as log:
+                proc = subprocess.Popen([sys.executable, script, "--shard-args", argsPath], stdout=log,
+                                        stderr=subprocess.PIPE, text=True)
+            relay = threading.Thread(target=_relay, args=(proc.stderr, "shard %s: " % i, out), daemon=True)
+            relay.start()
+            procs.append((proc, relay))
+            print("  shard %s/%s: pid %s, %s, output %s" % (i, shards, proc.pid, "bytes %s-%s" % tuple(ranges[i][:2])
+                  if ranges[i] else "bookingId hash", logPath % i), file=out)
+        codes = []
+        for proc, relay in procs:
+            codes.append(proc.wait())
+            relay.join()
+        reports = []
+        for i in range(shards):
+            try:
+                with open(os.path.join(tmp, "report%s.json" % i)) as f:
+                    reports.append(json.load(f))
+            except (OSError, ValueError):
+                reports.append(None)
+        return reports, codes
+    finally:
+        for proc, relay in procs:  # Ctrl-C/SIGTERM/errors: no shard outlives the run
+            if proc.poll() is None:
+                proc.terminate()
+                proc.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def mergeReports(acog, reports):
+    # doAddUserRows-style stats of all shards, plus "journaled", "skipped"; shard metrics and throttle counts
+    # (and Metadata cache counts) are added to acog's (so the run summary, --metrics-out and --metrics-prom
+    # cover every shard)
+    stats = {"rows":0, "ok":0, "errors":0, "fatal":0, "rowSecs":[], "guids":[], "journaled":0, "skipped":0}
+    for report in reports:
+        if report is None:
+            continue
+        for k in ("rows", "ok", "errors", "fatal", "rowSecs", "guids"):
+            stats[k] += report["stats"][k]
+        stats["journaled"] += report["journaled"]
+        stats["skipped"] += report["skipped"]
+        if acog.metrics and report["metrics"]:
+            acog.metrics.merge(report["metrics"])
+        with acog.throttle.lock:
+            for k in THROTTLE_COUNTS:
+                setattr(acog.throttle, k, getattr(acog.throttle, k) + report["throttle"][k])
+        if report.get("bookingCache") and acog.metadataCache:
+            acog.metadataCache.add(report["bookingCache"])
+    return stats
+
+
+def checkShardable(args, by):  # AcogError if args.file can't be split that way
+    if args.file == '-':
+        raise AcogError("--shards needs a --file path (stdin can't be split)")
+    if by == "bytes" and args.file.endswith(".gz"):
+        raise AcogError("--shard-by bytes needs an uncompressed --file (use --shard-by hash for .gz)")
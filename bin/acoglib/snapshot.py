@@ -0,0 +1,220 @@
+# acoglib.snapshot -- local SQLite index of a user pool (acog.py snapshot, --use-snapshot)
+# existence checks, GUID lookups and list-users filters are answered from the index instead of
+# one list_users round-trip (at 30/sec pool-wide quota) each; refresh is incremental on UserLastModifiedDate
+
+import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .poolcache import defaultCacheDir
+from .records import userAttribute
+
+logger = logging.getLogger("acog")
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    sub      TEXT,
+    email    TEXT COLLATE NOCASE,
+    status   TEXT,
+    modified TEXT,
+    user     TEXT  -- list_users "Users" entry as JSON (dates as ISO strings)
+);
+CREATE TABLE IF NOT EXISTS bookings (bookingId TEXT, username TEXT, PRIMARY KEY (bookingId, username));
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE INDEX IF NOT EXISTS users_sub ON users (sub);
+CREATE INDEX IF NOT EXISTS bookings_username ON bookings (username);
+'''
+
+FILTER_COLUMNS = {"email":"email", "sub":"sub", "username":"username"}  # Cognito filter attr -> column
+FILTER_RE = re.compile(r'^\s*([\w:]+)\s*(\^?=)\s*"([^"]*)"\s*$')
+
+
+def snapshotPath(poolId):
+    return os.path.join(defaultCacheDir(), "snapshot-%s.sqlite" % poolId)
+
+
+def _jsonable(user):  # copy of a list_users/admin_create_user entry with datetimes as ISO strings
+    return {k:(v.isoformat() if isinstance(v, datetime.datetime) else v) for k, v in user.items()}
+
+
+def userBookings(user):  # bookingIds in a user's custom:booking JSON list
+    try:
+        return [str(b["bookingId"]) for b in json.loads(userAttribute(user, "custom:booking") or "[]")
+                if b.get("bookingId")]
+    except (ValueError, TypeError, AttributeError):
+        return []
+
+
+class PoolSnapshot(object):
+    # one SQLite file per pool; a single connection shared by all worker threads (serialised by a lock,
+    # every query is an index lookup so the lock is never held for long)
+    def __init__(self, path, poolId):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        stored = self.meta("poolId")
+        if stored and stored != poolId:
+            raise ValueError("snapshot %s is of pool %s, not %s" % (path, stored, poolId))
+        self.poolId = poolId
+
+    def meta(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _setMeta(self, key, value):  # caller holds lock
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def count(self):
+        with self.lock:
+            return self.db.execute("SELECT count(*) FROM users").fetchone()[0]
+
+    def age(self):  # seconds since last refresh, or None if never refreshed
+        refreshedAt = self.meta("refreshedAt")
+        return time.time() - float(refreshedAt) if refreshedAt else None
+
+    def describe(self):
+        age = self.age()
+        return "snapshot %s: %s users, %s" % (self.path, self.count(),
+               "refreshed %.0f min ago" % (age / 60) if age is not None else "never refreshed")
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~ writes ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _put(self, user):  # caller holds lock
+        user = _jsonable(user)
+        self.db.execute("INSERT OR REPLACE INTO users (username, sub, email, status, modified, user) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (user["Username"], userAttribute(user, "sub"), userAttribute(user, "email"), user.get("UserStatus"),
+                         user.get("UserLastModifiedDate"), json.dumps(user)))
+        self.db.execute("DELETE FROM bookings WHERE username = ?", (user["Username"],))
+        self.db.executemany("INSERT OR IGNORE INTO bookings (bookingId, username) VALUES (?, ?)",
+                            [(bookingId, user["Username"]) for bookingId in userBookings(user)])
+
+    def put(self, user):  # add/replace one user (e.g. just created), committed immediately
+        with self.lock:
+            self._put(user)
+            self.db.commit()
+
+    def update(self, username, attributes=None, status=None):
+        # apply an admin_update_user_attributes / status change made by this run to the stored copy
+        user = self.get(username)
+        if user is None:
+            return
+        if attributes:
+            merged = {a["Name"]:a["Value"] for a in user.get("Attributes", [])}
+            merged.update({a["Name"]:a["Value"] for a in attributes})
+            user["Attributes"] = [{"Name":k, "Value":v} for k, v in merged.items()]
+        if status:
+            user["UserStatus"] = status
+        self.put(user)
+
+    def remove(self, username):
+        with self.lock:
+            self.db.execute("DELETE FROM users WHERE username = ?", (username,))
+            self.db.execute("DELETE FROM bookings WHERE username = ?", (username,))
+            self.db.commit()
+
+    def refresh(self, acog, full=False, batchSize=1000):
+        # re-list the pool (list_users has no modified-since filter), but only re-index users whose
+        # UserLastModifiedDate changed; users no longer listed are dropped. full=True re-indexes all.
+        t0 = time.time()
+        with self.lock:
+            known = dict(self.db.execute("SELECT username, modified FROM users"))
+        stats = {"listed":0, "changed":0, "removed":0}
+        pending = 0
+        for user in acog.iterUsers():
+            stats["listed"] += 1
+            username = user["Username"]
+            modified = _jsonable(user).get("UserLastModifiedDate")
+            if known.pop(username, None) != modified or full:
+                with self.lock:
+                    self._put(user)
+                stats["changed"] += 1
+                pending += 1
+            if pending >= batchSize:
+                with self.lock:
+                    self.db.commit()
+                pending = 0
+        with self.lock:
+            for username in known:  # deleted from the pool since the last refresh
+                self.db.execute("DELETE FROM users WHERE username = ?", (username,))
+                self.db.execute("DELETE FROM bookings WHERE username = ?", (username,))
+            stats["removed"] = len(known)
+            self._setMeta("poolId", self.poolId)
+            self._setMeta("refreshedAt", t0)
+            self.db.commit()
+        stats["elapsed"] = time.time() - t0
+        return stats
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~ lookups ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def get(self, username):
+        with self.lock:
+            row = self.db.execute("SELECT user FROM users WHERE username = ?", (username,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def findUsername(self, email):  # Username (GUID) of the user with exactly this email, or None
+        with self.lock:
+            row = self.db.execute("SELECT username FROM users WHERE email = ? LIMIT 1", (email,)).fetchone()
+        return row[0] if row else None
+
+    def findSub(self, prefix):  # "sub" of first user with email starting with prefix, or None
+        for user in self.users('email ^= "%s"' % prefix, limit=1):
+            return userAttribute(user, "sub")
+        return None
+
+    def byBooking(self, bookingId):  # every user holding bookingId in custom:booking
+        with self.lock:
+            rows = self.db.execute("SELECT u.user FROM bookings b JOIN users u ON u.username = b.username "
+                                   "WHERE b.bookingId = ? ORDER BY u.email", (str(bookingId),)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def canAnswer(self, Filter):  # True if Filter is one the index can evaluate (else ask Cognito)
+        if not Filter:
+            return True
+        match = FILTER_RE.match(Filter)
+        return bool(match) and match.group(1) in FILTER_COLUMNS
+
+    def users(self, Filter=None, attributes=None, limit=None, batchSize=500):
+        # generator like AcogClient.iterUsers over the snapshot: '' / None, or '<attr> = "v"' / '<attr> ^= "v"'
+        # on email, sub or username (ranges on the NOCASE index, like Cognito's case-insensitive prefix match)
+        where, params = "", []
+        if Filter:
+            match = FILTER_RE.match(Filter)
+            if not match or match.group(1) not in FILTER_COLUMNS:
+                raise ValueError("filter not answerable from snapshot: %s" % Filter)
+            column, op, value = FILTER_COLUMNS[match.group(1)], match.group(2), match.group(3)
+            if op == "=":
+                where, params = " AND %s = ?" % column, [value]
+            elif value:
+                where, params = " AND %s >= ? AND %s < ?" % (column, column), [value, value + "\U0010ffff"]
+        after, yielded = "", 0
+        while True:  # keyset pages, so the lock is only held per batch
+            with self.lock:
+                rows = self.db.execute("SELECT username, user FROM users WHERE username > ?%s "
+                                       "ORDER BY username LIMIT ?" % where,
+                                       [after] + params + [batchSize]).fetchall()
+            for username, user in rows:
+                user = json.loads(user)
+                if attributes:
+                    user["Attributes"] = [a for a in user.get("Attributes", []) if a["Name"] in attributes]
+                yield user
+                yielded += 1
+                if limit and yielded >= limit:
+                    return
+            if len(rows) < batchSize:
+                return
+            after = rows[-1][0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
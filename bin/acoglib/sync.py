@@ -0,0 +1,111 @@
+# acoglib.sync -- acog.py sync: diff an add-user file against the pool, then do only what changed
+# the pool is read once (one paginated list_users pass, or the --use-snapshot index); each row is then
+# CREATE (full doAddUser flow), UPDATE (custom:booking differs: one admin_update_user_attributes) or NOOP
+
+import concurrent.futures
+import json
+import sys
+import time
+
+from .batch import doAddUserRows
+from .defaults import defaultPaxArray
+from .records import userAttribute
+
+CREATE, UPDATE, NOOP = "create", "update", "no-op"
+STATE_ATTRIBUTES = ["sub", "email", "custom:booking", "custom:userType"]  # all sync needs per user
+
+
+def loadPoolState(acog):  # {email (lowercase): list_users entry} for the whole pool, in one pass
+    users = acog.snapshot.users(attributes=STATE_ATTRIBUTES) if acog.snapshot else \
+            acog.iterUsers(attributes=STATE_ATTRIBUTES)
+    state = {}
+    for user in users:
+        email = userAttribute(user, "email")
+        if email:
+            state[email.lower()] = user
+    return state
+
+
+def desiredBookings(acog, row, current):
+    # custom:booking value the row calls for: current list with this booking's entry updated/added, or None if
+    # the current entry already matches; only what the row carries is compared (bookingId, dates, and the
+    # tourName if Metadata filled the row in): a file run without --prefetchMetadata keeps the real tourName
+    dates = {k:str(v).split('T')[0] for k, v in row["dates"].items()}  # as doAddUser normalises them
+    try:
+        bookings = json.loads(current) if current else []
+    except ValueError:
+        bookings = []
+    existing = next((b for b in bookings if str(b.get("bookingId")) == str(row["un"])), None)
+    if row.get("paxArray"):
+        tourName = row["paxArray"][0]["TourName"]
+    else:
+        tourName = (existing or {}).get("tourName", defaultPaxArray()[0]["TourName"])
+    entry = acog.bookingEntry(row["un"], tourName=tourName, dates=dates)
+    if existing is not None:
+        entry = dict(existing, **{k:entry[k] for k in ("tourName", "departureDate", "embarkDate")})
+        if entry == existing:
+            return None
+    return json.dumps([b for b in bookings if str(b.get("bookingId")) != str(row["un"])] + [entry])
+
+
+def planSync(acog, rows, state):
+    # list of (action, row, email, userGUID, custom:booking value) in file order
+    consumer = "MER" in acog.userType.upper()  # only Consumer users carry custom:booking
+    plan, seen = [], set()
+    for row in rows:
+        email = acog.userEmail(row["un"], row["fName"], row["lName"], row["email"])
+        user = state.get(email.lower())
+        if email.lower() in seen:  # repeated row (e.g. several pax lines per booking)
+            plan.append((NOOP, row, email, user["Username"] if user else None, None))
+        elif user is None:
+            plan.append((CREATE, row, email, None, None))
+        else:
+            value = desiredBookings(acog, row, userAttribute(user, "custom:booking")) if consumer else None
+            plan.append((UPDATE if value else NOOP, row, email, user["Username"], value))
+        seen.add(email.lower())
+    return plan
+
+
+def planCounts(plan):
+    counts = {CREATE:0, UPDATE:0, NOOP:0}
+    for step in plan:
+        counts[step[0]] += 1
+    return counts
+
+
+def printPlan(plan, out=sys.stdout, verbose=0):
+    if verbose:
+        for action, row, email, userGUID, value in plan:
+            print("  %s. %-7s %s %s%s" % (row["rowNum"], action, email, userGUID or '',
+                  " custom:booking=%s" % value if value else ''), file=out)
+    counts = planCounts(plan)
+    print("sync plan: %s rows: %s create, %s update, %s no-op" % (
+          len(plan), counts[CREATE], counts[UPDATE], counts[NOOP]), file=out)
+
+
+def runSync(acog, plan, workers=1, journal=None, fast=False):
+    # executes a planSync plan; creates go through doAddUserRows, updates run concurrently
+    stats = {CREATE:None, UPDATE:{"ok":0, "errors":0}, "elapsed":0.0}
+    t0 = time.time()
+    updates = [step for step in plan if step[0] == UPDATE]
+
+    def update(step):
+        action, row, email, userGUID, value = step
+        acog.doAddAttribs(Username=userGUID, UserAttributes=[{"Name":"custom:booking", "Value":value}])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for step, future in zip(updates, [pool.submit(update, step) for step in updates]):
+            try:
+                future.result()
+                stats[UPDATE]["ok"] += 1
+                print("  %s. UPDATED %s (%s)" % (step[1]["rowNum"], step[2], step[3]))
+            except Exception as e:
+                stats[UPDATE]["errors"] += 1
+                print("  %s. ERROR updating %s (%s): %s" % (step[1]["rowNum"], step[2], step[3], e))
+            if acog.metrics:
+                acog.metrics.count("rows")
+
+    stats[CREATE] = doAddUserRows(acog, [step[1] for step in plan if step[0] == CREATE], workers=workers,
+                                  journal=journal, fast=fast)
+    stats["elapsed"] = time.time() - t0
+    return stats
@@ -0,0 +1,157 @@
+# acoglib.throttle -- shared token-bucket rate limiter and retry policy for all Cognito calls
+
+import logging
+import random
+import threading
+import time
+
+import botocore, botocore.config, botocore.exceptions
+
+logger = logging.getLogger("acog")
+
+# default Cognito request-rate quotas (requests/sec), shared by all operations in a category
+# https://docs.aws.amazon.com/cognito/latest/developerguide/limits.html#category_operations
+COG_QUOTAS = {"UserAuthentication":120, "UserCreation":50, "UserRead":120, "UserList":30,
+              "UserUpdate":25, "UserPoolRead":15, "UserPoolUpdate":15, "UserPoolResourceRead":20,
+              "UserPoolResourceUpdate":15, "Other":10}
+MIN_RATE = 1.0  # requests/sec floor of every bucket, however small --quotaScale (or its --shards share) is
+COG_QUOTA_CATEGORIES = {
+    "admin_initiate_auth":"UserAuthentication", "admin_respond_to_auth_challenge":"UserAuthentication",
+    "initiate_auth":"UserAuthentication", "respond_to_auth_challenge":"UserAuthentication",
+    "admin_create_user":"UserCreation",
+    "admin_get_user":"UserRead",
+    "list_users":"UserList",
+    "admin_update_user_attributes":"UserUpdate", "admin_set_user_password":"UserUpdate",
+    "admin_delete_user":"UserUpdate", "admin_disable_user":"UserUpdate", "admin_enable_user":"UserUpdate",
+    "describe_user_pool":"UserPoolRead", "list_user_pools":"UserPoolRead",
+    "update_user_pool":"UserPoolUpdate",
+    "get_csv_header":"UserPoolResourceRead", "describe_user_import_job":"UserPoolResourceRead",
+    "create_user_import_job":"UserPoolResourceUpdate", "start_user_import_job":"UserPoolResourceUpdate",
+    "stop_user_import_job":"UserPoolResourceUpdate",
+    }
+
+
+class CogThrottle(object):
+    # token bucket per Cognito quota category, adaptive (cut rate on throttle, creep back up on success),
+    # plus jittered exponential backoff retry; one instance is shared by every cog_client call
+    THROTTLE_CODES = ("TooManyRequestsException", "LimitExceededException", "ThrottlingException")
+    RETRY_CODES = THROTTLE_CODES + ("InternalErrorException", "ServiceUnavailable")
+    RETRY_ERRORS = (botocore.exceptions.ClientError, botocore.exceptions.EndpointConnectionError,
+                    botocore.exceptions.ConnectionClosedError, botocore.exceptions.ReadTimeoutError)
+
+    def __init__(self, scale=0.9, maxRetries=6, baseDelay=0.1, maxDelay=10.0):
+        self.scale = scale
+        self.maxRetries = maxRetries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.lock = threading.Lock()
+        self.buckets = {}  # category: {"limit","rate","tokens","last"}
+        self.calls = self.throttles = self.retries = 0
+        self.backoffSecs = self.waitSecs = 0.0
+        self.metrics = None  # optional metrics.Metrics, told about each retry (AcogClient sets it)
+
+    def bucket(self, op):  # call with self.lock held
+        category = COG_QUOTA_CATEGORIES.get(op, "Other")
+        if category not in self.buckets:
+            limit = max(MIN_RATE, COG_QUOTAS[category] * self.scale)
+            self.buckets[category] = {"limit":limit, "rate":limit, "tokens":1.0, "last":time.monotonic()}
+        return self.buckets[category]
+
+    def acquire(self, op):  # block until the op's category has a token
+        while True:
+            with self.lock:
+                b = self.bucket(op)
+                now = time.monotonic()
+                b["tokens"] = min(max(1.0, b["rate"]), b["tokens"] + (now - b["last"]) * b["rate"])  # burst <= 1 sec
+                b["last"] = now
+                if b["tokens"] >= 1.0:
+                    b["tokens"] -= 1.0
+                    self.calls += 1
+                    return
+                wait = (1.0 - b["tokens"]) / b["rate"]
+                self.waitSecs += wait
+            time.sleep(wait)
+
+    def reserve(self, op):  # take op's next token now, on credit if need be: seconds until it is due (acoglib.aio)
+        with self.lock:
+            b = self.bucket(op)
+            now = time.monotonic()
+            b["tokens"] = min(max(1.0, b["rate"]), b["tokens"] + (now - b["last"]) * b["rate"]) - 1.0
+            b["last"] = now
+            self.calls += 1
+            wait = max(0.0, -b["tokens"] / b["rate"])  # one sleep per call, however many callers are queued
+            self.waitSecs += wait
+            return wait
+
+    def refund(self, op):  # give back a reserve()d token that was never used (its caller was cancelled)
+        with self.lock:
+            b = self.bucket(op)
+            b["tokens"] = min(max(1.0, b["rate"]), b["tokens"] + 1.0)
+            self.calls -= 1
+
+    def adjust(self, op, throttled):
+        with self.lock:
+            b = self.bucket(op)
+            if throttled:  # multiplicative decrease...
+                self.throttles += 1
+                b["rate"] = max(MIN_RATE, b["rate"] * 0.7)
+            else:  # ...additive increase, back up to (scaled) quota
+                b["rate"] = min(b["limit"], b["rate"] + b["limit"] / 50)
+
+    def call(self, op, func, **kwargs):
+        if self.metrics:
+            self.metrics.activate()
+        for attempt in range(self.maxRetries + 1):
+            self.acquire(op)
+            try:
+                r = func(**kwargs)
+            except self.RETRY_ERRORS as e:
+                delay = self.retryDelay(op, attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+            else:
+                self.adjust(op, throttled=False)
+                return r
+
+    def retryDelay(self, op, attempt, e):  # after a failed attempt: seconds to back off, or None to give up
+        if isinstance(e, botocore.exceptions.ClientError):
+            code = e.response.get("Error", {}).get("Code")
+            if code not in self.RETRY_CODES or attempt == self.maxRetries:
+                return None
+            self.adjust(op, throttled=code in self.THROTTLE_CODES)
+            logger.info("%s %s; retry %s" % (op, code, attempt + 1))
+        else:
+            if attempt == self.maxRetries:
+                return None
+            logger.info("%s %s; retry %s" % (op, e, attempt + 1))
+        delay = random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** attempt))  # "full jitter"
+        with self.lock:
+            self.retries += 1
+            self.backoffSecs += delay
+        if self.metrics:
+            self.metrics.retry("cognito-idp", op)
+        return delay
+
+    def report(self):
+        return "throttle: %s calls, %s throttled, %s retries, %.1fs backoff, %.1fs rate-limit wait (all threads)" % (
+            self.calls, self.throttles, self.retries, self.backoffSecs, self.waitSecs)
+
+
+class ThrottledClient(object):
+    # boto3 client wrapper: every API method call goes through the shared CogThrottle
+    PASSTHRU = ("exceptions", "meta", "can_paginate", "get_paginator", "get_waiter")
+
+    def __init__(self, client, throttle):
+        self.client = client
+        self.throttle = throttle
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name in self.PASSTHRU or name.startswith('_') or not callable(attr):
+            return attr
+        return lambda **kwargs: self.throttle.call(name, attr, **kwargs)
+
+
+def cogConfig():  # botocore client config for use with ThrottledClient (CogThrottle does the retrying)
+    return botocore.config.Config(retries={"mode":"standard", "total_max_attempts":1})
@@ -0,0 +1,88 @@
+# acoglib.tokencache -- on-disk Cognito token cache for acog.py auth and cognito-auth.py
+# one file per (pool, client, username) under $ACOG_CACHE_DIR/tokens (0600: these are credentials);
+# the IdToken is reused until `margin` seconds before its exp, then renewed with the RefreshToken
+# (REFRESH_TOKEN_AUTH: one call, no SRP math), and only if that fails is a full SRP login done.
+# a per-entry flock makes parallel test processes wait for one login instead of all doing it
+
+import base64
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from .poolcache import defaultCacheDir
+
+logger = logging.getLogger("acog")
+
+
+def tokenExp(token):  # "exp" claim of a JWT (not verified; Cognito checks the token, we just schedule renewal)
+    payload = token.split('.')[1]
+    return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))["exp"]
+
+
+class TokenCache(object):
+    def __init__(self, cacheDir=None, margin=300):
+        self.dir = os.path.join(cacheDir or defaultCacheDir(), "tokens")
+        self.margin = margin
+        self.stats = {"hits":0, "refreshes":0, "logins":0}
+        self.lock = threading.Lock()  # stats only; entries are flock'ed
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def path(self, poolId, clientId, username):
+        key = "%s|%s|%s" % (poolId, clientId, username)
+        return os.path.join(self.dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def idToken(self, poolId, clientId, username, login, client):
+        # login(): full (SRP) auth response, {"AuthenticationResult":{...}}; client: cognito-idp (for refresh),
+        # or a function returning it, called only to refresh (a cache hit then builds no client)
+        path = self.path(poolId, clientId, username)
+        os.makedirs(self.dir, mode=0o700, exist_ok=True)
+        with open(path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # released on close
+            tokens = self._read(path)
+            if tokens and tokenExp(tokens["IdToken"]) - self.margin > time.time():
+                self._count("hits")
+                return tokens["IdToken"]
+            fresh = None
+            if tokens and tokens.get("RefreshToken"):
+                try:
+                    client = client() if callable(client) else client
+                    fresh = client.initiate_auth(ClientId=clientId, AuthFlow="REFRESH_TOKEN_AUTH",
+                                                 AuthParameters={"REFRESH_TOKEN":tokens["RefreshToken"]})
+                    fresh = fresh["AuthenticationResult"]
+                    fresh.setdefault("RefreshToken", tokens["RefreshToken"])  # not re-issued on refresh
+                    self._count("refreshes")
+                except Exception as e:  # e.g. NotAuthorizedException: refresh token expired/revoked
+                    logger.info("token refresh for %s failed (%s); doing full login" % (username, e))
+                    fresh = None
+            if fresh is None:
+                fresh = login()["AuthenticationResult"]
+                self._count("logins")
+            self._write(path, {k:fresh[k] for k in ("IdToken", "AccessToken", "RefreshToken") if k in fresh})
+            return fresh["IdToken"]
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, tokens):
+        tmp = "%s.%s.tmp" % (path, os.getpid())
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(tokens, f)
+        os.replace(tmp, path)
+
+    def clear(self, poolId, clientId, username):  # drop one entry (e.g. after a password change)
+        try:
+            os.remove(self.path(poolId, clientId, username))
+        except FileNotFoundError:
+            pass
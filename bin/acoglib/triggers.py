@@ -0,0 +1,120 @@
+# acoglib.triggers -- --suspend-triggers: pool Lambda triggers off for a whole batch, always put back
+# the pool's LambdaConfig is saved to a marker file *before* it is cleared, and the marker is only removed
+# once it has been restored, so a run killed outright (SIGKILL, lost VM) leaves the way back on disk:
+#   acog.py restore-triggers COG-qa
+
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+from .client import AcogError
+from .poolcache import defaultCacheDir
+
+logger = logging.getLogger("acog")
+
+
+def markerPath(poolId):
+    return os.path.join(defaultCacheDir(), "triggers-%s.json" % poolId)
+
+
+def readMarker(poolId):  # marker dict left by a suspension (running or crashed), or None
+    try:
+        with open(markerPath(poolId)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def markerOwnerAlive(marker):  # True if the suspending process is still running (on this host)
+    if marker.get("host") != socket.gethostname():
+        return True  # can't tell; assume it is
+    try:
+        os.kill(marker["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _writeMarker(path, marker):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "%s.%s.tmp" % (path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(marker, f, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)  # atomic
+
+
+def restoreTriggers(acog, marker=None):  # re-enable triggers from the marker; True if restored (marker removed)
+    marker = marker if marker else readMarker(acog.UserPoolId)
+    if marker is None:
+        return False
+    if not acog.doEnableTriggers(marker["conf"]):
+        print("ERROR: pool %s still has Lambda triggers OFF; retry with: acog.py restore-triggers %s" % (
+              acog.UserPoolId, acog.UserPoolName))
+        return False
+    os.remove(markerPath(acog.UserPoolId))
+    print("triggers restored on %s: %s" % (acog.UserPoolId, sorted(marker["conf"].get("LambdaConfig", {}))))
+    return True
+
+
+class TerminatedError(BaseException):  # raised by the SIGTERM handler so with-blocks unwind (like Ctrl-C)
+    pass
+
+
+class TriggerSuspension(object):
+    '''
+    with TriggerSuspension(acog):   # LambdaConfig={} for the block; restored on exit, exception,
+        doAddUserRows(acog, rows)   # Ctrl-C or SIGTERM (marker file covers anything worse)
+    '''
+
+    def __init__(self, acog):
+        self.acog = acog
+        self.marker = None
+        self.oldHandler = None
+
+    def __enter__(self):
+        acog = self.acog
+        marker = readMarker(acog.UserPoolId)
+        if marker and markerOwnerAlive(marker) and marker.get("pid") != os.getpid():
+            raise AcogError("triggers of %s already suspended by pid %s on %s since %s" % (
+                            acog.UserPoolId, marker["pid"], marker["host"], time.ctime(marker["since"])))
+        if marker:  # left by a crashed run: the pool's live LambdaConfig is the suspended one, keep the saved one
+            print("WARN: pool %s was left with triggers suspended (pid %s, %s); will restore its saved config" % (
+                  acog.UserPoolId, marker["pid"], time.ctime(marker["since"])))
+            conf = marker["conf"]
+        else:
+            conf = acog.triggerConfig()
+        self.marker = {"poolId":acog.UserPoolId, "poolName":acog.UserPoolName, "pid":os.getpid(),
+                       "host":socket.gethostname(), "since":time.time(), "conf":conf}
+        _writeMarker(markerPath(acog.UserPoolId), self.marker)  # before touching the pool
+        if threading.current_thread() is threading.main_thread():
+            self.oldHandler = signal.signal(signal.SIGTERM, self._terminate)
+        if not acog.doDisableTriggers(conf):
+            self.__exit__(None, None, None)
+            raise AcogError("could not suspend triggers of %s" % acog.UserPoolId)
+        print("triggers suspended on %s: %s (marker %s)" % (acog.UserPoolId, sorted(conf.get("LambdaConfig", {})),
+              markerPath(acog.UserPoolId)))
+        return self
+
+    def _terminate(self, signum, frame):
+        raise TerminatedError("signal %s" % signum)
+
+    def __exit__(self, *exc):
+        if self.oldHandler is not None:  # a second Ctrl-C/SIGTERM must not interrupt the restore itself
+            oldInt = signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        try:
+            restoreTriggers(self.acog, self.marker)
+        finally:
+            if self.oldHandler is not None:
+                signal.signal(signal.SIGINT, oldInt)
+                signal.signal(signal.SIGTERM, self.oldHandler)
+                self.oldHandler = None
+        return False
@@ -8,29 +8,41 @@
 
     un="hi@example.com"
     curl -H "Authorization:$(cognito-auth.py ${un})" "https://test-api.example.com/login/${un}"
+
+  tokens are cached (~/.cache/acog/tokens, see acoglib.tokencache) and refreshed shortly before they
+  expire, so test suites can call this per request; --no-cache forces a fresh SRP login
 """
 
 import boto3, sys, warrant.aws_srp  # RCF-2945 Secure Remote Password
 
+from acoglib.tokencache import TokenCache
+
 cognito_pools = { "default":"MY-test",  # Cognito pool names created in AWS console
     "MY-test":{"id":"us-east-1_wPcs69RIO","client_id":"hei57firt232p5oi4dhgclp0cd"},
     "MY-dev":{"id":"us-east-1_v357mag9m","client_id":"99bottle50fb33rh0fahd5rubz"}
     }
 
-def generateIdToken(username,pool=cognito_pools["default"]):
-    tokens = warrant.aws_srp.AWSSRP( username=username, password='sekretPassFromEnv',
+def cognitoClient():  # built only when a login/refresh needs it: a cache hit makes no boto3 session at all
+    return boto3.client('cognito-idp', region_name='us-east-1')
+
+def generateIdToken(username,pool=cognito_pools["default"],cache=True):
+    login = lambda: warrant.aws_srp.AWSSRP( username=username, password='sekretPassFromEnv',
                                     pool_id=cognito_pools[pool]["id"],
                                     client_id=cognito_pools[pool]["client_id"],
-                                    client=boto3.client('cognito-idp', region_name='us-east-1')
+                                    client=cognitoClient()
                                 ).authenticate_user()
-    return tokens['AuthenticationResult']['IdToken']
+    if not cache:
+        return login()['AuthenticationResult']['IdToken']
+    return TokenCache().idToken(cognito_pools[pool]["id"], cognito_pools[pool]["client_id"], username,
+                                login, cognitoClient)
 
 
 if __name__ == '__main__':
-    username = sys.argv[1] if len(sys.argv)>1 else "my.test@example.com"
+    argv = [arg for arg in sys.argv if not arg.startswith('-')]  # positional args (flags: -q, --no-cache)
+    username = argv[1] if len(argv)>1 else "my.test@example.com"
     username += '' if '@' in username else "@example.com"
-    cognito_pool = sys.argv[2] if len(sys.argv)>2 else cognito_pools["default"]
-    id_token = generateIdToken(username,cognito_pool)
+    cognito_pool = argv[2] if len(argv)>2 else cognito_pools["default"]
+    id_token = generateIdToken(username,cognito_pool,cache="--no-cache" not in sys.argv)
     if "-q" not in sys.argv:
         print("--header Authorization:{id_token}  # for %s in AWS Cognito pool %s (%s bytes)" % (
             username, cognito_pool, len(id_token))
@@ -0,0 +1,26 @@
+# tests for acoglib, run offline against acog_standin (FakeCognito + the Metadata HTTP stand-in):
+#   cd bin && python -m pytest -q tests
+
+import os
+import sys
+
+import pytest
+
+BIN = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BIN)
+
+import acog_standin  # noqa: E402 (needs BIN on sys.path)
+
+
+@pytest.fixture
+def cacheDir(tmp_path, monkeypatch):  # $ACOG_CACHE_DIR of the test: pool/token/booking caches, never ~/.cache
+    path = tmp_path / "cache"
+    monkeypatch.setenv("ACOG_CACHE_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def metadataUrl():  # base URL of a running Metadata stand-in
+    server = acog_standin.serve(port=0)
+    yield "http://127.0.0.1:%s" % server.server_address[1]
+    server.shutdown()
@@ -0,0 +1,25 @@
+# AsyncCognito.call: a call cancelled (--userTimeout) while it waits for its throttle token gives the token back
+
+import asyncio
+
+import pytest
+
+from acoglib.aio import AsyncCognito
+from acoglib.throttle import CogThrottle
+
+
+class AsyncStandin(object):
+    async def list_users(self, **kwargs):
+        return {"Users":[]}
+
+
+def testCancelledWaitRefundsToken():
+    throttle = CogThrottle(scale=0.01)  # UserList at MIN_RATE: 1 call/sec
+    cog = AsyncCognito(AsyncStandin(), throttle)
+
+    async def run():
+        await cog.call("list_users")  # the bucket's one token
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(cog.call("list_users"), 0.05)  # waits ~1s for the next: cancelled
+    asyncio.run(run())
+    assert throttle.buckets["UserList"]["tokens"] > -0.5 and throttle.calls == 1
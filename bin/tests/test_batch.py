@@ -0,0 +1,37 @@
+# acoglib.batch: the bounded-window runner behind add-attribs, purge, clone and mint-tokens
+
+import threading
+import time
+
+import pytest
+
+from acoglib.batch import runBounded
+
+
+def testRunBoundedFinishesEveryItem():
+    finished = {}
+    runBounded(lambda n: n * n, ((n, (n,)) for n in range(100)), lambda key, future: finished.update(
+               {key:future.result()}), workers=4)
+    assert finished == {n:n * n for n in range(100)}
+
+
+def testRunBoundedInterruptCancelsQueued():
+    # Ctrl-C while reading input: queued calls never start, in-flight ones drain before runBounded returns
+    started, lock = [], threading.Lock()
+
+    def call(n):
+        with lock:
+            started.append(n)
+        time.sleep(0.05)
+
+    def items():
+        for n in range(1000):
+            if n == 30:
+                raise KeyboardInterrupt
+            yield n, (n,)
+
+    with pytest.raises(KeyboardInterrupt):
+        runBounded(call, items(), lambda key, future: None, workers=2)
+    count = len(started)
+    time.sleep(0.2)
+    assert len(started) == count < 30
@@ -0,0 +1,28 @@
+# acog serve: a forwarded run only happens when the client's environment (credentials, profile, cache dir) is
+# the daemon's; otherwise acogc.forward hands back None and the command runs in the caller
+
+import os
+import tempfile
+import threading
+
+import acogc
+from acoglib.daemon import serve
+
+
+def testEnvironmentMismatchRunsLocally(monkeypatch):
+    monkeypatch.setenv("AWS_PROFILE", "qa")
+    monkeypatch.delenv("AWS_SESSION_TOKEN", raising=False)
+    path = os.path.join(tempfile.mkdtemp(prefix="acog-"), "acog.sock")  # (short: AF_UNIX path limit)
+    runs = []
+    ready = threading.Event()
+    threading.Thread(target=serve, args=(path, lambda request: runs.append(request["argv"]) or 0),
+                     kwargs={"ready":ready.set}, daemon=True).start()
+    assert ready.wait(10)
+
+    assert acogc.forward(["list-pools"], path) == 0  # same environment: ran in the daemon
+    monkeypatch.setenv("AWS_PROFILE", "prod")
+    assert acogc.forward(["list-pools", "prod"], path) is None
+    monkeypatch.setenv("AWS_PROFILE", "qa")
+    monkeypatch.setenv("AWS_SESSION_TOKEN", "fresh")  # (the daemon has none)
+    assert acogc.forward(["list-pools", "token"], path) is None
+    assert runs == [["list-pools"]]
@@ -0,0 +1,25 @@
+# list-users --pools/--regions: pools are matched per region, the --region pool need not exist
+
+import acog
+import acoglib.fanout
+from acog_standin import FakeCognito
+
+
+def testPoolOnlyInAnotherRegion(cacheDir, monkeypatch, capsys):
+    fakes = {"us-east-1":FakeCognito(pools={"COG-qa":"us-east-1_TESTQA001"}),
+             "us-west-2":FakeCognito(pools={"COG-west":"us-west-2_TESTWE001"})}
+    fakes["us-west-2"].admin_create_user(UserPoolId="us-west-2_TESTWE001", Username="5399050@test.com",
+                                         UserAttributes=[{"Name":"email", "Value":"5399050@test.com"}])
+    AcogClient = acog.AcogClient
+
+    def standinClient(**kwargs):  # each region's AcogClients on that region's FakeCognito
+        kwargs["client"] = kwargs.get("client") or fakes[kwargs["region"]]
+        return AcogClient(**kwargs)
+    monkeypatch.setattr(acog, "AcogClient", standinClient)
+    monkeypatch.setattr(acoglib.fanout, "AcogClient", standinClient)
+
+    assert acog.main(["list-users", "COG-west", "--regions", "us-east-1,us-west-2", "--filter", "",
+                      "--format", "ndjson", "--noTokenCache", "--no-metadata-cache"]) == 0
+    out = capsys.readouterr()
+    assert '"email": "5399050@test.com"' in out.out and '"region": "us-west-2"' in out.out
+    assert "list-users: 1 pools in us-east-1,us-west-2: us-west-2/COG-west" in out.err
@@ -0,0 +1,100 @@
+# --journal/--resume: a finished row is skipped on the next run, however Metadata changed it
+
+import asyncio
+import io
+
+import requests
+
+from acog_standin import AsyncFakeCognito, FakeCognito
+from acoglib import AcogClient
+from acoglib.aio import doAddUserRowsAsync
+from acoglib.batch import doAddUserRows, readUserRows
+from acoglib.journal import RowJournal, completedKeys, rowKey, skipCompleted
+from acoglib.metadata import prefetchBookings
+
+
+def addUsers(acog, path, journalPath, metadataUrl=None):  # acog.py add-user --file --resume [--prefetchMetadata]
+    rows = readUserRows(str(path), "first", "last", echo=False)
+    stats = {}
+    rows = skipCompleted(rows, completedKeys(str(journalPath)), stats)
+    if metadataUrl:
+        rows = prefetchBookings(acog.metadata, rows, workers=2, defaultFirstName="first")
+    with RowJournal(str(journalPath)) as journal:
+        result = doAddUserRows(acog, rows, workers=2, journal=journal, fast=True)
+    return result, stats.get("skipped", 0)
+
+
+def newClient(fake, metadataUrl):
+    return AcogClient(poolName="COG-bench", clientID="test-client", client=fake, tokenCache=False,
+                      metadataUrl=metadataUrl, metadataCache=False)
+
+
+def testResumeAfterPrefetchNames(cacheDir, metadataUrl, tmp_path):
+    # no name columns: prefetchBookings replaces the default names with the booking's pax names
+    path = tmp_path / "bookings.csv"
+    path.write_text("INVOICE,DEPART\n" + ''.join("%s,2030-01-0%s\n" % (5399020 + i, i + 1) for i in range(5)))
+    journalPath = tmp_path / "bookings.journal"
+    fake = FakeCognito()
+
+    first, skipped = addUsers(newClient(fake, metadataUrl), path, journalPath, metadataUrl)
+    assert (first["ok"], skipped) == (5, 0)
+    assert len(fake.users) == 5
+
+    again, skipped = addUsers(newClient(fake, metadataUrl), path, journalPath, metadataUrl)
+    assert (again["rows"], skipped) == (0, 5)
+
+
+def testRowKeyFrozenWhenRead(tmp_path):
+    path = tmp_path / "bookings.csv"
+    path.write_text("INVOICE,LNAME,FNAME\n5399020,Smith,Ann\n")
+    row = next(readUserRows(str(path), "first", "last", echo=False))
+    key = rowKey(row)
+    row["fName"], row["lName"] = "First1", "Last5399020"  # as applyBooking does
+    assert rowKey(row) == key == "5399020\t5399020@test.com\tAnn\tSmith"
+
+
+class StandinHttp(object):  # aiohttp-style session (doAddUserRowsAsync http=) over requests, for the stand-in
+    def get(self, url):
+        return StandinResponse(url)
+
+
+class StandinResponse(object):
+    def __init__(self, url):
+        self.url = url
+
+    async def __aenter__(self):
+        self.response = await asyncio.to_thread(requests.get, self.url, timeout=9)
+        self.status = self.response.status_code
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        self.response.raise_for_status()
+
+    async def json(self, content_type=None):
+        return self.response.json()
+
+
+def testAsyncResumeAfterBookingNames(cacheDir, metadataUrl, tmp_path):
+    # --async: AsyncUserFlow.run fills the names in from the booking, the journal keeps the row as read
+    path = tmp_path / "bookings.csv"
+    path.write_text("INVOICE,DEPART\n" + ''.join("%s,2030-01-0%s\n" % (5399030 + i, i + 1) for i in range(5)))
+    journalPath = tmp_path / "bookings.journal"
+    afake = AsyncFakeCognito()
+
+    def run():
+        rows = readUserRows(str(path), "first", "last", echo=False)
+        stats = {}
+        rows = skipCompleted(rows, completedKeys(str(journalPath)), stats)
+        with RowJournal(str(journalPath)) as journal:
+            result = doAddUserRowsAsync(newClient(afake.fake, metadataUrl), rows, concurrency=4, journal=journal,
+                                        fast=True, metadata=True, defaultFirstName="first", client=afake,
+                                        http=StandinHttp(), out=io.StringIO())
+        return result, stats.get("skipped", 0)
+
+    first, skipped = run()
+    assert (first["ok"], skipped) == (5, 0)
+    again, skipped = run()
+    assert (again["rows"], skipped) == (0, 5)
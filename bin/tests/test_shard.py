@@ -0,0 +1,81 @@
+# add-user --file --shards N (acoglib.shard): the file split across N acog.py processes
+
+import contextlib
+import io
+import os
+import signal
+import subprocess
+import sys
+
+from conftest import BIN
+from acoglib.batch import readUserRows
+from acoglib.shard import byteRanges, shardOf
+
+
+def writeBookings(path, rows, start=5400000):
+    path.write_text("INVOICE,LNAME,FNAME\n" + ''.join("%s,Last,First\n" % (start + i) for i in range(rows)))
+    return path
+
+
+def testByteRangeRowNumbers(tmp_path):  # each shard's rows keep their row numbers in the whole file
+    path = writeBookings(tmp_path / "bookings.csv", 1000)
+    rows = []
+    with contextlib.redirect_stderr(io.StringIO()):
+        for byteRange in byteRanges(str(path), 7):
+            rows.extend(readUserRows(str(path), "first", "last", echo=False, byteRange=byteRange))
+    assert [row["rowNum"] for row in rows] == list(range(1, 1001))
+    assert [int(row["un"]) - 5400000 + 1 for row in rows] == list(range(1, 1001))
+
+
+def testHashShardRows(tmp_path):  # every row in exactly one shard, with its row number; quoted lines too
+    path = writeBookings(tmp_path / "bookings.csv", 1000)
+    with open(path, "a") as f:
+        f.write('5401000,"Last, Jr",First\n')
+    shards = []
+    with contextlib.redirect_stderr(io.StringIO()):
+        for shard in range(7):
+            shards.append(list(readUserRows(str(path), "first", "last", echo=False, shard=(shard, 7))))
+    rows = sorted((row for rows in shards for row in rows), key=lambda row: row["rowNum"])
+    assert [row["rowNum"] for row in rows] == list(range(1, 1002))
+    assert [int(row["un"]) - 5400000 + 1 for row in rows] == list(range(1, 1002))
+    assert rows[-1]["lName"] == "Last, Jr" and all(rows for rows in shards)
+    assert [shardOf(row["un"], 7) for row in shards[3]] == [3] * len(shards[3])
+
+
+STANDIN_ACOG = """
+import atexit, json, sys
+sys.path.insert(0, %r)
+import acog, acog_standin
+fake = acog_standin.FakeCognito(pools={"COG-qa":"us-east-1_TESTQA001"})
+atexit.register(lambda: print("standin calls: %%s" %% json.dumps(fake.calls), file=sys.stderr))
+AcogClient = acog.AcogClient
+acog.AcogClient = lambda **kwargs: AcogClient(client=fake, **kwargs)
+acog.__file__ = __file__  # the shard processes run this script too
+sys.exit(acog.main())
+"""  # acog.py on a FakeCognito per process (each shard creates its own users), its call counts printed at exit
+
+
+def testManyShards(cacheDir, tmp_path):
+    # --shards 16 at --quotaScale 0.5 is capped at 12 (UserUpdate, 25/s x 0.5 / 12 >= 1 call/sec per shard); the
+    # parent lists the pools (--refresh-cache), the shards use its list: none of them calls UserPoolRead
+    script = tmp_path / "acog_standin_cli.py"
+    script.write_text(STANDIN_ACOG % BIN)
+    path = writeBookings(tmp_path / "bookings.csv", 160)
+    proc = subprocess.Popen([sys.executable, str(script), "add-user", "COG-qa", "--file", str(path), "--fast",
+                             "--noVerify", "--shards", "16", "--quotaScale", "0.5", "--shard-by", "hash",
+                             "--refresh-cache"],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True)
+    try:
+        out, err = proc.communicate(timeout=120)
+    finally:
+        if proc.poll() is None:  # hung: the shards too (one process group)
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+    assert proc.returncode == 0, err[-2000:]
+    assert "WARN: --shards 16 capped at 12" in err
+    assert "rows: 160 ok, 0 errors, 0 fatal" in err
+    assert all(os.path.exists("%s.shard%s.log" % (path, i)) for i in range(12))
+    assert not os.path.exists("%s.shard12.log" % path)
+    calls = [line for line in err.splitlines() if "standin calls:" in line]
+    assert len(calls) == 13 and "list_user_pools" in calls[-1]  # (the parent's, printed last)
+    assert not any("list_user_pools" in line or "describe_user_pool" in line for line in calls[:-1])
@@ -0,0 +1,51 @@
+# acog.py sync: a re-run over an unchanged file plans no updates
+
+import contextlib
+import datetime
+import io
+import json
+
+from acog_standin import FakeCognito, fakeBooking
+from acoglib import AcogClient
+from acoglib.batch import readUserRows
+from acoglib.metadata import prefetchBookings
+from acoglib.sync import CREATE, NOOP, UPDATE, loadPoolState, planCounts, planSync, runSync
+
+
+def writeBookings(path, bookingIds, shift=0):  # with each booking's own dates (as Metadata has them)
+    lines = ["INVOICE,LNAME,FNAME,EMBARK,DEPART\n"]
+    for bookingId in bookingIds:
+        booking = fakeBooking(str(bookingId))[0]
+        embark = datetime.date.fromisoformat(booking["EmbarkDate"][:10]) + datetime.timedelta(days=shift)
+        lines.append("%s,Last,First,%s,%s\n" % (bookingId, embark, booking["GuestDepartureDate"][:10]))
+    path.write_text(''.join(lines))
+    return path
+
+
+def sync(acog, path, prefetch=False):  # acog.py sync --file [--prefetchMetadata]: (plan counts, runSync stats)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        rows = readUserRows(str(path), "first", "last", echo=False)
+        if prefetch:
+            rows = prefetchBookings(acog.metadata, rows, workers=2, defaultFirstName="first")
+        plan = planSync(acog, rows, loadPoolState(acog))
+        return planCounts(plan), runSync(acog, plan, workers=2, fast=True)
+
+
+def testResyncUnchangedFile(cacheDir, metadataUrl, tmp_path):
+    # created with the booking's real tourName (--prefetchMetadata); a plain re-sync must not touch them
+    acog = AcogClient(poolName="COG-bench", clientID="test-client", client=FakeCognito(), tokenCache=False,
+                      metadataUrl=metadataUrl, metadataCache=False)
+    path = writeBookings(tmp_path / "bookings.csv", range(5399040, 5399045))
+
+    counts, stats = sync(acog, path, prefetch=True)
+    assert counts[CREATE] == 5 and stats[CREATE]["ok"] == 5
+    assert sync(acog, path)[0] == {CREATE:0, UPDATE:0, NOOP:5}
+    assert sync(acog, path, prefetch=True)[0] == {CREATE:0, UPDATE:0, NOOP:5}
+
+    writeBookings(path, range(5399040, 5399045), shift=1)  # embark dates moved: updated, tourName kept
+    counts, stats = sync(acog, path)
+    assert counts[UPDATE] == 5 and stats[UPDATE]["ok"] == 5
+    tourNames = {entry["tourName"] for user in loadPoolState(acog).values()
+                 for attr in user["Attributes"] if attr["Name"] == "custom:booking"
+                 for entry in json.loads(attr["Value"])}
+    assert tourNames == {fakeBooking(str(n))[0]["TourName"] for n in range(5399040, 5399045)}